@@ -0,0 +1,40 @@
+"""Compares the peak RSS of decoding one file with ``whisper.load_audio`` and with the block-wise decoders.
+
+Every decoder runs in a fresh interpreter, so the numbers do not influence each other.
+
+    python scripts/benchmark_audio_memory.py path/to/long_audio.mp3
+"""
+import argparse
+import subprocess
+import sys
+
+DECODERS = {
+    "whisper.load_audio": ("import whisper", "whisper.load_audio(path)"),
+    "load_audio": ("from whisperer.models.audio import load_audio", "load_audio(path)"),
+    "iter_audio_windows": ("from whisperer.models.audio import iter_audio_windows",
+                           "for _ in iter_audio_windows(path): pass"),
+}
+
+MEASURE = """
+import resource, sys
+path = sys.argv[1]
+{imports}
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+{decode}
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(before, after)
+"""
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("audio")
+    args = parser.parse_args()
+
+    print(f"{'decoder':>20} {'peak RSS (MiB)':>15} {'growth while decoding (MiB)':>28}")
+    for name, (imports, decode) in DECODERS.items():
+        script = MEASURE.format(imports=imports, decode=decode)
+        output = subprocess.run([sys.executable, "-c", script, args.audio], capture_output=True, text=True,
+                                check=True).stdout
+        # ru_maxrss is reported in KiB on Linux
+        before, after = map(int, output.split())
+        print(f"{name:>20} {after / 1024:>15.1f} {(after - before) / 1024:>28.1f}")
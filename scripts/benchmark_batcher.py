@@ -0,0 +1,122 @@
+"""Compares the former batching loop of the LoadBalancer with the deadline-based batcher, against simulated workers.
+
+* ``former``: wakes every 100 ms and flushes a queue once ``batch_timeout_secs`` have passed since its previous flush.
+* ``deadline``: flushes a queue when it is full or its oldest request reaches ``batch_timeout_secs``.
+* ``deadline+idle``: the same, and flushes right away while workers are idle, which is what the LoadBalancer does.
+
+Requests arrive as a Poisson process, spread over a few batch queues, for ``--secs`` seconds of real time. A worker
+takes ``--batch-secs`` plus ``--item-secs`` per request of a batch, batches wait at the workers when all are busy.
+
+    python scripts/benchmark_batcher.py --rate 5 --queues 2 --batch-size 8 --timeout-secs 2 --workers 2 --secs 30
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from whisperer.utility.batcher import Batcher
+
+
+class Workers:
+
+    def __init__(self, args):
+        self.args = args
+        self.slots = asyncio.Semaphore(args.workers)
+        self.inflight = 0
+        self.waits, self.latencies, self.sizes = [], [], []
+
+    async def process(self, arrivals: list, on_done=None):
+        now = time.monotonic()
+        self.waits.extend(now - arrival for arrival in arrivals)
+        self.sizes.append(len(arrivals))
+        self.inflight += 1
+        async with self.slots:
+            await asyncio.sleep(self.args.batch_secs + self.args.item_secs * len(arrivals))
+        self.inflight -= 1
+        now = time.monotonic()
+        self.latencies.extend(now - arrival for arrival in arrivals)
+        if on_done is not None:
+            on_done()
+
+
+async def former_consumer(queues: dict, workers: Workers, args):
+    last_batch_sent = defaultdict(float)
+    while True:
+        await asyncio.sleep(0.1)
+        for key in list(queues):
+            has_sent = False
+            batch = queues[key][:args.batch_size]
+            while batch and (len(batch) >= args.batch_size
+                             or time.monotonic() - last_batch_sent[key] > args.timeout_secs):  # noqa: W503
+                has_sent = True
+                asyncio.create_task(workers.process(batch))
+                queues[key] = queues[key][args.batch_size:]
+                batch = queues[key][:args.batch_size]
+            if has_sent:
+                last_batch_sent[key] = time.monotonic()
+
+
+async def deadline_consumer(batcher: Batcher, workers: Workers, idle_dispatch: bool):
+
+    def on_done():
+        if idle_dispatch:
+            batcher.free_slots = workers.args.workers - workers.inflight
+            batcher.wake()
+
+    on_done()
+    while True:
+        for _, arrivals, _ in await batcher.next_batches():
+            asyncio.create_task(workers.process(arrivals, on_done))
+
+
+async def run(name: str, args) -> Workers:
+    rng = random.Random(0)
+    workers = Workers(args)
+    if name == "former":
+        queues = defaultdict(list)
+        consumer = asyncio.create_task(former_consumer(queues, workers, args))
+
+        def put(key):
+            queues[key].append(time.monotonic())
+    else:
+        batcher = Batcher()
+        consumer = asyncio.create_task(deadline_consumer(batcher, workers, idle_dispatch=name == "deadline+idle"))
+
+        def put(key):
+            batcher.put(key, time.monotonic(), args.batch_size, args.timeout_secs)
+
+    end = time.monotonic() + args.secs
+    while time.monotonic() < end:
+        await asyncio.sleep(rng.expovariate(args.rate))
+        put(rng.randrange(args.queues))
+    # the last requests leave their queues, then the workers
+    await asyncio.sleep(args.timeout_secs + 0.3)
+    while workers.inflight:
+        await asyncio.sleep(0.1)
+    consumer.cancel()
+    return workers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=5, help="requests per second")
+    parser.add_argument("--queues", type=int, default=2, help="batch queues, e.g. tiers and models")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--timeout-secs", type=float, default=2)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-secs", type=float, default=0.5)
+    parser.add_argument("--item-secs", type=float, default=0.1)
+    parser.add_argument("--secs", type=float, default=30)
+    args = parser.parse_args()
+
+    print(f"{'batcher':>13} {'batches':>8} {'mean size':>9} {'wait p50':>9} {'wait p99':>9}"
+          f" {'latency p50':>12} {'latency p99':>12}")
+    for name in ("former", "deadline", "deadline+idle"):
+        workers = asyncio.run(run(name, args))
+        wait50, wait99 = np.percentile(workers.waits, [50, 99])
+        latency50, latency99 = np.percentile(workers.latencies, [50, 99])
+        print(f"{name:>13} {len(workers.sizes):>8} {np.mean(workers.sizes):>9.1f} {wait50:>9.2f} {wait99:>9.2f}"
+              f" {latency50:>12.2f} {latency99:>12.2f}")
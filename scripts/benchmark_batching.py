@@ -0,0 +1,47 @@
+"""Measures the throughput of the batched WhisperModel path in audio-seconds per wall-second for a range of batch
+sizes.
+
+    python scripts/benchmark_batching.py path/to/audio.mp3 --batch-sizes 1 2 4 8
+"""
+import argparse
+import time
+
+import torch
+import whisper
+from whisper.audio import SAMPLE_RATE
+
+from whisperer.models import WhisperModel
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("audio", help="audio file used for every clip in the batch")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    model = WhisperModel(args.model)
+    audio = whisper.load_audio(args.audio)
+    clip_seconds = len(audio) / SAMPLE_RATE
+
+    # warm-up, so that cuDNN autotuning and allocator growth are not part of the first measurement
+    model.transcribe([audio])
+
+    baseline = None
+    print(f"{'batch':>5} {'wall (s)':>9} {'audio-s/s':>10} {'speed-up':>9}")
+    for batch_size in args.batch_sizes:
+        audios = [audio] * batch_size
+        timings = []
+        for _ in range(args.repeats):
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            t0 = time.perf_counter()
+            model.transcribe(audios)
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            timings.append(time.perf_counter() - t0)
+
+        wall = min(timings)
+        throughput = batch_size * clip_seconds / wall
+        baseline = baseline or throughput
+        print(f"{batch_size:>5} {wall:>9.2f} {throughput:>10.1f} {throughput / baseline:>8.2f}x")
@@ -0,0 +1,146 @@
+"""Compares batches formed in arrival order with batches of similar audio length under an audio budget, on a
+mixed-length workload in simulated time.
+
+A batch is answered once its longest clip is transcribed: the worker decodes ``ceil(longest / 30)`` windows in
+lockstep, and a step over a batch of ``n`` clips takes ``--step-secs * (1 + --step-growth * (n - 1))``. Clips are
+short (5 to 60 seconds) with probability ``--short-share``, else 2 to 10 minutes, or 20 to 60 minutes for
+``--long-share`` of them. Requests arrive as a Poisson process and wait in the LoadBalancer's batcher, which flushes
+full and due batches and sends what it has while workers are idle, like the LoadBalancer does.
+
+    python scripts/benchmark_duration_batching.py --rate 2 --workers 4 --requests 20000
+
+``useful audio/s`` is the audio transcribed per second a worker slot is busy, padding included it would be higher.
+"""
+import argparse
+import heapq
+import itertools
+import math
+import random
+from collections import deque
+
+import numpy as np
+
+from whisperer.utility.batcher import Batcher
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def clip_secs(rng: random.Random, args) -> float:
+    draw = rng.random()
+    if draw < args.short_share:
+        return rng.uniform(5, 60)
+    if draw < 1 - args.long_share:
+        return rng.uniform(120, 600)
+    return rng.uniform(1200, 3600)
+
+
+def batch_secs(clips: list, args) -> float:
+    windows = math.ceil(max(clips) / 30)
+    return args.overhead_secs + windows * args.step_secs * (1 + args.step_growth * (len(clips) - 1))
+
+
+class Simulation:
+    """One run of the workload through a batcher and ``--workers`` worker slots."""
+
+    def __init__(self, length_spread, max_batch_audio_secs, args):
+        self.args = args
+        self.max_batch_audio_secs = max_batch_audio_secs
+        self.clock = Clock()
+        self.batcher = Batcher(length_spread=length_spread, clock=self.clock)
+        self.events, self.sequence = [], itertools.count()
+        self.free, self.inflight, self.waiting = args.workers, 0, deque()
+        self.busy_secs, self.audio_secs = 0.0, 0.0
+        self.latencies, self.short_latencies = [], []
+        self.next_tick = None
+
+    def push(self, at: float, kind: str, payload):
+        heapq.heappush(self.events, (at, next(self.sequence), kind, payload))
+
+    def arrive(self, clip: float):
+        self.batcher.put("high", (clip, self.clock.now), self.args.batch_size, self.args.timeout_secs,
+                         audio_secs=clip, max_batch_audio_secs=self.max_batch_audio_secs)
+
+    def start(self, batch):
+        self.free -= 1
+        secs = batch_secs([clip for clip, _ in batch], self.args)
+        self.busy_secs += secs
+        self.push(self.clock.now + secs, "done", batch)
+
+    def finish(self, batch):
+        self.free += 1
+        self.inflight -= 1
+        for clip, arrived_at in batch:
+            self.audio_secs += clip
+            self.latencies.append(self.clock.now - arrived_at)
+            if clip <= 60:
+                self.short_latencies.append(self.clock.now - arrived_at)
+        if self.waiting:
+            self.start(self.waiting.popleft())
+
+    def dispatch(self):
+        """Send the batches the batcher flushes now, like the LoadBalancer's consumer, and wake up at its next
+        deadline."""
+        self.batcher.free_slots = self.args.workers - self.inflight
+        batches, next_deadline = self.batcher._flush(self.clock.now)
+        for _, batch, _ in batches:
+            self.inflight += 1
+            if self.free:
+                self.start(batch)
+            else:
+                self.waiting.append(batch)
+        if next_deadline is not None and next_deadline != self.next_tick:
+            self.next_tick = next_deadline
+            self.push(next_deadline, "tick", None)
+
+    def run(self) -> dict:
+        rng = random.Random(self.args.seed)
+        arrival = 0.0
+        for _ in range(self.args.requests):
+            arrival += rng.expovariate(self.args.rate)
+            self.push(arrival, "arrival", clip_secs(rng, self.args))
+
+        while self.events:
+            self.clock.now, _, kind, payload = heapq.heappop(self.events)
+            if kind == "arrival":
+                self.arrive(payload)
+            elif kind == "done":
+                self.finish(payload)
+            self.dispatch()
+
+        return {
+            "useful": self.audio_secs / self.busy_secs,
+            "p50": np.percentile(self.latencies, 50),
+            "p95": np.percentile(self.latencies, 95),
+            "short p50": np.percentile(self.short_latencies, 50),
+            "short p95": np.percentile(self.short_latencies, 95),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=2, help="requests per second")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4, help="batches transcribed at once over all workers")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--timeout-secs", type=float, default=2)
+    parser.add_argument("--short-share", type=float, default=0.7)
+    parser.add_argument("--long-share", type=float, default=0.03)
+    parser.add_argument("--overhead-secs", type=float, default=0.5)
+    parser.add_argument("--step-secs", type=float, default=0.15, help="one 30-second window of one clip")
+    parser.add_argument("--step-growth", type=float, default=0.15, help="cost of every further clip in a step")
+    parser.add_argument("--length-spread", type=float, default=2)
+    parser.add_argument("--max-batch-audio-secs", type=float, default=7200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'batches':>18} {'useful audio/s':>14} {'p50 (s)':>8} {'p95 (s)':>8} {'short p50':>10} {'short p95':>10}")
+    for name, length_spread, budget in (("arrival order", None, None),
+                                        ("similar lengths", args.length_spread, args.max_batch_audio_secs)):
+        stats = Simulation(length_spread, budget, args).run()
+        print(f"{name:>18} {stats['useful']:>14.0f} {stats['p50']:>8.1f} {stats['p95']:>8.1f}"
+              f" {stats['short p50']:>10.1f} {stats['short p95']:>10.1f}")
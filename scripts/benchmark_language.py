@@ -0,0 +1,49 @@
+"""Compares the cost of language detection with the cost of a full transcription of the same clips.
+
+    python scripts/benchmark_language.py path/to/audio.mp3 --batch-size 8
+"""
+import argparse
+import time
+
+import torch
+
+from whisperer.models import WhisperModel
+from whisperer.models.audio import N_SAMPLES, SAMPLE_RATE, load_audio
+
+
+def timed(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        t0 = time.perf_counter()
+        fn()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        timings.append(time.perf_counter() - t0)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("audio", help="audio file used for every clip in the batch")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    model = WhisperModel(args.model)
+    model.warmup()
+    audios = [load_audio(args.audio)] * args.batch_size
+    # detection only ever downloads and decodes the first window
+    heads = [audio[:N_SAMPLES] for audio in audios]
+
+    print(model.detect_language(heads)[0])
+    detect = timed(lambda: model.detect_language(heads), args.repeats)
+    transcribe = timed(lambda: model.transcribe(audios), args.repeats)
+
+    print(f"{args.batch_size} clips of {len(audios[0]) / SAMPLE_RATE:.0f} s")
+    print(f"{'task':>16} {'wall (s)':>9} {'clips/s':>8}")
+    print(f"{'detect language':>16} {detect:>9.3f} {args.batch_size / detect:>8.1f}")
+    print(f"{'transcribe':>16} {transcribe:>9.3f} {args.batch_size / transcribe:>8.1f}")
+    print(f"language detection is {transcribe / detect:.1f}x cheaper")
@@ -0,0 +1,75 @@
+"""Simulates slow downloads to compare the sequential fetch-then-transcribe loop with the AudioPrefetcher pipeline.
+
+All batches arrive at once. Reports model utilisation (time the model spends computing / wall time) and the mean
+latency from arrival to the result of a batch.
+
+    python scripts/benchmark_prefetch.py --download-secs 1.5 --compute-secs 1.0 --batches 8
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from whisperer.models import AudioPrefetcher
+
+
+def fake_download(download_secs):
+    def load(sample):
+        time.sleep(download_secs)
+        return np.zeros(16000, dtype=np.float32)
+
+    return load
+
+
+def run_sequential(args, load):
+    busy, latencies = 0.0, []
+    t0 = time.perf_counter()
+    for _ in range(args.batches):
+        [load(sample) for sample in range(args.batch_size)]
+        start = time.perf_counter()
+        time.sleep(args.compute_secs)
+        busy += time.perf_counter() - start
+        latencies.append(time.perf_counter() - t0)
+    return busy, time.perf_counter() - t0, latencies
+
+
+def run_pipelined(args, load):
+    prefetcher = AudioPrefetcher(load, num_workers=args.workers, queue_depth=args.depth)
+    model_pool = ThreadPoolExecutor(max_workers=1)
+    busy = []
+
+    def predict(futures):
+        prefetcher.collect(futures)
+        start = time.perf_counter()
+        time.sleep(args.compute_secs)
+        busy.append(time.perf_counter() - start)
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    results = []
+    for _ in range(args.batches):
+        futures = prefetcher.submit(list(range(args.batch_size)))
+        results.append(model_pool.submit(predict, futures))
+    latencies = [result.result() for result in results]
+    wall = time.perf_counter() - t0
+    prefetcher.shutdown()
+    model_pool.shutdown()
+    return sum(busy), wall, latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--download-secs", type=float, default=1.5)
+    parser.add_argument("--compute-secs", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=2)
+    args = parser.parse_args()
+
+    load = fake_download(args.download_secs)
+    for name, runner in (("sequential", run_sequential), ("prefetch", run_pipelined)):
+        busy, wall, latencies = runner(args, load)
+        print(f"{name:>10}: wall {wall:6.2f}s  model utilisation {busy / wall:6.1%}  "
+              f"mean batch latency {sum(latencies) / len(latencies):6.2f}s")
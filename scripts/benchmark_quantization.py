@@ -0,0 +1,85 @@
+"""Compares the CPU int8 mode of WhisperModel with fp32 in real-time factor (wall-seconds per audio-second, lower is
+faster) and word error rate.
+
+Every audio file is scored against the transcript in a ``.txt`` file next to it, e.g. ``clip.mp3`` and ``clip.txt``.
+Files without one are scored against the fp32 transcript, so the WER column shows what quantisation changes.
+
+    python scripts/benchmark_quantization.py samples/*.mp3 --model base
+"""
+import argparse
+import os
+import re
+import time
+
+# the comparison is about CPU nodes, keep a GPU out of it
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+from whisper.audio import SAMPLE_RATE  # noqa: E402
+
+from whisperer.models import WhisperModel  # noqa: E402
+from whisperer.models.audio import load_audio  # noqa: E402
+
+
+def normalize(text: str) -> list:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    # word level Levenshtein distance, one row at a time
+    distances = np.arange(len(hyp) + 1)
+    for i, ref_word in enumerate(ref, 1):
+        previous, distances[0] = distances.copy(), i
+        for j, hyp_word in enumerate(hyp, 1):
+            distances[j] = min(previous[j] + 1, distances[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+    return distances[-1] / max(len(ref), 1)
+
+
+def run(model: WhisperModel, audios: list, repeats: int):
+    texts, timings = None, []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        texts = [result["text"] for result in model.transcribe(audios)]
+        timings.append(time.perf_counter() - t0)
+    return texts, min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("audio", nargs="+")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    audios = [load_audio(path) for path in args.audio]
+    audio_seconds = sum(len(audio) for audio in audios) / SAMPLE_RATE
+    references = {}
+    for path in args.audio:
+        sidecar = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(sidecar):
+            with open(sidecar) as f:
+                references[path] = f.read()
+
+    results = {}
+    for label, cpu_int8 in (("fp32", False), ("int8", True)):
+        model = WhisperModel(args.model, cpu_int8=cpu_int8)
+        model.warmup()
+        results[label] = run(model, audios, args.repeats)
+        del model
+
+    fp32_texts = results["fp32"][0]
+    print(f"{len(audios)} clips, {audio_seconds:.0f} audio-seconds, {len(references)} with reference transcripts")
+    print(f"{'mode':>5} {'wall (s)':>9} {'RTF':>7} {'speed-up':>9} {'WER':>7}")
+    for label, (texts, wall) in results.items():
+        errors = [
+            word_error_rate(references.get(path, fp32_text), text)
+            for path, text, fp32_text in zip(args.audio, texts, fp32_texts)
+        ]
+        print(f"{label:>5} {wall:>9.2f} {wall / audio_seconds:>7.3f} {results['fp32'][1] / wall:>8.2f}x"
+              f" {100 * np.mean(errors):>6.1f}%")
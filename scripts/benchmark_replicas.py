@@ -0,0 +1,50 @@
+"""Measures the throughput of the CPU replica pool in audio-seconds per wall-second for a range of replica counts.
+
+Throughput should grow close to linearly with the replicas until the node runs out of memory bandwidth.
+
+    python scripts/benchmark_replicas.py path/to/audio.mp3 --replicas 1 2 4 8 --batches 16
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# replicas are about CPU nodes, keep a GPU out of it
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+from whisper.audio import SAMPLE_RATE  # noqa: E402
+
+from whisperer.models import ReplicaPool  # noqa: E402
+from whisperer.models.audio import load_audio  # noqa: E402
+from whisperer.utility.data_io import Data  # noqa: E402
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("audio", help="audio file used for every clip")
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--batches", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=1)
+    args = parser.parse_args()
+
+    audio = load_audio(args.audio)
+    batch = [Data(video_url=args.audio)] * args.batch_size
+    audios = [audio] * args.batch_size
+    audio_seconds = args.batches * args.batch_size * len(audio) / SAMPLE_RATE
+
+    baseline = None
+    print(f"{'replicas':>8} {'cores/replica':>13} {'wall (s)':>9} {'audio-s/s':>10} {'speed-up':>9} {'efficiency':>10}")
+    for num_replicas in args.replicas:
+        pool = ReplicaPool(num_replicas)
+        pool.start()
+        # as many batches in flight as replicas, like the request threads of WhisperServe
+        with ThreadPoolExecutor(max_workers=num_replicas) as submitter:
+            t0 = time.perf_counter()
+            list(submitter.map(lambda _: pool.transcribe(batch, audios), range(args.batches)))
+            wall = time.perf_counter() - t0
+        pool.shutdown()
+
+        throughput = audio_seconds / wall
+        baseline = baseline or throughput / args.replicas[0]
+        speed_up = throughput / baseline
+        print(f"{num_replicas:>8} {len(os.sched_getaffinity(0)) // num_replicas:>13} {wall:>9.2f}"
+              f" {throughput:>10.1f} {speed_up:>8.2f}x {speed_up / num_replicas:>9.0%}")
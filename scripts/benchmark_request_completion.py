@@ -0,0 +1,81 @@
+"""Compares how queued LoadBalancer requests learn that their batch is done: futures resolved by the batch, or the
+former 100 ms polling of a shared result dict. Both run the same burst of concurrent requests, arriving evenly over
+``--arrival-secs``, against a stub worker that answers every batch after ``--worker-secs``.
+
+    python scripts/benchmark_request_completion.py --requests 1000 --arrival-secs 1 --worker-secs 2
+
+``added latency`` is the time from the stub worker answering to the request returning, ``CPU`` the process time of
+the event loop over the whole run, which is mostly spent while the requests wait on the worker.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import numpy as np
+
+from whisperer.components.load_balancer import LoadBalancer
+from whisperer.utility.data_io import Data
+
+
+class PollingLoadBalancer(LoadBalancer):
+    """The request completion of the LoadBalancer before futures, for comparison."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._responses = {}
+
+    def _complete(self, batch, results):
+        for i, (request_id, _, _, _) in enumerate(batch):
+            self._responses[request_id] = results if isinstance(results, Exception) else results[i]
+
+    async def run_batched(self, data: Data, endpoint: str):
+        request_id = uuid.uuid4().hex
+        placeholder = asyncio.get_running_loop().create_future()
+        self._enqueue(data, endpoint, (request_id, data.dict(), placeholder, None))
+        while True:
+            await asyncio.sleep(0.1)
+            if request_id in self._responses:
+                return self._responses.pop(request_id)
+
+
+async def measure(balancer: LoadBalancer, num_requests: int, arrival_secs: float, worker_secs: float):
+    answered_at = {}
+
+    async def stub_send_batch(batch, endpoint="/api/predict"):
+        await asyncio.sleep(worker_secs)
+        results = [{request[1]["video_url"]: {"text": ""}} for request in batch]
+        for request in batch:
+            answered_at[request[1]["video_url"]] = time.perf_counter()
+        balancer._complete(batch, results)
+
+    async def timed_request(i: int) -> float:
+        video_url = f"https://youtu.be/{i}"
+        await asyncio.sleep(i * arrival_secs / num_requests)
+        await balancer.run_batched(Data(video_url=video_url), "/api/predict")
+        return time.perf_counter() - answered_at[video_url]
+
+    balancer.send_batch = stub_send_batch
+    balancer._set_ready_servers(["stub"])
+    consumer = asyncio.create_task(balancer.consumer())
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    added = await asyncio.gather(*(timed_request(i) for i in range(num_requests)))
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    consumer.cancel()
+    return np.array(added), cpu, wall
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--arrival-secs", type=float, default=1.0)
+    parser.add_argument("--worker-secs", type=float, default=2.0)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'completion':>10} {'added p50 (ms)':>15} {'added p99 (ms)':>15} {'CPU (s)':>8} {'wall (s)':>9}")
+    for name, cls in (("polling", PollingLoadBalancer), ("future", LoadBalancer)):
+        balancer = cls(max_batch_size=args.batch_size, batch_timeout_secs=0.1)
+        added, cpu, wall = asyncio.run(measure(balancer, args.requests, args.arrival_secs, args.worker_secs))
+        p50, p99 = 1000 * np.percentile(added, [50, 99])
+        print(f"{name:>10} {p50:>15.1f} {p99:>15.1f} {cpu:>8.2f} {wall:>9.2f}")
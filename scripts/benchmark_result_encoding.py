@@ -0,0 +1,81 @@
+"""Measures the bytes on the wire and the CPU time of encoding and decoding a transcript, for every response profile
+and wire format.
+
+    python scripts/benchmark_result_encoding.py --transcript response.json
+    python scripts/benchmark_result_encoding.py --synthetic-minutes 60
+
+``response.json`` is a saved ``/api/predict`` response with the ``full`` profile. Without one, a transcript with
+Whisper-like segments of the given length is generated. ``internal`` is the hop from a worker to the load balancer,
+``client`` the hop from the load balancer to a client that accepts gzip. The live numbers are exported by the load
+balancer as ``muse_response_bytes`` and ``muse_serialization_cpu_seconds``.
+"""
+import argparse
+import json
+import random
+import time
+
+from whisperer.utility.serialization import RESPONSE_PROFILES, encode_json, pack, shape_transcript, unpack
+
+
+def synthetic_transcript(minutes: float) -> dict:
+    rng = random.Random(0)
+    words = "the of and to a in that is was he for it with as his on be at by had".split()
+    segments, start = [], 0.0
+    while start < minutes * 60:
+        end = start + rng.uniform(2, 7)
+        n_tokens = rng.randint(10, 40)
+        segments.append({
+            "id": len(segments),
+            "seek": int(start * 100),
+            "start": start,
+            "end": end,
+            "text": " " + " ".join(rng.choice(words) for _ in range(n_tokens * 3 // 4)),
+            "tokens": [rng.randrange(50257) for _ in range(n_tokens)],
+            "temperature": 0.0,
+            "avg_logprob": -rng.random(),
+            "compression_ratio": rng.uniform(1, 2.4),
+            "no_speech_prob": rng.random() / 10,
+        })
+        start = end
+    return {"text": "".join(s["text"] for s in segments), "segments": segments, "language": "en"}
+
+
+def cpu_time(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        t0 = time.thread_time()
+        fn()
+        timings.append(time.thread_time() - t0)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcript", help="saved /api/predict response")
+    parser.add_argument("--synthetic-minutes", type=float, default=60)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.transcript:
+        with open(args.transcript) as f:
+            transcript = next(iter(json.load(f).values()))
+    else:
+        transcript = synthetic_transcript(args.synthetic_minutes)
+
+    print(f"{len(transcript['segments'])} segments")
+    print(f"{'profile':>9} {'hop':>9} {'format':>8} {'bytes':>10} {'encode (ms)':>12} {'decode (ms)':>12}")
+    for profile in RESPONSE_PROFILES:
+        result = [{"video": shape_transcript(transcript, profile)}]
+        json_body, _ = encode_json(result)
+        gzip_body, _ = encode_json(result, accept_gzip=True, gzip_min_bytes=1)
+        msgpack_body = pack(result)
+        rows = [
+            ("internal", "json", json_body, lambda: encode_json(result), lambda: json.loads(json_body)),
+            ("internal", "msgpack", msgpack_body, lambda: pack(result), lambda: unpack(msgpack_body)),
+            ("client", "json", json_body, lambda: encode_json(result), None),
+            ("client", "gzip", gzip_body, lambda: encode_json(result, accept_gzip=True, gzip_min_bytes=1), None),
+        ]
+        for hop, fmt, body, encode, decode in rows:
+            encode_ms = 1000 * cpu_time(encode, args.repeats)
+            decode_ms = f"{1000 * cpu_time(decode, args.repeats):.2f}" if decode else "-"
+            print(f"{profile:>9} {hop:>9} {fmt:>8} {len(body):>10} {encode_ms:>12.2f} {decode_ms:>12}")
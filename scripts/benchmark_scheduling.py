@@ -0,0 +1,145 @@
+"""Compares round robin, the former scheduling of the LoadBalancer, with least-outstanding-work scheduling over
+simulated workers, in simulated time.
+
+Batches of ``--batch-size`` clips arrive as a Poisson process. Most clips are short, ``--long-share`` of them are
+``--long-secs`` long, so some batches take far longer than others. A worker transcribes ``--speed`` seconds of audio
+per second on each of its ``--replicas`` replicas, batches wait at the worker while all of them are busy, like they
+do at ``WhisperServe``. ``--slow-worker`` makes the first worker slower, e.g. a node with a noisy neighbour.
+
+    python scripts/benchmark_scheduling.py --workers 4 --load 0.8 --batches 20000
+"""
+import argparse
+import heapq
+import itertools
+import random
+from collections import deque
+
+import numpy as np
+
+from whisperer.utility.scheduler import WorkerScheduler
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class SimulatedWorker:
+
+    def __init__(self, replicas: int, speed: float):
+        self.replicas = replicas
+        self.speed = speed
+        self.busy = 0
+        self.queue = deque()
+
+
+class Simulation:
+    """One run of the workload over ``--workers`` simulated workers, scheduled by ``policy``."""
+
+    def __init__(self, policy: str, args):
+        self.policy = policy
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.clock = Clock()
+        self.workers = {f"worker-{i}": SimulatedWorker(args.replicas, args.speed) for i in range(args.workers)}
+        if args.slow_worker:
+            self.workers["worker-0"].speed *= args.slow_worker
+        choices = {"round robin": 0, "least work": 0, "power of two": 2}[policy]
+        self.scheduler = WorkerScheduler(choices=choices, clock=self.clock, rng=random.Random(args.seed))
+        self.scheduler.set_servers({server: worker.replicas for server, worker in self.workers.items()})
+        self.rotation = itertools.cycle(self.workers)
+        self.events = []  # (time, sequence, kind, payload)
+        self.sequence = itertools.count()
+        self.latencies, self.short_latencies = [], []
+
+    def push(self, at: float, kind: str, payload):
+        heapq.heappush(self.events, (at, next(self.sequence), kind, payload))
+
+    def clip_secs(self) -> float:
+        if self.rng.random() < self.args.long_share:
+            return self.args.long_secs
+        return self.rng.uniform(5, self.args.short_secs)
+
+    def arrival_rate(self) -> float:
+        """Batches per second that keep the workers ``--load`` busy, from the time the mean batch takes on one
+        replica."""
+        args = self.args
+        mean_clip = args.long_share * args.long_secs + (1 - args.long_share) * (5 + args.short_secs) / 2
+        mean_batch_secs = args.overhead_secs + args.batch_size * mean_clip / args.speed
+        total_speed = sum(worker.replicas * worker.speed / args.speed for worker in self.workers.values())
+        return args.load * total_speed / mean_batch_secs
+
+    def begin(self, server: str, batch: dict):
+        worker = self.workers[server]
+        worker.busy += 1
+        secs = self.args.overhead_secs + sum(batch["clips"]) / worker.speed
+        self.push(self.clock.now + secs, "done", (server, batch))
+
+    def arrive(self, batch: dict):
+        server = next(self.rotation) if self.policy == "round robin" else self.scheduler.pick()
+        batch["ticket"] = self.scheduler.start(server, batch["clips"])
+        worker = self.workers[server]
+        if worker.busy < worker.replicas:
+            self.begin(server, batch)
+        else:
+            worker.queue.append(batch)
+
+    def finish(self, server: str, batch: dict):
+        worker = self.workers[server]
+        worker.busy -= 1
+        self.scheduler.finish(server, batch["ticket"])
+        latency = self.clock.now - batch["arrived_at"]
+        self.latencies.append(latency)
+        if max(batch["clips"]) <= self.args.short_secs:
+            self.short_latencies.append(latency)
+        if worker.queue:
+            self.begin(server, worker.queue.popleft())
+
+    def run(self) -> dict:
+        rate = self.arrival_rate()
+        arrival = 0.0
+        for _ in range(self.args.batches):
+            arrival += self.rng.expovariate(rate)
+            clips = [self.clip_secs() for _ in range(self.args.batch_size)]
+            self.push(arrival, "arrival", {"clips": clips, "arrived_at": arrival})
+
+        while self.events:
+            self.clock.now, _, kind, payload = heapq.heappop(self.events)
+            if kind == "arrival":
+                self.arrive(payload)
+            else:
+                self.finish(*payload)
+
+        short = self.short_latencies
+        return {
+            "p50": np.percentile(self.latencies, 50),
+            "p95": np.percentile(self.latencies, 95),
+            "p99": np.percentile(self.latencies, 99),
+            "short p95": np.percentile(short, 95) if short else float("nan"),
+            "short p99": np.percentile(short, 99) if short else float("nan"),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--load", type=float, default=0.8, help="share of the worker capacity in use")
+    parser.add_argument("--batches", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--short-secs", type=float, default=60, help="short clips last 5 seconds up to this")
+    parser.add_argument("--long-secs", type=float, default=1800)
+    parser.add_argument("--long-share", type=float, default=0.02)
+    parser.add_argument("--speed", type=float, default=30, help="seconds of audio transcribed per second")
+    parser.add_argument("--overhead-secs", type=float, default=0.5)
+    parser.add_argument("--slow-worker", type=float, default=None, help="speed factor of the first worker")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'policy':>12} {'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8} {'short p95':>10} {'short p99':>10}")
+    for policy in ("round robin", "least work", "power of two"):
+        stats = Simulation(policy, args).run()
+        print(f"{policy:>12} {stats['p50']:>8.1f} {stats['p95']:>8.1f} {stats['p99']:>8.1f}"
+              f" {stats['short p95']:>10.1f} {stats['short p99']:>10.1f}")
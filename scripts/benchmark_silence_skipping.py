@@ -0,0 +1,81 @@
+"""Measures the encoder time saved by skipping silences, on clips built from speech with silent gaps in between.
+
+Every clip interleaves the given speech files with stretches of low-level noise, so the skipped share is known.
+The transcripts of both runs are printed side by side to check that the timestamps still line up.
+
+    python scripts/benchmark_silence_skipping.py speech1.mp3 speech2.mp3 --gap-secs 45 --clips 4
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from whisperer.models import WhisperModel
+from whisperer.models.audio import SAMPLE_RATE, load_audio
+
+
+def make_clip(speech: list, gap_secs: float, rng: np.random.Generator) -> np.ndarray:
+    parts = []
+    for audio in speech:
+        parts.append((1e-4 * rng.standard_normal(int(gap_secs * SAMPLE_RATE))).astype(np.float32))
+        parts.append(audio)
+    parts.append(parts[0])
+    return np.concatenate(parts)
+
+
+def count_encoder_time(model: WhisperModel) -> dict:
+    stats = {"seconds": 0.0, "windows": 0}
+    embed_audio = model.model.embed_audio
+
+    def timed_embed_audio(mel):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        t0 = time.perf_counter()
+        features = embed_audio(mel)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        stats["seconds"] += time.perf_counter() - t0
+        stats["windows"] += mel.shape[0]
+        return features
+
+    model.model.embed_audio = timed_embed_audio
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("speech", nargs="+", help="audio files with speech")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--gap-secs", type=float, default=45)
+    parser.add_argument("--clips", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    speech = [load_audio(path) for path in args.speech]
+    clips = [make_clip(speech, args.gap_secs, rng) for _ in range(args.clips)]
+    audio_seconds = sum(len(clip) for clip in clips) / SAMPLE_RATE
+    speech_seconds = args.clips * sum(len(audio) for audio in speech) / SAMPLE_RATE
+
+    model = WhisperModel(args.model)
+    model.warmup()
+    stats = count_encoder_time(model)
+
+    rows, transcripts = [], {}
+    for skip_silence in (False, True):
+        model.skip_silence = skip_silence
+        stats.update(seconds=0.0, windows=0)
+        t0 = time.perf_counter()
+        transcripts[skip_silence] = model.transcribe(clips)
+        rows.append((skip_silence, stats["windows"], stats["seconds"], time.perf_counter() - t0))
+
+    print(f"{args.clips} clips, {audio_seconds:.0f} audio-seconds, {100 * speech_seconds / audio_seconds:.0f}% speech")
+    print(f"{'skip silence':>12} {'windows':>8} {'encoder (s)':>12} {'wall (s)':>9}")
+    for skip_silence, windows, encoder, wall in rows:
+        print(f"{str(skip_silence):>12} {windows:>8} {encoder:>12.2f} {wall:>9.2f}")
+    print(f"encoder time saved: {100 * (1 - rows[1][2] / rows[0][2]):.0f}%")
+
+    print("\nfirst clip, both runs:")
+    for skip_silence, transcript in transcripts.items():
+        for segment in transcript[0]["segments"]:
+            print(f"  skip={skip_silence!s:<5} [{segment['start']:7.2f} - {segment['end']:7.2f}] {segment['text']}")
@@ -0,0 +1,88 @@
+"""Measures the per-dispatch overhead of the LoadBalancer's pooled worker sessions against a session per batch, the
+former behaviour, on a local stub worker that answers ``/api/predict`` right away.
+
+    python scripts/benchmark_worker_connections.py --batches 2000 --concurrency 16
+
+The stub counts the TCP connections it accepted, a pooled session opens at most ``--concurrency`` of them. The stub
+speaks plain HTTP, the cloud URLs of workers add a TLS handshake to every new connection on top of this.
+"""
+import argparse
+import asyncio
+import time
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+
+from whisperer.components.load_balancer import LoadBalancer
+from whisperer.utility.serialization import MSGPACK, pack
+
+BATCH = {"batch": [{"video_url": "https://youtu.be/dQw4w9WgXcQ", "tier": "high"}]}
+
+
+async def start_stub_worker():
+    connections = set()
+
+    async def predict(request: web.Request):
+        connections.add(request.transport)
+        await request.read()
+        return web.Response(body=pack([{"video": {"text": "", "segments": [], "language": "en"}}]),
+                            content_type=MSGPACK)
+
+    app = web.Application()
+    app.router.add_post("/api/predict", predict)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", connections
+
+
+async def dispatch_new_session(url: str):
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{url}/api/predict", json=BATCH, headers={"Accept": MSGPACK}) as response:
+            await response.read()
+
+
+async def dispatch_pooled(balancer: LoadBalancer, url: str):
+    async with balancer._session(url).post(f"{url}/api/predict", json=BATCH, headers={"Accept": MSGPACK}) as response:
+        await response.read()
+
+
+async def measure(dispatch, batches: int, concurrency: int) -> np.ndarray:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def timed():
+        async with slots:
+            t0 = time.perf_counter()
+            await dispatch()
+            return time.perf_counter() - t0
+
+    return np.array(await asyncio.gather(*(timed() for _ in range(batches))))
+
+
+async def main(args):
+    runner, url, connections = await start_stub_worker()
+    balancer = LoadBalancer()
+    variants = (
+        ("session per batch", lambda: dispatch_new_session(url)),
+        ("pooled session", lambda: dispatch_pooled(balancer, url)),
+    )
+    print(f"{'':>18} {'p50 (ms)':>9} {'p99 (ms)':>9} {'batches/s':>10} {'connections':>12}")
+    for name, dispatch in variants:
+        connections.clear()
+        t0 = time.perf_counter()
+        timings = await measure(dispatch, args.batches, args.concurrency)
+        wall = time.perf_counter() - t0
+        p50, p99 = 1000 * np.percentile(timings, [50, 99])
+        print(f"{name:>18} {p50:>9.2f} {p99:>9.2f} {args.batches / wall:>10.0f} {len(connections):>12}")
+    await balancer._close_sessions([url])
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,165 @@
+"""Goodput of the LoadBalancer while a worker crashes, with health checks, circuit breakers and batch retries against
+the former behaviour, where the batches of the dead worker failed and it stayed in the rotation until the flow
+removed it.
+
+Stub workers on localhost answer ``/api/predict`` after ``--batch-secs``. Requests arrive as a Poisson process for
+``--secs`` seconds, at ``--crash-at`` the first worker drops its connections and stops listening, and at
+``--removed-at`` the flow takes it out of the server list, like the next ``autoscale`` would.
+
+    python scripts/benchmark_worker_failure.py --workers 3 --rate 20 --crash-at 10 --removed-at 40 --secs 50
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+import numpy as np
+from aiohttp import web
+
+from whisperer.CONST import INFERENCE_REQUEST_TIMEOUT
+from whisperer.components.load_balancer import LoadBalancer
+from whisperer.utility.data_io import Data
+from whisperer.utility.serialization import MSGPACK, pack, unpack
+
+
+class FormerLoadBalancer(LoadBalancer):
+    """No circuit breakers and no retries, for comparison."""
+
+    async def send_batch(self, batch, endpoint="/api/predict"):
+        batch = [request for request in batch if not request[2].done()]
+        if not batch:
+            return
+        try:
+            result = await self._post_batch(self._scheduler.pick(), batch, endpoint, INFERENCE_REQUEST_TIMEOUT)
+        except Exception as e:
+            self._complete(batch, e)
+            return
+        self._complete(batch, result)
+
+    def _record_failure(self, server, error, kind):
+        pass
+
+    async def watch_health(self):
+        pass
+
+
+class StubWorker:
+
+    def __init__(self, replicas: int, batch_secs: float):
+        self.batch_secs = batch_secs
+        self.slots = asyncio.Semaphore(replicas)
+        self.transports = set()
+        self.runner = None
+        self.url = None
+
+    async def predict(self, request: web.Request):
+        self.transports.add(request.transport)
+        batch = unpack(await request.read())["batch"]
+        async with self.slots:
+            await asyncio.sleep(self.batch_secs)
+        return web.Response(body=pack([{data["video_url"]: {"text": "", "segments": [], "language": "en"}}
+                                       for data in batch]), content_type=MSGPACK)
+
+    async def health(self, request: web.Request):
+        self.transports.add(request.transport)
+        return web.json_response(True)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/api/predict", self.predict)
+        app.router.add_get("/api/health", self.health)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    def crash(self):
+        for site in self.runner.sites:
+            # stop listening, new connections are refused
+            site._server.close()
+        for transport in self.transports:
+            transport.abort()
+
+
+async def run(cls, args) -> list:
+    workers = [StubWorker(args.replicas, args.batch_secs) for _ in range(args.workers)]
+    for worker in workers:
+        await worker.start()
+    balancer = cls(max_batch_size=args.batch_size, batch_timeout_secs=0.5)
+    balancer.servers = [worker.url for worker in workers]
+    balancer._capacity = {worker.url: args.replicas for worker in workers}
+    balancer._set_ready_servers(list(balancer.servers))
+    tasks = [asyncio.create_task(balancer.consumer()), asyncio.create_task(balancer.watch_health())]
+
+    start = time.monotonic()
+    outcomes = []  # (arrived after secs, answered after secs, succeeded)
+
+    async def request(i: int):
+        arrival = time.monotonic() - start
+        try:
+            await balancer.run_batched(Data(video_url=f"https://youtu.be/{i:011d}"), "/api/predict")
+            succeeded = True
+        except Exception:
+            succeeded = False
+        outcomes.append((arrival, time.monotonic() - start, succeeded))
+
+    async def flow():
+        await asyncio.sleep(args.crash_at)
+        workers[0].crash()
+        await asyncio.sleep(args.removed_at - args.crash_at)
+        balancer.servers = balancer.servers[1:]
+        balancer._set_ready_servers([server for server in balancer._ready_servers if server in balancer.servers])
+
+    tasks.append(asyncio.create_task(flow()))
+    rng = random.Random(args.seed)
+    requests = []
+    for i in range(10 ** 9):
+        await asyncio.sleep(rng.expovariate(args.rate))
+        if time.monotonic() - start > args.secs:
+            break
+        requests.append(asyncio.create_task(request(i)))
+    await asyncio.gather(*requests)
+    for task in tasks:
+        task.cancel()
+    await balancer._close_sessions(list(balancer._sessions))
+    for worker in workers[1:]:
+        await worker.runner.cleanup()
+    return outcomes
+
+
+def summarize(name: str, outcomes: list, args):
+    windows = (("before crash", 0, args.crash_at),
+               ("crashed", args.crash_at, args.removed_at),
+               ("after removal", args.removed_at, args.secs))
+    cells = []
+    for _, begin, end in windows:
+        arrived = [outcome for outcome in outcomes if begin <= outcome[0] < end]
+        succeeded = [outcome for outcome in arrived if outcome[2]]
+        latencies = [answered - arrival for arrival, answered, _ in succeeded]
+        p95 = np.percentile(latencies, 95) if latencies else float("nan")
+        cells.append(f"{len(succeeded) / (end - begin):>8.1f} {len(succeeded) / max(len(arrived), 1):>7.1%}"
+                     f" {p95:>7.2f}")
+    print(f"{name:>14} " + " | ".join(cells))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=20, help="requests per second")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--batch-secs", type=float, default=0.5)
+    parser.add_argument("--crash-at", type=float, default=10)
+    parser.add_argument("--removed-at", type=float, default=40)
+    parser.add_argument("--secs", type=float, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    # the failed requests of the former load balancer log their tracebacks
+    logging.disable(logging.ERROR)
+
+    print(f"{'':>14} " + " | ".join(f"{title:^24}" for title in ("before crash", "crashed", "after removal")))
+    print(f"{'':>14} " + " | ".join(f"{'goodput/s':>8} {'ok':>7} {'p95 (s)':>7}" for _ in range(3)))
+    for name, cls in (("former", FormerLoadBalancer), ("health checked", LoadBalancer)):
+        summarize(name, asyncio.run(run(cls, args)), args)
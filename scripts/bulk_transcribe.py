@@ -0,0 +1,49 @@
+"""Transcribes a JSONL manifest on the WhisperServe workers of a running app, or on local model replicas, and
+appends the results to an output JSONL. Run it again with the same output to resume after a crash.
+
+    # the workers behind a load balancer, MUSE_SYSTEM_PASSWORD must be set to read them
+    python scripts/bulk_transcribe.py manifest.jsonl results.jsonl --load-balancer https://<load-balancer-url>
+    # given workers, or this machine
+    python scripts/bulk_transcribe.py manifest.jsonl results.jsonl --workers https://<worker-1> https://<worker-2>
+    python scripts/bulk_transcribe.py manifest.jsonl results.jsonl --local-replicas 4
+    # one of three machines splitting the manifest
+    python scripts/bulk_transcribe.py manifest.jsonl results-1.jsonl --local-replicas 4 --shard 1/3
+
+Every manifest line is a ``/api/predict`` request with an optional ``id``, e.g.
+``{"id": "ep-42", "audio_path": "podcasts/ep-42.mp3", "tier": "low", "response": "segments"}``.
+"""
+import argparse
+
+from whisperer.utility.bulk import BulkJob, LocalBackend, WorkerBackend, discover_workers, read_manifest
+
+
+def parse_shard(value: str):
+    index, count = map(int, value.split("/"))
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError("expected INDEX/COUNT with 0 <= INDEX < COUNT")
+    return index, count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("manifest")
+    parser.add_argument("output")
+    backends = parser.add_mutually_exclusive_group(required=True)
+    backends.add_argument("--load-balancer", help="use all the workers of this load balancer")
+    backends.add_argument("--workers", nargs="+", help="WhisperServe URLs")
+    backends.add_argument("--local-replicas", type=int, help="run this many model replicas in this process")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--shard", type=parse_shard, default=(0, 1), help="INDEX/COUNT, e.g. 0/4")
+    parser.add_argument("--report-secs", type=float, default=30)
+    args = parser.parse_args()
+
+    items = list(read_manifest(args.manifest, args.shard))
+    if args.local_replicas:
+        backends = [LocalBackend(args.local_replicas)]
+    else:
+        backends = [WorkerBackend(url) for url in args.workers or discover_workers(args.load_balancer)]
+
+    job = BulkJob(items, args.output, backends, batch_size=args.batch_size, report_secs=args.report_secs)
+    print(f"{len(items)} requests in the manifest, {job.skipped} already done")
+    stats = job.run()
+    print(f"finished {stats['done']:.0f} requests ({stats['failed']:.0f} failed) in {stats['seconds'] / 60:.1f} min")
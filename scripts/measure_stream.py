@@ -0,0 +1,43 @@
+"""Measures time-to-first-segment and total latency of the streaming endpoint. Use a video that is not in the
+transcript cache yet, cached transcripts are replayed instantly.
+
+    python scripts/measure_stream.py https://<load-balancer-url> https://www.youtube.com/watch?v=...
+"""
+import argparse
+import json
+import os
+import time
+
+import requests
+
+HEADERS = {
+    "accept": "application/json",
+    "x-api-key": os.environ.get("RATE_LIMIT_KEY", ""),
+}
+REQUEST_TIMEOUT = 16000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("server")
+    parser.add_argument("video_url")
+    args = parser.parse_args()
+    data = {"video_url": args.video_url}
+
+    t0 = time.time()
+    first_segment, num_segments = None, 0
+    with requests.post(f"{args.server}/api/predict/stream", json=data, headers=HEADERS, stream=True,
+                       timeout=REQUEST_TIMEOUT) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            event = json.loads(line)
+            if event["event"] == "segment":
+                first_segment = first_segment or time.time() - t0
+                num_segments += 1
+            elif event["event"] == "error":
+                raise RuntimeError(event["data"]["detail"])
+    stream_total = time.time() - t0
+
+    print(f"segments streamed:        {num_segments}")
+    if first_segment is not None:
+        print(f"stream time-to-first-seg: {first_segment:.2f}s")
+    print(f"stream total latency:     {stream_total:.2f}s")
@@ -0,0 +1,56 @@
+"""Sends a mix of interactive (``high``) and quality (``low``) requests at once and reports p50/p99 latency per
+service tier. Use videos that are not in the transcript cache yet, cached transcripts are answered instantly.
+
+    python scripts/measure_tiers.py https://<load-balancer-url> videos.txt --requests 20
+
+``videos.txt`` holds one video URL per line, the tiers take turns over them. The same numbers are exported by the
+load balancer as the ``muse_request_latency_seconds`` histogram.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+HEADERS = {
+    "accept": "application/json",
+    "x-api-key": os.environ.get("RATE_LIMIT_KEY", ""),
+}
+REQUEST_TIMEOUT = 16000
+
+
+def timed_request(server: str, video_url: str, tier: str):
+    t0 = time.time()
+    response = requests.post(f"{server}/api/predict", json={"video_url": video_url, "tier": tier}, headers=HEADERS,
+                             timeout=REQUEST_TIMEOUT)
+    return tier, time.time() - t0, response.ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("server")
+    parser.add_argument("videos")
+    parser.add_argument("--requests", type=int, default=20, help="requests per tier")
+    parser.add_argument("--tiers", nargs="+", default=["high", "low"])
+    args = parser.parse_args()
+
+    with open(args.videos) as f:
+        videos = [line.strip() for line in f if line.strip()]
+    jobs = [(videos[(i * len(args.tiers) + j) % len(videos)], tier)
+            for i in range(args.requests)
+            for j, tier in enumerate(args.tiers)]
+
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        results = list(pool.map(lambda job: timed_request(args.server, *job), jobs))
+
+    print(f"{'tier':>6} {'ok':>4} {'failed':>6} {'p50 (s)':>8} {'p99 (s)':>8}")
+    for tier in args.tiers:
+        latencies = [latency for t, latency, ok in results if t == tier and ok]
+        failed = sum(1 for t, _, ok in results if t == tier and not ok)
+        if latencies:
+            p50, p99 = np.percentile(latencies, [50, 99])
+            print(f"{tier:>6} {len(latencies):>4} {failed:>6} {p50:>8.2f} {p99:>8.2f}")
+        else:
+            print(f"{tier:>6} {0:>4} {failed:>6} {'-':>8} {'-':>8}")
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from whisperer.utility.batcher import Batcher
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_queue_is_flushed_at_the_deadline_of_its_oldest_request():
+    clock = Clock()
+    batcher = Batcher(clock=clock)
+    batcher.put("a", 1, max_batch_size=4, timeout_secs=2)
+    clock.now = 1.5
+    batcher.put("a", 2, max_batch_size=4, timeout_secs=2)
+
+    assert batcher._flush(clock.now) == ([], 2.0)
+    clock.now = 2.0
+    assert batcher._flush(clock.now) == ([("a", [1, 2], [2.0, 0.5])], None)
+    assert len(batcher) == 0
+
+
+def test_full_batch_is_sent_before_the_deadline():
+    clock = Clock()
+    batcher = Batcher(clock=clock)
+    for item in range(5):
+        batcher.put("a", item, max_batch_size=2, timeout_secs=10)
+
+    batches, next_deadline = batcher._flush(clock.now)
+    assert [items for _, items, _ in batches] == [[0, 1], [2, 3]]
+    assert next_deadline == 10
+
+
+def test_audio_budget_cuts_the_batch():
+    clock = Clock()
+    batcher = Batcher(clock=clock)
+    for item, secs in enumerate((600, 600, 600, 700)):
+        batcher.put("a", item, max_batch_size=8, timeout_secs=10, audio_secs=secs, max_batch_audio_secs=1200)
+
+    # both pairs reach the budget, the last clip does not fit in the second batch and waits
+    batches, next_deadline = batcher._flush(clock.now)
+    assert [items for _, items, _ in batches] == [[0, 1], [2]]
+    assert len(batcher) == 1 and next_deadline == 10
+
+
+def test_length_classes_are_batched_apart():
+    clock = Clock()
+    batcher = Batcher(length_spread=2, clock=clock)
+    for item, secs in enumerate((1800, 10, 12, 2000, 11)):
+        batcher.put("a", item, max_batch_size=3, timeout_secs=5, audio_secs=secs)
+
+    # the short clips fill a batch of their own and overtake the long one
+    batches, next_deadline = batcher._flush(clock.now)
+    assert [items for _, items, _ in batches] == [[1, 2, 4]]
+    assert next_deadline == 5
+    clock.now = 5
+    batches, _ = batcher._flush(clock.now)
+    assert [items for _, items, _ in batches] == [[0, 3]]
+
+
+def test_free_slots_send_partial_batches_oldest_first():
+    clock = Clock()
+    batcher = Batcher(clock=clock)
+    batcher.put("b", 1, max_batch_size=4, timeout_secs=10)
+    clock.now = 1
+    batcher.put("a", 2, max_batch_size=4, timeout_secs=10)
+    batcher.free_slots = 1
+
+    batches, next_deadline = batcher._flush(clock.now)
+    assert [(key, items) for key, items, _ in batches] == [("b", [1])]
+    assert next_deadline == 11
+
+
+def test_paused_batcher_holds_due_batches():
+    clock = Clock()
+    batcher = Batcher(clock=clock)
+    batcher.put("a", 1, max_batch_size=1, timeout_secs=0)
+
+    async def scenario():
+        batcher.paused = True
+        waiting = asyncio.ensure_future(batcher.next_batches())
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        batcher.paused = False
+        batcher.wake()
+        return await asyncio.wait_for(waiting, 1)
+
+    assert asyncio.run(scenario()) == [("a", [1], [0.0])]
+
+
+def test_length_classes_are_log_buckets():
+    batcher = Batcher(length_spread=2)
+    assert batcher._length_class(16) == batcher._length_class(31)
+    assert batcher._length_class(15) != batcher._length_class(17)
+
+
+@pytest.mark.parametrize("length_spread", [1, 0.5, 0])
+def test_length_spread_must_be_above_one(length_spread):
+    with pytest.raises(ValueError):
+        Batcher(length_spread=length_spread)
+
+
+def test_put_wakes_only_on_a_new_deadline_or_a_full_class():
+    batcher = Batcher(length_spread=2)
+    batcher._wakeup = asyncio.Event()
+    wakes = []
+    for item, secs in enumerate((10, 500, 11, 12, 13)):
+        batcher._wakeup.clear()
+        batcher.put("a", item, max_batch_size=3, timeout_secs=5, audio_secs=secs, max_batch_audio_secs=1200)
+        wakes.append(batcher._wakeup.is_set())
+
+    # the first request sets the deadline, the third short clip fills its class
+    assert wakes == [True, False, False, True, False]
+
+
+def test_discarded_request_leaves_its_class():
+    clock = Clock()
+    batcher = Batcher(length_spread=2, clock=clock)
+    for item, secs in enumerate((10, 11, 12)):
+        batcher.put("a", item, max_batch_size=2, timeout_secs=5, audio_secs=secs)
+
+    assert batcher.discard("a", 1) and not batcher.discard("a", 1)
+    batches, _ = batcher._flush(clock.now)
+    assert [items for _, items, _ in batches] == [[0, 2]]
+    assert len(batcher) == 0
@@ -0,0 +1,67 @@
+import json
+
+from whisperer.utility.bulk import BulkJob, load_checkpoint, make_batches, read_manifest
+from whisperer.utility.data_io import Data
+
+
+class FakeBackend:
+    name = "fake"
+    capacity = 2
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.batches = []
+
+    def transcribe(self, batch):
+        self.batches.append(batch)
+        if any(data.video_url in self.failing for data in batch):
+            raise RuntimeError("boom")
+        return [{data.source: {"text": "hi", "language": "en", "segments": [{"end": 5.0}]}} for data in batch]
+
+
+def write_manifest(path, n):
+    with open(path, "w") as f:
+        for i in range(n):
+            f.write(json.dumps({"id": str(i), "video_url": f"https://youtu.be/{i}", "tier": ("high", "low")[i % 2]}))
+            f.write("\n")
+
+
+def test_shards_split_the_manifest(tmp_path):
+    write_manifest(tmp_path / "manifest.jsonl", 20)
+    shards = [{item_id for item_id, _ in read_manifest(str(tmp_path / "manifest.jsonl"), (i, 3))} for i in range(3)]
+    assert set.union(*shards) == {str(i) for i in range(20)}
+    assert sum(map(len, shards)) == 20
+
+
+def test_batches_do_not_mix_tiers():
+    items = [(str(i), Data(video_url=f"https://youtu.be/{i}", tier=("high", "low")[i % 2])) for i in range(10)]
+    batches = make_batches(items, batch_size=3)
+    assert all(len({data.tier for _, data in batch}) == 1 for batch in batches)
+    assert sorted(item_id for batch in batches for item_id, _ in batch) == sorted(item_id for item_id, _ in items)
+
+
+def test_failed_request_does_not_fail_its_batch(tmp_path):
+    write_manifest(tmp_path / "manifest.jsonl", 8)
+    items = list(read_manifest(str(tmp_path / "manifest.jsonl")))
+    output = str(tmp_path / "out.jsonl")
+
+    stats = BulkJob(items, output, [FakeBackend(failing={"https://youtu.be/3"})], batch_size=4).run()
+    assert stats["done"] == 8 and stats["failed"] == 1
+    assert load_checkpoint(output) == {str(i) for i in range(8)} - {"3"}
+
+
+def test_resume_skips_finished_requests(tmp_path):
+    write_manifest(tmp_path / "manifest.jsonl", 8)
+    items = list(read_manifest(str(tmp_path / "manifest.jsonl")))
+    output = str(tmp_path / "out.jsonl")
+    BulkJob(items, output, [FakeBackend(failing={"https://youtu.be/3"})], batch_size=4).run()
+    with open(output, "a") as f:
+        # a crash in the middle of a line
+        f.write('{"id": "7", "res')
+
+    backend = FakeBackend()
+    job = BulkJob(items, output, [backend], batch_size=4)
+    assert job.skipped == 7
+    job.run()
+    assert [[data.video_url for data in batch] for batch in backend.batches] == [["https://youtu.be/3"]]
+    assert load_checkpoint(output) == {str(i) for i in range(8)}
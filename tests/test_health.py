@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from whisperer.components import load_balancer
+from whisperer.components.load_balancer import LoadBalancer
+from whisperer.utility.data_io import Data
+from whisperer.utility.health import CircuitBreaker
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_breaker_opens_after_failures_in_a_row():
+    breaker = CircuitBreaker(failure_threshold=3, clock=Clock())
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    breaker.record_success()
+    # a success in between starts the count again
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.is_open
+
+
+def test_unreachable_worker_opens_the_breaker_at_once():
+    breaker = CircuitBreaker(failure_threshold=3, clock=Clock())
+    assert breaker.record_failure(unreachable=True)
+    assert breaker.is_open
+
+
+def test_half_open_breaker_closes_on_a_probe_after_the_reset_period():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_secs=5, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 4
+    assert not breaker.record_success(probe=True)
+    clock.now = 5
+    # answers to batches sent before the breaker opened do not close it
+    assert not breaker.record_success()
+    assert breaker.record_success(probe=True)
+    assert not breaker.is_open and breaker.failures == 0
+
+
+def test_failing_probe_keeps_the_breaker_open_for_the_next_period():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_secs=5, clock=clock)
+    breaker.record_failure()
+    clock.now = 5
+    # the next period is already twice as long
+    assert not breaker.record_failure()
+    clock.now = 14
+    assert not breaker.record_success(probe=True)
+    clock.now = 15
+    assert breaker.record_success(probe=True)
+
+
+def test_reset_period_backs_off_until_a_batch_succeeds():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_secs=5, max_reset_secs=15, clock=clock)
+
+    for reset_secs in (5, 10, 15, 15):
+        assert breaker.record_failure()
+        clock.now += reset_secs - 1
+        assert not breaker.record_success(probe=True)
+        clock.now += 1
+        assert breaker.record_success(probe=True)
+
+    # a successful batch resets the backoff
+    breaker.record_success()
+    breaker.record_failure()
+    clock.now += 5
+    assert breaker.record_success(probe=True)
+
+
+def test_requests_are_refused_while_no_worker_is_ready():
+    balancer = LoadBalancer()
+    balancer._set_ready_servers([])
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(balancer.run_batched(Data(audio_path="a.mp3"), "/api/predict"))
+    assert error.value.status_code == 503
+
+
+def test_held_request_times_out_and_leaves_the_queue(monkeypatch):
+    monkeypatch.setattr(load_balancer, "INFERENCE_REQUEST_TIMEOUT", 0.05)
+    balancer = LoadBalancer()
+    balancer._set_ready_servers(["worker"])
+
+    async def scenario():
+        request = asyncio.create_task(balancer.run_batched(Data(audio_path="a.mp3"), "/api/predict"))
+        await asyncio.sleep(0)
+        # the only worker fails after the request was queued, nothing sends its batch
+        balancer._breaker("worker").record_failure(unreachable=True)
+        balancer._update_routing()
+        assert len(balancer._batcher) == 1
+        await request
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 408
+    assert len(balancer._batcher) == 0
+
+
+def test_open_breaker_waits_for_the_worker_to_be_ready(monkeypatch):
+    from aiohttp import web
+
+    monkeypatch.setattr(load_balancer, "HEALTH_CHECK_INTERVAL", 0.01)
+    worker = {"loading": True}
+
+    async def health(request):
+        return web.json_response(True)
+
+    async def ready(request):
+        if worker["loading"]:
+            return web.Response(status=503)
+        return web.json_response({"replicas": 3})
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_get("/api/health", health)
+        app.router.add_get("/api/ready", ready)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        server = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        balancer = LoadBalancer()
+        balancer._breakers[server] = CircuitBreaker(reset_secs=0)
+        balancer._set_ready_servers([server])
+        balancer._breaker(server).record_failure(unreachable=True)
+        balancer._update_routing()
+        watcher = asyncio.create_task(balancer.watch_health())
+        try:
+            # the worker restarted, it answers health probes while its model loads
+            await asyncio.sleep(0.1)
+            assert balancer._healthy_servers() == []
+            worker["loading"] = False
+            await asyncio.sleep(0.1)
+            return balancer._healthy_servers() == [server], balancer._capacity[server]
+        finally:
+            watcher.cancel()
+            await runner.cleanup()
+
+    assert asyncio.run(scenario()) == (True, 3)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+import torch
+from whisper.decoding import DecodingResult
+from whisper.model import ModelDimensions, Whisper
+from whisper.tokenizer import get_tokenizer
+
+from whisperer.models.audio import SAMPLE_RATE
+from whisperer.models.pipeline import WhisperModel
+
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    """A Whisper model with tiny random weights, its decoder answers every window with "hello" from 0 to 1 second."""
+    dims = ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=8, n_audio_head=1, n_audio_layer=1,
+                           n_vocab=51865, n_text_ctx=448, n_text_state=8, n_text_head=1, n_text_layer=1)
+    checkpoint = tmp_path_factory.mktemp("whisper") / "tiny-random.pt"
+    torch.save({"dims": dims.__dict__, "model_state_dict": Whisper(dims).state_dict()}, checkpoint)
+    model = WhisperModel(checkpoint=str(checkpoint), cpu_int8=False, skip_silence=False)
+
+    tokenizer = get_tokenizer(multilingual=True)
+    tokens = [tokenizer.timestamp_begin, *tokenizer.encode(" hello"), tokenizer.timestamp_begin + 50]
+    model.decode_calls = []
+
+    def decode(audio_features, options):
+        model.decode_calls.append(options)
+        return [DecodingResult(audio_features=features, language=options.language or "en", tokens=tokens,
+                               avg_logprob=-0.1, no_speech_prob=0.0, temperature=options.temperature,
+                               compression_ratio=1.0)
+                for features in audio_features]
+
+    model.model.decode = decode
+    return model
+
+
+def test_stream_emits_a_segment_per_window(model):
+    model.decode_calls.clear()
+    clip = np.random.default_rng(0).normal(0, 0.1, 70 * SAMPLE_RATE).astype(np.float32)
+    pieces = [clip[start:start + 10 * SAMPLE_RATE] for start in range(0, len(clip), 10 * SAMPLE_RATE)]
+
+    events = list(model.transcribe_stream(pieces))
+
+    segments = [data for event, data in events if event == "segment"]
+    assert [segment["id"] for segment in segments] == [0, 1, 2]
+    assert [(segment["start"], segment["end"]) for segment in segments] == [(0.0, 1.0), (30.0, 31.0), (60.0, 61.0)]
+    assert all(segment["text"] == " hello" for segment in segments)
+    assert events[-1] == ("done", {"text": " hello hello hello", "language": "en"})
+    assert [options.language for options in model.decode_calls] == [None, "en", "en"]
+
+
+def test_language_of_the_first_window_holds_for_the_whole_clip(model):
+    model.decode_calls.clear()
+    clips = [np.random.default_rng(seed).normal(0, 0.1, secs * SAMPLE_RATE).astype(np.float32)
+             for seed, secs in ((1, 70), (2, 10))]
+
+    results = model.transcribe(clips)
+
+    # one step detects the language on the first window of both clips, their other chunks are decoded in it
+    assert [options.language for options in model.decode_calls] == [None, "en"]
+    assert [len(result["segments"]) for result in results] == [3, 1]
+    assert all(result["language"] == "en" for result in results)
+
+
+def test_empty_and_too_short_clips_get_an_empty_transcript(model):
+    clips = [np.zeros(0, dtype=np.float32), np.zeros(100, dtype=np.float32),
+             np.random.default_rng(3).normal(0, 0.1, 5 * SAMPLE_RATE).astype(np.float32)]
+
+    results = model.transcribe(clips)
+
+    assert results[:2] == [{"text": "", "segments": [], "language": None}] * 2
+    assert results[2]["text"] == " hello"
+    events = list(model.transcribe_stream([np.zeros(100, dtype=np.float32)]))
+    assert events == [("done", {"text": "", "language": None})]
@@ -0,0 +1,33 @@
+import os
+
+import torch
+from whisper.model import ModelDimensions, Whisper
+
+from whisperer.models.quantization import _cache_path, load_quantized_model
+
+
+def tiny_checkpoint(path) -> str:
+    dims = ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=8, n_audio_head=1, n_audio_layer=1,
+                           n_vocab=51865, n_text_ctx=448, n_text_state=8, n_text_head=1, n_text_layer=1)
+    torch.save({"dims": dims.__dict__, "model_state_dict": Whisper(dims).state_dict()}, path)
+    return str(path)
+
+
+def test_cached_model_matches_the_quantized_one(tmp_path):
+    checkpoint = tiny_checkpoint(tmp_path / "tiny.pt")
+    quantized = load_quantized_model("tiny", checkpoint, cache_dir=str(tmp_path / "cache"))
+    cached = load_quantized_model("tiny", checkpoint, cache_dir=str(tmp_path / "cache"))
+
+    mel = torch.randn(1, 80, 3000)
+    tokens = torch.tensor([[50258, 50259, 50359]])
+    with torch.inference_mode():
+        assert torch.equal(quantized(mel, tokens), cached(mel, tokens))
+
+
+def test_cache_file_follows_the_checkpoint(tmp_path):
+    checkpoint = tiny_checkpoint(tmp_path / "tiny.pt")
+    path = _cache_path("tiny", checkpoint, str(tmp_path))
+    assert path != _cache_path("tiny", None, str(tmp_path))
+
+    os.utime(checkpoint, ns=(0, 10**9))
+    assert _cache_path("tiny", checkpoint, str(tmp_path)) != path
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from whisperer.components.load_balancer import LoadBalancer
+from whisperer.models.prefetch import AudioPrefetcher
+from whisperer.utility.bulk import BulkJob, load_checkpoint
+from whisperer.utility.data_io import Data, sample_error
+
+
+def load(sample):
+    if sample.audio_path == "missing.mp3":
+        raise ValueError("The file missing.mp3 does not exist.")
+    return sample.audio_path
+
+
+def test_bad_sample_only_fails_its_own_request():
+    prefetcher = AudioPrefetcher(load, num_workers=2, queue_depth=1)
+    batch = [Data(audio_path=path) for path in ("a.mp3", "missing.mp3", "b.mp3")]
+    audios = prefetcher.collect(prefetcher.submit(batch))
+    results = [sample_error(audio) if isinstance(audio, Exception) else {audio: {"text": "hi"}} for audio in audios]
+
+    async def complete():
+        loop = asyncio.get_running_loop()
+        requests = [(str(i), data.dict(), loop.create_future(), None) for i, data in enumerate(batch)]
+        LoadBalancer._complete(requests, results)
+        return [request[2] for request in requests]
+
+    ok, failed, other = asyncio.run(complete())
+    assert ok.result() == {"a.mp3": {"text": "hi"}} and other.result() == {"b.mp3": {"text": "hi"}}
+    with pytest.raises(HTTPException) as error:
+        failed.result()
+    assert error.value.status_code == 400 and "does not exist" in error.value.detail
+
+
+class SampleErrorBackend:
+    name = "worker"
+    capacity = 1
+
+    def __init__(self):
+        self.batches = []
+
+    def transcribe(self, batch):
+        self.batches.append(batch)
+        return [sample_error(ValueError("undecodable")) if data.audio_path == "bad.mp3"
+                else {data.source: {"text": "hi", "language": "en", "segments": []}} for data in batch]
+
+
+def test_bulk_records_sample_errors_without_splitting_the_batch(tmp_path):
+    items = [(path, Data(audio_path=path)) for path in ("a.mp3", "bad.mp3", "b.mp3")]
+    backend = SampleErrorBackend()
+    output = str(tmp_path / "out.jsonl")
+
+    stats = BulkJob(items, output, [backend], batch_size=3).run()
+    assert stats["done"] == 3 and stats["failed"] == 1
+    assert len(backend.batches) == 1
+    assert load_checkpoint(output) == {"a.mp3", "b.mp3"}
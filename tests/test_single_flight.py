@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from whisperer.components.load_balancer import LoadBalancer
+from whisperer.utility.data_io import Data
+from whisperer.utility.single_flight import SingleFlight
+from whisperer.utility.transcript_cache import TranscriptCache
+
+
+def test_burst_of_identical_requests_costs_one_inference():
+    balancer = LoadBalancer(max_batch_size=8, batch_timeout_secs=0.05)
+    balancer._cache = TranscriptCache(max_items=16)
+    balancer.servers = ["worker"]
+    inferences = []
+
+    async def send_batch(batch, endpoint="/api/predict"):
+        inferences.extend(request[1]["audio_path"] for request in batch)
+        await asyncio.sleep(0.05)
+        balancer._complete(batch, [{request[1]["audio_path"]: {"text": "hi", "segments": [], "language": "en"}}
+                                   for request in batch])
+
+    async def burst():
+        balancer.send_batch = send_batch
+        balancer._set_ready_servers(["worker"])
+        consumer = asyncio.create_task(balancer.consumer())
+        results = await asyncio.gather(*(balancer.process_request(Data(audio_path="viral.mp3")) for _ in range(20)),
+                                       balancer.process_request(Data(audio_path="other.mp3")))
+        consumer.cancel()
+        return results
+
+    results = asyncio.run(burst())
+    assert sorted(inferences) == ["other.mp3", "viral.mp3"]
+    assert all(result == {"viral.mp3": {"text": "hi", "segments": [], "language": "en"}} for result in results[:20])
+    assert len(balancer._single_flight) == 0
+
+
+def test_failure_is_shared_by_all_callers():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def burst():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.run("key", work) for _ in range(5)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert len(calls) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_work_is_cancelled_once_every_caller_left():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(10)
+
+        first = asyncio.create_task(flight.run("key", work))
+        second = asyncio.create_task(flight.run("key", work))
+        await started.wait()
+        task = flight._calls["key"].task
+
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not task.cancelled() and not task.done()
+
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        await asyncio.sleep(0)
+        return task
+
+    assert asyncio.run(scenario()).cancelled()
@@ -0,0 +1,66 @@
+import os
+
+from whisperer.utility.metrics import TRANSCRIPT_CACHE_MISSES, TRANSCRIPT_CACHE_WRITE_ERRORS
+from whisperer.utility.transcript_cache import TranscriptCache, cache_key
+
+
+def test_cache_key_depends_on_model_and_options():
+    key = cache_key("dQw4w9WgXcQ", "base", {})
+    assert key == cache_key("dQw4w9WgXcQ", "base", {})
+    assert key != cache_key("dQw4w9WgXcQ", "tiny", {})
+    assert key != cache_key("dQw4w9WgXcQ", "base", {"language": "en"})
+
+
+def test_memory_tier_is_lru(tmp_path):
+    cache = TranscriptCache(max_items=2)
+    cache.put("a", {"text": "a"})
+    cache.put("b", {"text": "b"})
+    assert cache.get("a") == {"text": "a"}
+    cache.put("c", {"text": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"text": "a"}
+    assert cache.get("c") == {"text": "c"}
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    TranscriptCache(max_items=1, directory=str(tmp_path)).put("a", {"text": "a"})
+
+    cache = TranscriptCache(max_items=1, directory=str(tmp_path))
+    assert cache.get("a") == {"text": "a"}
+
+
+def test_disk_tier_ttl_and_eviction(tmp_path):
+    cache = TranscriptCache(max_items=1, directory=str(tmp_path), ttl_secs=60, max_disk_items=2)
+    for key in "abc":
+        cache.put(key, {"text": key})
+    assert sorted(os.listdir(tmp_path)) == ["b.json", "c.json"]
+
+    os.utime(tmp_path / "b.json", (0, 0))
+    assert cache.get("b") is None
+    assert not (tmp_path / "b.json").exists()
+
+
+def test_failed_disk_write_keeps_the_transcript_in_memory(tmp_path, monkeypatch):
+    cache = TranscriptCache(max_items=2, directory=str(tmp_path))
+    errors = TRANSCRIPT_CACHE_WRITE_ERRORS._value.get()
+
+    def disk_full(src, dst):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(os, "replace", disk_full)
+    cache.put("a", {"text": "a"})
+
+    assert cache.get("a") == {"text": "a"}
+    assert os.listdir(tmp_path) == []
+    assert TRANSCRIPT_CACHE_WRITE_ERRORS._value.get() == errors + 1
+
+
+def test_fallback_keys_are_one_lookup(tmp_path):
+    cache = TranscriptCache(max_items=2, directory=str(tmp_path))
+    cache.put("full", {"text": "a"})
+    misses = TRANSCRIPT_CACHE_MISSES._value.get()
+
+    assert cache.get("segments", "full") == {"text": "a"}
+    assert cache.get("text", "other") is None
+    assert TRANSCRIPT_CACHE_MISSES._value.get() == misses + 1
@@ -0,0 +1,25 @@
+import numpy as np
+
+from whisperer.models.vad import SAMPLE_RATE, speech_regions
+
+
+def noise(secs: float, dbfs: float, seed: int = 0) -> np.ndarray:
+    """Gaussian noise with an RMS level of ``dbfs``."""
+    rms = 10 ** (dbfs / 20)
+    return np.random.default_rng(seed).normal(0, rms, int(secs * SAMPLE_RATE)).astype(np.float32)
+
+
+def test_silent_clip_has_no_regions():
+    assert speech_regions(np.zeros(10 * SAMPLE_RATE, dtype=np.float32)) == []
+
+
+def test_quiet_clip_keeps_its_speech():
+    audio = np.concatenate([noise(3, -53), np.zeros(5 * SAMPLE_RATE, dtype=np.float32), noise(3, -53, seed=1)])
+    regions = speech_regions(audio)
+    assert len(regions) == 2
+    assert regions[0][0] == 0 and regions[-1][1] == len(audio)
+
+
+def test_short_clip_regions_stay_inside_the_clip():
+    audio = noise(0.8, -20)
+    assert speech_regions(audio) == [(0, len(audio))]
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from whisperer.utility.youtube import (
+    MetadataResolver,
+    StubMetadataFetcher,
+    VideoMetadata,
+    check_duration,
+    extract_video_id,
+)
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        "https://www.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=42",
+        "https://m.youtube.com/watch?v=dQw4w9WgXcQ",
+        "youtube.com/watch?v=dQw4w9WgXcQ",
+        "https://youtu.be/dQw4w9WgXcQ?t=1",
+        "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+        "https://www.youtube.com/embed/dQw4w9WgXcQ",
+        "dQw4w9WgXcQ",
+    ],
+)
+def test_extract_video_id(url):
+    assert extract_video_id(url) == "dQw4w9WgXcQ"
+
+
+def test_extract_video_id_keeps_unknown_urls():
+    assert extract_video_id("https://example.com/audio.mp3") == "https://example.com/audio.mp3"
+
+
+@pytest.fixture
+def stub_file(tmp_path):
+    path = tmp_path / "videos.json"
+    path.write_text(json.dumps({"dQw4w9WgXcQ": {"duration": 212, "audio_url": "/data/rick.mp3"}}))
+    return str(path)
+
+
+def test_stub_fetcher(stub_file):
+    fetch = StubMetadataFetcher(stub_file)
+    assert fetch("dQw4w9WgXcQ") == VideoMetadata("dQw4w9WgXcQ", 212, "/data/rick.mp3")
+    with pytest.raises(ValueError):
+        fetch("xxxxxxxxxxx")
+
+
+def test_resolver_caches_and_expires(stub_file):
+    calls = []
+    stub = StubMetadataFetcher(stub_file)
+
+    def fetch(video_id):
+        calls.append(video_id)
+        return stub(video_id)
+
+    resolver = MetadataResolver(fetch, ttl_secs=0.2)
+    assert resolver.resolve("https://youtu.be/dQw4w9WgXcQ").duration == 212
+    assert resolver.resolve("https://www.youtube.com/watch?v=dQw4w9WgXcQ").duration == 212
+    assert len(calls) == 1
+
+    time.sleep(0.3)
+    resolver.resolve("dQw4w9WgXcQ")
+    assert len(calls) == 2
+
+
+def test_resolver_coalesces_concurrent_lookups(stub_file):
+    calls = []
+    release = threading.Event()
+    stub = StubMetadataFetcher(stub_file)
+
+    def fetch(video_id):
+        calls.append(video_id)
+        release.wait(5)
+        return stub(video_id)
+
+    resolver = MetadataResolver(fetch)
+
+    async def burst():
+        lookups = [asyncio.ensure_future(resolver.resolve_async("dQw4w9WgXcQ")) for _ in range(10)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*lookups)
+
+    results = asyncio.run(burst())
+    assert len(calls) == 1
+    assert all(result.duration == 212 for result in results)
+
+
+def test_resolver_does_not_cache_failures(stub_file):
+    resolver = MetadataResolver(StubMetadataFetcher(stub_file))
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            resolver.resolve("xxxxxxxxxxx")
+
+
+def test_check_duration():
+    check_duration(VideoMetadata("dQw4w9WgXcQ", 212, ""), max_audio_secs=300)
+    with pytest.raises(ValueError):
+        check_duration(VideoMetadata("dQw4w9WgXcQ", 212, ""), max_audio_secs=60)
@@ -3,11 +3,44 @@ import uuid
 
 ENABLE_TRACKERS = bool(int(os.environ.get("MUSE_ENABLE_TRACKERS", 0)))
 MUSE_LOAD_TESTING = os.environ.get("MUSE_LOAD_TESTING", False)
-INFERENCE_REQUEST_TIMEOUT = os.environ.get("INFERENCE_REQUEST_TIMEOUT", 16000)
-KEEP_ALIVE_TIMEOUT = os.environ.get("KEEP_ALIVE_TIMEOUT", 16000)
+INFERENCE_REQUEST_TIMEOUT = float(os.environ.get("INFERENCE_REQUEST_TIMEOUT", 16000))
+KEEP_ALIVE_TIMEOUT = float(os.environ.get("KEEP_ALIVE_TIMEOUT", 16000))
+WORKER_CONNECTIONS = int(os.environ.get("WORKER_CONNECTIONS", 64))
+SCHEDULER_CHOICES = int(os.environ.get("SCHEDULER_CHOICES", 0))
+HEALTH_CHECK_INTERVAL = float(os.environ.get("HEALTH_CHECK_INTERVAL", 2))
+HEALTH_CHECK_TIMEOUT = float(os.environ.get("HEALTH_CHECK_TIMEOUT", 5))
+CIRCUIT_BREAKER_FAILURES = int(os.environ.get("CIRCUIT_BREAKER_FAILURES", 3))
+CIRCUIT_BREAKER_RESET_SECS = float(os.environ.get("CIRCUIT_BREAKER_RESET_SECS", 5))
+MAX_BATCH_RETRIES = int(os.environ.get("MAX_BATCH_RETRIES", 1))
 RATE_LIMIT_KEY = os.environ.get("RATE_LIMIT_KEY", str(uuid.uuid4().hex))
 SENTRY_API_KEY = os.environ.get("SENTRY_API_KEY", None)
 MUSE_SYSTEM_PASSWORD = os.environ.get("MUSE_SYSTEM_PASSWORD", "").encode("utf-8")
+AUDIO_PREFETCH_WORKERS = int(os.environ.get("AUDIO_PREFETCH_WORKERS", 4))
+AUDIO_PREFETCH_DEPTH = int(os.environ.get("AUDIO_PREFETCH_DEPTH", 2))
+WHISPER_REPLICAS = int(os.environ.get("WHISPER_REPLICAS", 1))
+WHISPER_REPLICA_THREADS = int(os.environ.get("WHISPER_REPLICA_THREADS", 0))
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base")
+WHISPER_MODELS = os.environ.get("WHISPER_MODELS", "tiny,base,small,medium").split(",")
+HIGH_TIER_MODEL = os.environ.get("HIGH_TIER_MODEL", None)
+LOW_TIER_MODEL = os.environ.get("LOW_TIER_MODEL", "small")
+MAX_LOADED_MODELS = int(os.environ.get("MAX_LOADED_MODELS", 2))
+WHISPER_CPU_INT8 = bool(int(os.environ.get("WHISPER_CPU_INT8", 0)))
+WHISPER_CACHE_DIR = os.environ.get("WHISPER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "whisper"))
+MAX_AUDIO_SECS = float(os.environ.get("MAX_AUDIO_SECS", 3600))
+MAX_BATCH_AUDIO_SECS = float(os.environ.get("MAX_BATCH_AUDIO_SECS", 7200))
+BATCH_LENGTH_SPREAD = float(os.environ.get("BATCH_LENGTH_SPREAD", 2))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+GZIP_MIN_BYTES = int(os.environ.get("GZIP_MIN_BYTES", 1024))
+LOCAL_AUDIO_DIR = os.environ.get("LOCAL_AUDIO_DIR", None)
+MAX_WINDOWS_PER_STEP = int(os.environ.get("MAX_WINDOWS_PER_STEP", 16))
+WHISPER_SKIP_SILENCE = bool(int(os.environ.get("WHISPER_SKIP_SILENCE", 1)))
+YOUTUBE_METADATA_TTL = float(os.environ.get("YOUTUBE_METADATA_TTL", 3600))
+YOUTUBE_STUB_FILE = os.environ.get("YOUTUBE_STUB_FILE", None)
+TRANSCRIPT_CACHE_SIZE = int(os.environ.get("TRANSCRIPT_CACHE_SIZE", 1024))
+TRANSCRIPT_CACHE_DIR = os.environ.get("TRANSCRIPT_CACHE_DIR",
+                                      os.path.join(os.path.expanduser("~"), ".cache", "whisperer", "transcripts"))
+TRANSCRIPT_CACHE_TTL = float(os.environ.get("TRANSCRIPT_CACHE_TTL", 7 * 24 * 3600))
+TRANSCRIPT_CACHE_DISK_SIZE = int(os.environ.get("TRANSCRIPT_CACHE_DISK_SIZE", 100_000))
 
 NSFW_PROMPTS = [
     "nudity",
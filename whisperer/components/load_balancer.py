@@ -1,11 +1,12 @@
 import asyncio
+import hashlib
+import json
 import logging
 import secrets
 import time
 import uuid
 from dataclasses import dataclass
-from itertools import cycle
-from typing import List
+from typing import List, Optional, Tuple
 
 import aiohttp
 import lightning as L
@@ -13,18 +14,56 @@ import requests
 import sentry_sdk
 from fastapi import HTTPException
 from fastapi.requests import Request
+from fastapi.responses import Response
+from pydantic import ValidationError
 from ratelimit import RateLimitMiddleware
 from ratelimit.backends.simple import MemoryBackend
 
 from whisperer.CONST import (
+    BATCH_LENGTH_SPREAD,
+    CIRCUIT_BREAKER_FAILURES,
+    CIRCUIT_BREAKER_RESET_SECS,
+    HEALTH_CHECK_INTERVAL,
+    HEALTH_CHECK_TIMEOUT,
     INFERENCE_REQUEST_TIMEOUT,
     KEEP_ALIVE_TIMEOUT,
+    MAX_AUDIO_SECS,
+    MAX_BATCH_AUDIO_SECS,
+    MAX_BATCH_RETRIES,
+    MAX_UPLOAD_BYTES,
     MUSE_SYSTEM_PASSWORD,
+    SCHEDULER_CHOICES,
     SENTRY_API_KEY,
+    TRANSCRIPT_CACHE_DIR,
+    TRANSCRIPT_CACHE_DISK_SIZE,
+    TRANSCRIPT_CACHE_SIZE,
+    TRANSCRIPT_CACHE_TTL,
+    WORKER_CONNECTIONS,
+)
+from whisperer.models.audio import probe_duration
+from whisperer.utility.data_io import Data, SysInfo, TimeoutException, ndjson_event, random_prompt
+from whisperer.utility.exception_handling import is_unreachable, is_worker_failure, raise_granular_exception
+from whisperer.utility.batcher import Batcher
+from whisperer.utility.health import CircuitBreaker
+from whisperer.utility.metrics import (
+    BATCH_QUEUE_WAIT,
+    BATCH_RETRIES,
+    COALESCED_REQUESTS,
+    OPEN_CIRCUITS,
+    REQUEST_LATENCY,
+    RESPONSE_BYTES,
+    SERIALIZATION_CPU_SECONDS,
+    STREAM_LATENCY,
+    STREAM_TIME_TO_FIRST_SEGMENT,
+    WORKER_FAILURES,
 )
-from whisperer.utility.data_io import Data, SysInfo, TimeoutException, random_prompt
-from whisperer.utility.exception_handling import raise_granular_exception
 from whisperer.utility.rate_limiter import RULES, auth_function
+from whisperer.utility.scheduler import WorkerScheduler
+from whisperer.utility.serialization import MSGPACK, encode_json, pack, shape_transcript, unpack
+from whisperer.utility.single_flight import SingleFlight
+from whisperer.utility.tiers import DEFAULT_TIER, SERVICE_TIERS, resolve_model
+from whisperer.utility.transcript_cache import TranscriptCache, cache_key
+from whisperer.utility.youtube import VideoMetadata, check_duration, default_resolver, extract_video_id
 
 
 @dataclass
@@ -34,7 +73,37 @@ class FastAPIBuildConfig(L.BuildConfig):
 
 class LoadBalancer(L.LightningWork):
     r"""The LoadBalancer is a LightningWork component that collects the requests and sends it to the prediciton API
-    asynchronously using RoundRobin scheduling. It also performs auto batching of the incoming requests.
+    asynchronously. It also performs auto batching of the incoming requests, only
+    requests for the same model are batched together so requests for a small model do not wait on a large one.
+    Every service tier (see :mod:`whisperer.utility.tiers`) has batch queues of its own, with its own batch size
+    and flush deadline, so interactive requests never wait behind beam-search batches. A batch is sent once it is full
+    or its oldest request reaches the deadline, and right away while workers have free capacity. Requests are only
+    batched with requests of similar audio length, up to ``MAX_BATCH_AUDIO_SECS`` of audio per batch, so short clips do
+    not wait for a long video in their batch (see :mod:`whisperer.utility.batcher`).
+
+    Finished transcripts are cached by video ID, model and decoding options, repeated requests are answered from the
+    cache without reaching a worker. ``/api/detect-language`` requests go through the same batching, in batches of
+    their own, and their results are cached per video ID and model as well. Videos are looked up before they are
+    queued, so videos over the compute budget are rejected without taking a batch slot. Identical requests that come
+    while the first one is still in progress wait for its transcript instead of queueing again, e.g. when everyone
+    sends the same video at once.
+
+    ``/api/predict/upload`` takes the audio file itself as the request body and ``/api/predict`` also accepts the path
+    of a file on the workers, for batch jobs. Both are batched with the video requests of the same tier and model,
+    uploads are cached by the hash of their content.
+
+    Workers send their results as msgpack, already cut down to the response profile of every request (see
+    :mod:`whisperer.utility.serialization`). Responses to clients are encoded off the event loop and gzip-compressed
+    when the client accepts it. ``/api/predict/stream`` bypasses the batching and relays the segment
+    events of a worker as they arrive. Workers only receive traffic once their ``/api/ready`` endpoint reports that
+    the model is loaded and warmed up. Every batch and stream goes to the worker with the least audio left to
+    transcribe per model replica (see :mod:`whisperer.utility.scheduler`), so workers busy with long videos are
+    skipped. Every worker has a long-lived HTTP session of its own, batches and streams reuse its connections.
+
+    Ready workers are probed on ``/api/health`` in the background. A circuit breaker per worker (see
+    :mod:`whisperer.utility.health`) takes a worker out of the rotation as soon as it cannot be reached, or after a
+    few failed probes and batches in a row, without waiting for the flow to replace it. A batch that failed because
+    of its worker is sent again to another worker, ``MAX_BATCH_RETRIES`` times at most and within the request timeout.
 
     The LoadBalancer exposes system endpoints with a basic HTTP authentication, in order to activate the authentication
     you need to provide a system password from environment variable
@@ -42,8 +111,9 @@ class LoadBalancer(L.LightningWork):
     After enabling you will require to send username and password from the request header for the private endpoints.
 
     Args:
-        max_batch_size: Number of requests processed at once.
-        batch_timeout_secs: Number of seconds to wait before sending the requests to process.
+        max_batch_size: Number of requests processed at once, for the tiers that do not set their own.
+        batch_timeout_secs: Longest time in seconds a request waits for its batch to fill up, for the tiers that do
+            not set their own.
         \**kwargs: Arguments passed to :func:`LightningWork.init` like ``CloudCompute``, ``BuildConfig``, etc.
     """
 
@@ -53,68 +123,425 @@ class LoadBalancer(L.LightningWork):
         self.servers = []
         self.max_batch_size = max_batch_size
         self.batch_timeout_secs = batch_timeout_secs
-        self._ITER = None
-        self._batch = {"high": [], "low": []}
-        self._responses = {}  # {request_id: response}
-        self._last_batch_sent = 0
-
-    async def send_batch(self, batch):
-        server = next(self._ITER)
-        data = {"batch": [b[1] for b in batch]}
+        self._ready_servers = []
+        self._capacity = {}  # {server: number of batches it processes at once}
+        self._scheduler = WorkerScheduler(choices=SCHEDULER_CHOICES)
+        # {(tier, model, worker endpoint): [(request_id, data, future, audio seconds or None)]}
+        self._batcher = Batcher(length_spread=BATCH_LENGTH_SPREAD)
+        self._inflight = 0  # batches sent and not answered yet
+        self._sessions = {}  # {server: aiohttp.ClientSession}
+        self._breakers = {}  # {server: CircuitBreaker}
+        self._single_flight = SingleFlight()  # transcriptions in progress by cache key
+        self._cache = None
+        self._resolver = None
+
+    async def send_batch(self, batch, endpoint="/api/predict"):
+        # requests whose caller went away are not worth a worker's time
+        batch = [request for request in batch if not request[2].done()]
+        if not batch:
+            return
+        deadline = time.monotonic() + INFERENCE_REQUEST_TIMEOUT
+        failed_servers = []
+        while True:
+            try:
+                server = self._scheduler.pick(exclude=failed_servers)
+                result = await self._post_batch(server, batch, endpoint, timeout=deadline - time.monotonic())
+            except Exception as e:
+                if (not is_worker_failure(e) or len(failed_servers) >= MAX_BATCH_RETRIES
+                        or deadline - time.monotonic() < 1):  # noqa: W503
+                    self._complete(batch, e)
+                    return
+                # another worker may still make it in time
+                failed_servers.append(server)
+                BATCH_RETRIES.inc()
+                logging.warning(f"Batch failed on {server}, sending it again: {e!r}")
+                continue
+            print('Received batch', [request[0] for request in batch])
+            self._complete(batch, result)
+            return
 
+    async def _post_batch(self, server: str, batch, endpoint: str, timeout: float) -> list:
+        # msgpack carries uploads as raw bytes, packed off the event loop as they may be large
+        data = {"batch": [request[1] for request in batch]}
+        payload = await asyncio.get_running_loop().run_in_executor(None, pack, data)
+        ticket = self._scheduler.start(server, [request[3] for request in batch])
+        succeeded = False
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{server}/api/predict", json=data,
-                                        timeout=INFERENCE_REQUEST_TIMEOUT) as result:
-                    if result.status == 408:
-                        raise TimeoutException()
-                    result.raise_for_status()
-                    result = await result.json()
-                    print('result', result)
-                    result = {request[0]: r for request, r in zip(batch, result)}
-
-                    self._responses.update(result)
+            async with self._session(server).post(f"{server}{endpoint}", data=payload,
+                                                  headers={"Accept": MSGPACK, "Content-Type": MSGPACK},
+                                                  timeout=timeout) as result:
+                if result.status == 408:
+                    raise TimeoutException()
+                result.raise_for_status()
+                body = await result.read()
+            encoding = "msgpack" if result.content_type == MSGPACK else "json"
+            RESPONSE_BYTES.labels("internal", encoding).observe(len(body))
+
+            def decode():
+                start_time = time.thread_time()
+                decoded = unpack(body) if encoding == "msgpack" else json.loads(body)
+                SERIALIZATION_CPU_SECONDS.labels("decode").observe(time.thread_time() - start_time)
+                return decoded
+
+            # in the executor that encodes responses, large batches would hold up the event loop
+            result = await asyncio.get_running_loop().run_in_executor(None, decode)
+            succeeded = True
+            return result
         except Exception as e:
-            result = {request[0]: e for request in batch}
-            self._responses.update(result)
+            if is_worker_failure(e):
+                self._record_failure(server, e, "batch")
+            raise
+        finally:
+            self._scheduler.finish(server, ticket, succeeded)
+            if succeeded:
+                self._breaker(server).record_success()
+
+    def _session(self, server: str) -> aiohttp.ClientSession:
+        """The long-lived session of a worker, created on first use inside the event loop."""
+        session = self._sessions.get(server)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=WORKER_CONNECTIONS,
+                                             # idle connections are dropped on our side before the worker drops them
+                                             keepalive_timeout=max(1.0, KEEP_ALIVE_TIMEOUT - 1))
+            session = self._sessions[server] = aiohttp.ClientSession(connector=connector)
+        return session
+
+    async def _close_sessions(self, servers: List[str]):
+        for server in servers:
+            session = self._sessions.pop(server, None)
+            if session is not None:
+                await session.close()
+
+    @staticmethod
+    def _complete(batch, results):
+        """Resolve the futures of a batch with their results, or all of them with the exception that failed it. A
+        sample that failed on its own (see :func:`~whisperer.utility.data_io.sample_error`) only fails its future."""
+        for i, (_, _, future, _) in enumerate(batch):
+            if future.done():
+                # cancelled by its caller
+                continue
+            if isinstance(results, Exception):
+                future.set_exception(results)
+            elif isinstance(results[i].get("error"), str):
+                future.set_exception(HTTPException(results[i]["status"], results[i]["error"]))
+            else:
+                future.set_result(results[i])
+
+    def _set_ready_servers(self, servers: List[str]):
+        self._ready_servers = servers
+        self._update_routing()
+
+    def _healthy_servers(self) -> List[str]:
+        return [server for server in self._ready_servers if not self._breaker(server).is_open]
+
+    def _update_routing(self):
+        servers = self._healthy_servers()
+        # requests stay queued until a worker has loaded its model or recovered
+        self._batcher.paused = not servers
+        self._scheduler.set_servers({server: self._capacity.get(server, 1) for server in servers})
+        OPEN_CIRCUITS.set(len(self._ready_servers) - len(servers))
+        self._update_free_slots()
+
+    def _breaker(self, server: str) -> CircuitBreaker:
+        breaker = self._breakers.get(server)
+        if breaker is None:
+            breaker = self._breakers[server] = CircuitBreaker(failure_threshold=CIRCUIT_BREAKER_FAILURES,
+                                                              reset_secs=CIRCUIT_BREAKER_RESET_SECS)
+        return breaker
+
+    def _record_failure(self, server: str, error: Exception, kind: str):
+        WORKER_FAILURES.labels(kind).inc()
+        if self._breaker(server).record_failure(unreachable=is_unreachable(error)):
+            logging.warning(f"Taking {server} out of the rotation: {error!r}")
+            self._update_routing()
+
+    async def watch_health(self):
+        """Probe the ready workers, failing ones leave the rotation and come back once they are ready again. A worker
+        that failed may have restarted, so it is probed on ``/api/ready`` until it has loaded its model."""
+        async with aiohttp.ClientSession() as session:
+            while True:
+                for server in list(self._ready_servers):
+                    recovering = self._breaker(server).is_open
+                    try:
+                        async with session.get(f"{server}/api/ready" if recovering else f"{server}/api/health",
+                                               timeout=HEALTH_CHECK_TIMEOUT) as response:
+                            response.raise_for_status()
+                            if recovering:
+                                self._capacity[server] = (await response.json()).get("replicas", 1)
+                    except Exception as e:
+                        self._record_failure(server, e, "probe")
+                        continue
+                    if self._breaker(server).record_success(probe=True):
+                        print("server recovered:", server)
+                        self._update_routing()
+                await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+    async def watch_readiness(self):
+        """Probe the workers that are not ready yet, new workers join the rotation once their model is warm."""
+        async with aiohttp.ClientSession() as session:
+            while True:
+                ready = []
+                for server in self.servers:
+                    if server not in self._ready_servers:
+                        try:
+                            async with session.get(f"{server}/api/ready", timeout=5) as response:
+                                if response.status != 200:
+                                    continue
+                                ready_info = await response.json()
+                                self._capacity[server] = ready_info.get("replicas", 1)
+                                print("server ready:", server, ready_info)
+                        except Exception:
+                            continue
+                    ready.append(server)
+
+                if ready != self._ready_servers:
+                    self._set_ready_servers(ready)
+                await asyncio.sleep(1)
+
+    def _batch_limits(self, tier: str) -> Tuple[int, float]:
+        max_batch_size = SERVICE_TIERS[tier].max_batch_size or self.max_batch_size
+        batch_timeout_secs = SERVICE_TIERS[tier].batch_timeout_secs
+        if batch_timeout_secs is None:
+            batch_timeout_secs = self.batch_timeout_secs
+        return max_batch_size, batch_timeout_secs
+
+    @staticmethod
+    def _batch_key(data: Data, endpoint: str) -> tuple:
+        return data.tier, resolve_model(data), endpoint
+
+    def _enqueue(self, data: Data, endpoint: str, request: tuple):
+        self._batcher.put(self._batch_key(data, endpoint), request, *self._batch_limits(data.tier),
+                          audio_secs=request[3], max_batch_audio_secs=MAX_BATCH_AUDIO_SECS)
+
+    def _update_free_slots(self):
+        capacity = sum(self._capacity.get(server, 1) for server in self._healthy_servers())
+        self._batcher.free_slots = capacity - self._inflight
+        self._batcher.wake()
+
+    def _batch_done(self, task: asyncio.Task):
+        self._inflight -= 1
+        self._update_free_slots()
 
     async def consumer(self):
+        """Send batches as soon as they are full, their oldest request has waited its tier's batch timeout, or a
+        worker is idle."""
         while True:
-            await asyncio.sleep(0.1)
-
-            has_sent = False
-
-            for quality in self._batch.keys():
-                batch = self._batch[quality][:self.max_batch_size]
-                while batch and ((len(batch) >= self.max_batch_size) or (
-                    (time.time() - self._last_batch_sent) > self.batch_timeout_secs)  # noqa: W503
-                                 ):
-                    has_sent = True
-
-                    asyncio.create_task(self.send_batch(batch))
-                    print('Sent batch', batch)
-                    self._batch[quality] = self._batch[quality][self.max_batch_size:]
-                    batch = self._batch[quality][:self.max_batch_size]
-
-            if has_sent:
-                self._last_batch_sent = time.time()
+            for (tier, _, endpoint), batch, waits in await self._batcher.next_batches():
+                for wait in waits:
+                    BATCH_QUEUE_WAIT.labels(tier).observe(wait)
+                self._inflight += 1
+                asyncio.create_task(self.send_batch(batch, endpoint)).add_done_callback(self._batch_done)
+                print('Sent batch', [request[0] for request in batch])
+
+    @staticmethod
+    def _source_id(data: Data) -> str:
+        if data.audio_bytes is not None:
+            return "sha256:" + hashlib.sha256(data.audio_bytes).hexdigest()
+        if data.audio_data is not None:
+            # uploads are cached by content, whoever sends them
+            return "sha256:" + hashlib.sha256(data.audio_data.encode("ascii")).hexdigest()
+        if data.audio_path is not None:
+            return "file:" + data.audio_path
+        return extract_video_id(data.video_url)
+
+    @staticmethod
+    def _cache_key(data: Data, task: str = "transcribe", source_id: Optional[str] = None) -> str:
+        """The cache key of a request, ``source_id`` saves hashing an upload again if it is known."""
+        options = data.dict(exclude={"video_url", "audio_path", "audio_data", "audio_bytes", "model"})
+        if task != "transcribe":
+            # only transcripts have response profiles
+            options["task"] = task
+            del options["response"]
+        elif options["response"] == "full":
+            # full transcripts keep their original keys
+            del options["response"]
+        return cache_key(source_id or LoadBalancer._source_id(data), resolve_model(data), options)
+
+    async def cached_transcript(self, data: Data, source_id: Optional[str] = None) -> Optional[dict]:
+        """A cached transcript in the response profile of a request, cut down from the full one if need be."""
+        keys = [self._cache_key(data, source_id=source_id)]
+        if data.response != "full":
+            keys.append(self._cache_key(data.copy(update={"response": "full"}), source_id=source_id))
+        transcript = await asyncio.get_running_loop().run_in_executor(None, self._cache.get, *keys)
+        if transcript is not None and data.response != "full":
+            # shaping a transcript of the profile already is a no-op
+            transcript = shape_transcript(transcript, data.response)
+        return transcript
+
+    @staticmethod
+    async def respond(request: Request, content) -> Response:
+        """Encode a JSON response in the default executor, large transcripts would hold up the event loop."""
+
+        def encode():
+            start_time = time.thread_time()
+            body, headers = encode_json(content, accept_gzip="gzip" in request.headers.get("accept-encoding", ""))
+            SERIALIZATION_CPU_SECONDS.labels("encode").observe(time.thread_time() - start_time)
+            RESPONSE_BYTES.labels("client", headers.get("Content-Encoding", "identity")).observe(len(body))
+            return Response(body, media_type="application/json", headers=headers)
+
+        return await asyncio.get_running_loop().run_in_executor(None, encode)
+
+    @staticmethod
+    async def read_upload(request: Request) -> Tuple[bytes, str]:
+        """Read an uploaded audio file from the request body, rejecting it as soon as it is over the size limit.
+        Returns the file and its source ID, hashed chunk by chunk as they arrive."""
+        chunks, size, digest = [], 0, hashlib.sha256()
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(413, f"Please upload files smaller than {MAX_UPLOAD_BYTES // 2**20} MB.")
+            chunks.append(chunk)
+            digest.update(chunk)
+        if not size:
+            raise HTTPException(400, "The request body is empty, send the audio file as the body.")
+        return b"".join(chunks), "sha256:" + digest.hexdigest()
+
+    async def resolve_video(self, data: Data, check_budget: bool = True) -> VideoMetadata:
+        """Look up the video before it takes a batch slot and reject the ones over the compute budget."""
+        try:
+            metadata = await self._resolver.resolve_async(data.video_url)
+            if check_budget:
+                check_duration(metadata, MAX_AUDIO_SECS)
+        except ValueError as e:
+            raise HTTPException(400, e.args[0])
+        except Exception as e:
+            logging.exception(e)
+            raise HTTPException(400, f"Could not load the video {data.video_url}.")
+        return metadata
+
+    async def process_request(self, data: Data, audio_secs: Optional[float] = None, source_id: Optional[str] = None):
+        """Transcribe a request, from the cache if possible. ``audio_secs`` is the length of an upload, if known,
+        videos are looked up. ``source_id`` is the hash of an upload, if known."""
+        start_time = time.time()
+        source_id = source_id or self._source_id(data)
+        transcript = await self.cached_transcript(data, source_id)
+        if transcript is None:
+            if not self.servers:
+                raise HTTPException(500, "None of the workers are healthy!")
+            key = self._cache_key(data, source_id=source_id)
+            if key in self._single_flight:
+                COALESCED_REQUESTS.labels(data.tier).inc()
+            transcript = await self._single_flight.run(key, lambda: self._transcribe(data, audio_secs, key))
+        REQUEST_LATENCY.labels(data.tier).observe(time.time() - start_time)
+        return {data.source: transcript}
+
+    async def _transcribe(self, data: Data, audio_secs: Optional[float], key: str) -> dict:
+        if data.video_url is not None:
+            audio_secs = (await self.resolve_video(data)).duration
+        result = await self.run_batched(data, "/api/predict", audio_secs)
+        transcript = next(iter(result.values()))
+        await asyncio.get_running_loop().run_in_executor(None, self._cache.put, key, transcript)
+        return transcript
+
+    async def run_batched(self, data: Data, endpoint: str, audio_secs: Optional[float] = None):
+        """Queue a request for the next batch sent to ``endpoint`` of a worker and wait for its result.
+
+        The batch that carries the request resolves its future, waiting costs nothing until then. ``audio_secs`` is
+        the length of the audio the worker decodes, if known, for scheduling. Requests are refused while no worker is
+        ready, and a request that is not answered within ``INFERENCE_REQUEST_TIMEOUT`` of being queued times out,
+        even if the queues are held because every worker is failing.
+        """
+        if not self._healthy_servers():
+            raise HTTPException(503, "None of the workers are ready yet.")
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        request = (request_id, data.dict(), future, audio_secs)
+        self._enqueue(data, endpoint, request)
+        try:
+            return await asyncio.wait_for(future, INFERENCE_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            # a batch sent later must not carry it
+            self._batcher.discard(self._batch_key(data, endpoint), request)
+            raise TimeoutException()
+        except Exception as e:
+            raise_granular_exception(e)
+            raise
+
+    async def detect_language_request(self, data: Data):
+        loop = asyncio.get_running_loop()
+        source_id = self._source_id(data)
+        key = self._cache_key(data, "detect-language", source_id)
+        language = await loop.run_in_executor(None, self._cache.get, key)
+        if language is None:
+            # a cached transcript knows the language as well
+            transcript = await self.cached_transcript(data, source_id)
+            if transcript is not None and transcript["language"] is not None:
+                language = {"language": transcript["language"], "probability": None}
+        if language is not None:
+            return {data.source: language}
 
-    async def process_request(self, data: Data):
         if not self.servers:
             raise HTTPException(500, "None of the workers are healthy!")
+        audio_secs = None
+        if data.video_url is not None:
+            # only the first 30 seconds are decoded, long videos are fine
+            audio_secs = min((await self.resolve_video(data, check_budget=False)).duration, 30.0)
+
+        result = await self.run_batched(data, "/api/detect-language", audio_secs)
+        await loop.run_in_executor(None, self._cache.put, key, next(iter(result.values())))
+        return result
+
+    async def _observe_stream(self, lines: List[bytes], segments: list, key: str, start_time: float) -> bool:
+        """Record the latency of the events of a relayed stream and collect its segments, whether it is done. The
+        transcript of a finished stream is cached."""
+        done = False
+        for line in lines:
+            event = json.loads(line)
+            if event["event"] == "segment":
+                if not segments:
+                    STREAM_TIME_TO_FIRST_SEGMENT.observe(time.time() - start_time)
+                segments.append(event["data"])
+            elif event["event"] == "done":
+                STREAM_LATENCY.observe(time.time() - start_time)
+                done = True
+                transcript = {**event["data"], "segments": segments}
+                await asyncio.get_running_loop().run_in_executor(None, self._cache.put, key, transcript)
+        return done
+
+    def _stream_error(self, server: str, error: Exception) -> bytes:
+        """The last event of a relayed stream that failed, with the status and detail a failed batch would get."""
+        if is_worker_failure(error):
+            self._record_failure(server, error, "stream")
+        try:
+            raise_granular_exception(error)
+        except HTTPException as e:
+            return ndjson_event("error", {"status": e.status_code, "detail": e.detail})
+
+    async def stream_request(self, data: Data, audio_secs: Optional[float] = None):
+        loop = asyncio.get_running_loop()
+        # streams always send full segments
+        key = self._cache_key(data.copy(update={"response": "full"}))
+        transcript = await loop.run_in_executor(None, self._cache.get, key)
+        if transcript is not None:
+            for segment in transcript["segments"]:
+                yield ndjson_event("segment", segment)
+            yield ndjson_event("done", {"text": transcript["text"], "language": transcript["language"]})
+            return
 
-        request_id = uuid.uuid4().hex
-        request = (request_id, data.dict())
-        self._batch["high"].append(request)
-
-        while True:
-            await asyncio.sleep(0.1)
+        if not self._healthy_servers():
+            yield ndjson_event("error", {"status": 503, "detail": "None of the workers are ready yet."})
+            return
 
-            if request_id in self._responses:
-                result = self._responses[request_id]
-                del self._responses[request_id]
-                raise_granular_exception(result)
-                return result
+        server = self._scheduler.pick()
+        ticket = self._scheduler.start(server, [audio_secs])
+        start_time = time.time()
+        segments = []
+        pending = b""
+        succeeded = False
+        try:
+            async with self._session(server).post(f"{server}/api/predict/stream", json=data.dict(),
+                                                  timeout=INFERENCE_REQUEST_TIMEOUT) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_any():
+                    # relay first, then look at the events for the metrics and the cache
+                    yield chunk
+                    *lines, pending = (pending + chunk).split(b"\n")
+                    if await self._observe_stream(lines, segments, key, start_time):
+                        succeeded = True
+        except Exception as e:
+            yield self._stream_error(server, e)
+        finally:
+            self._scheduler.finish(server, ticket, succeeded)
 
     def run(self, servers: List[str]):
         if self._server_ready or not servers:
@@ -128,13 +555,18 @@ class LoadBalancer(L.LightningWork):
         import uvicorn
         from fastapi import Depends, FastAPI, Header
         from fastapi.middleware.cors import CORSMiddleware
+        from fastapi.responses import StreamingResponse
         from fastapi.security import HTTPBasic, HTTPBasicCredentials
         from starlette_exporter import PrometheusMiddleware, handle_metrics
 
         print(self.servers)
 
-        self._ITER = cycle(self.servers)
-        self._last_batch_sent = time.time()
+        self._set_ready_servers([])
+        self._cache = TranscriptCache(max_items=TRANSCRIPT_CACHE_SIZE,
+                                      directory=TRANSCRIPT_CACHE_DIR,
+                                      ttl_secs=TRANSCRIPT_CACHE_TTL,
+                                      max_disk_items=TRANSCRIPT_CACHE_DISK_SIZE)
+        self._resolver = default_resolver()
 
         app = FastAPI()
         security = HTTPBasic()
@@ -153,10 +585,12 @@ class LoadBalancer(L.LightningWork):
         app.num_current_requests = 0
         app.last_process_time = 0
         app.SEND_TASK = None
+        app.READINESS_TASK = None
+        app.HEALTH_TASK = None
 
         @app.middleware("http")
         async def current_request_counter(request: Request, call_next):
-            if not request.scope["path"] == "/api/predict":
+            if request.scope["path"] not in ("/api/predict", "/api/predict/upload", "/api/detect-language"):
                 return await call_next(request)
             app.global_request_count += 1
             app.num_current_requests += 1
@@ -183,18 +617,23 @@ class LoadBalancer(L.LightningWork):
             authenticate=auth_function,
             backend=MemoryBackend(),
             config={
-                r"^/api/predict": RULES,
+                r"^/api/(predict|detect-language)": RULES,
             },
         )
 
         @app.on_event("startup")
         async def startup_event():
             app.SEND_TASK = asyncio.create_task(self.consumer())
+            app.READINESS_TASK = asyncio.create_task(self.watch_readiness())
+            app.HEALTH_TASK = asyncio.create_task(self.watch_health())
             self._server_ready = True
 
         @app.on_event("shutdown")
-        def shutdown_event():
+        async def shutdown_event():
             app.SEND_TASK.cancel()
+            app.READINESS_TASK.cancel()
+            app.HEALTH_TASK.cancel()
+            await self._close_sessions(list(self._sessions))
             self._server_ready = False
 
         def authenticate_private_endpoint(credentials: HTTPBasicCredentials = Depends(security)):
@@ -214,6 +653,7 @@ class LoadBalancer(L.LightningWork):
         async def sys_info(authenticated: bool = Depends(authenticate_private_endpoint)):
             return SysInfo(
                 num_workers=len(self.servers),
+                capacity=sum(self._capacity.get(server, 1) for server in self._healthy_servers()),
                 servers=self.servers,
                 num_requests=app.num_current_requests,
                 process_time=app.last_process_time,
@@ -227,7 +667,11 @@ class LoadBalancer(L.LightningWork):
         @app.put("/system/update-servers")
         async def update_servers(servers: List[str], authenticated: bool = Depends(authenticate_private_endpoint)):
             self.servers = servers
-            self._ITER = cycle(self.servers)
+            # removed workers leave the rotation right away, new ones join once they are ready
+            self._set_ready_servers([server for server in self._ready_servers if server in servers])
+            await self._close_sessions([server for server in self._sessions if server not in servers])
+            for server in [server for server in self._breakers if server not in servers]:
+                del self._breakers[server]
 
         @app.post("/api/surprise-me")
         async def surprise_me():
@@ -235,8 +679,39 @@ class LoadBalancer(L.LightningWork):
             return await self.process_request(data)
 
         @app.post("/api/predict")
-        async def balance_api(data: Data, x_api_key: str = Header(default=None)):
-            return await self.process_request(data)
+        async def balance_api(data: Data, request: Request, x_api_key: str = Header(default=None)):
+            return await self.respond(request, await self.process_request(data))
+
+        @app.post("/api/predict/upload")
+        async def upload_api(request: Request,
+                             model: Optional[str] = None,
+                             tier: str = DEFAULT_TIER,
+                             response: str = "full",
+                             x_api_key: str = Header(default=None)):
+            """Transcribe the audio file sent as the request body, e.g. ``curl --data-binary @audio.mp3``."""
+            audio, source_id = await self.read_upload(request)
+            try:
+                data = Data(audio_bytes=audio, model=model, tier=tier, response=response)
+            except ValidationError as e:
+                raise HTTPException(422, e.errors())
+            # for batching with clips of similar length, the workers check the length again while decoding
+            audio_secs = await asyncio.get_running_loop().run_in_executor(None, probe_duration, audio)
+            if audio_secs is not None and audio_secs > MAX_AUDIO_SECS:
+                raise HTTPException(400, f"Please upload audio shorter than {MAX_AUDIO_SECS / 60:g} minutes.")
+            return await self.respond(request, await self.process_request(data, audio_secs, source_id))
+
+        @app.post("/api/detect-language")
+        async def detect_language_api(data: Data, request: Request, x_api_key: str = Header(default=None)):
+            return await self.respond(request, await self.detect_language_request(data))
+
+        @app.post("/api/predict/stream")
+        async def balance_stream_api(data: Data, x_api_key: str = Header(default=None)):
+            if not self.servers:
+                raise HTTPException(500, "None of the workers are healthy!")
+            audio_secs = None
+            if data.video_url is not None:
+                audio_secs = (await self.resolve_video(data)).duration
+            return StreamingResponse(self.stream_request(data, audio_secs), media_type="application/x-ndjson")
 
         uvicorn.run(app,
                     host=self.host,
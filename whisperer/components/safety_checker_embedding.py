@@ -2,7 +2,6 @@ import os
 from typing import List, Optional
 
 import lightning as L
-import torch
 from lightning import BuildConfig, LightningWork
 from lightning.app.storage import Drive
 
@@ -26,7 +25,7 @@ class SafetyCheckerEmbedding(LightningWork):
         self.safety_embeddings_filename = "safety_embedding.pt"
 
     def run(self):
-
+        import torch
         from flash import Trainer
         from flash.text import TextClassificationData, TextClassifier
 
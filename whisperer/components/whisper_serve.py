@@ -1,64 +1,323 @@
+import json
+import logging
+import queue
+import threading
 import time
-from typing import List
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
 
 import lightning as L
-import torch
 
-from whisperer.CONST import INFERENCE_REQUEST_TIMEOUT, KEEP_ALIVE_TIMEOUT
-from whisperer.models import WhisperModel
-from whisperer.utility.data_io import Data, DataBatch, TimeoutException
+from whisperer.CONST import (
+    AUDIO_PREFETCH_DEPTH,
+    AUDIO_PREFETCH_WORKERS,
+    INFERENCE_REQUEST_TIMEOUT,
+    KEEP_ALIVE_TIMEOUT,
+    WHISPER_REPLICA_THREADS,
+    WHISPER_REPLICAS,
+)
+from whisperer.models import AudioFetcher, AudioPrefetcher
+from whisperer.models.audio import N_SAMPLES, SAMPLE_RATE, AudioSource
+from whisperer.utility.cancellation import CancelToken, RequestCancelled
+from whisperer.utility.data_io import Data, DataBatch, TimeoutException, ndjson_event, sample_error
+from whisperer.utility.metrics import CANCELLED_REQUESTS, STARTUP_PHASE_SECONDS, WASTED_COMPUTE_SECONDS
+from whisperer.utility.serialization import MSGPACK, pack, shape_transcript, unpack
 
 
 class WhisperServe(L.LightningWork):
-    """The WhisperServe handles the prediction.
+    r"""The WhisperServe handles the prediction.
 
-    It initializes a model and expose an API to handle incoming requests and generate predictions.
+    It initializes a model and expose an API to handle incoming requests and generate predictions. The audio of
+    incoming batches is downloaded and decoded by a pool of prefetch workers while the model is busy with the
+    previous batch. Requests may ask for a Whisper checkpoint, the checkpoints are loaded on demand and the least
+    recently used ones are released once ``MAX_LOADED_MODELS`` are resident. ``/api/predict/stream`` sends the
+    segments of a single clip as NDJSON events while they are decoded. ``/api/detect-language`` only downloads and
+    encodes the first 30 seconds of every clip and runs a single decoder step on them.
+
+    Besides YouTube videos, requests may send the audio itself, which is piped into ffmpeg as it is, or the path of a
+    file under ``LOCAL_AUDIO_DIR`` on the worker. Transcripts are cut down to the response profile of their request
+    before they are sent, as msgpack when the caller accepts it. A request whose file is missing or whose audio cannot
+    be loaded fails on its own with an error in place of its result, the rest of its batch is transcribed.
+
+    On CPU nodes, ``num_replicas`` model replicas run in their own processes on separate slices of the cores, and
+    that many batches are processed at once.
+
+    A request that times out or whose stream is closed is cancelled, its download, audio decoding and decoding loop
+    stop at their next check, at the latest after one more 30-second window.
+
+    torch and the weights are loaded on a background thread while the server boots, audio downloads of early requests
+    already start in the meantime. ``/api/ready`` answers 503 until the default model is loaded and warmed up, then
+    the number of replicas and the duration of each startup phase.
+
+    Args:
+        prefetch_workers: Number of clips downloaded and decoded concurrently.
+        prefetch_depth: Number of batches prepared ahead of the model before requests start to block.
+        num_replicas: Number of model replicas. A single replica runs in the server process, more than one all run
+            in processes of their own (see :class:`~whisperer.models.replicas.ReplicaPool`).
+        replica_threads: Torch threads of every replica, its share of the cores by default.
+        \**kwargs: Arguments passed to :func:`LightningWork.init` like ``CloudCompute``, ``BuildConfig``, etc.
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self,
+                 prefetch_workers=AUDIO_PREFETCH_WORKERS,
+                 prefetch_depth=AUDIO_PREFETCH_DEPTH,
+                 num_replicas=WHISPER_REPLICAS,
+                 replica_threads=WHISPER_REPLICA_THREADS,
+                 **kwargs):
         super().__init__(**kwargs)
-        self._model = None
+        self.prefetch_workers = prefetch_workers
+        self.prefetch_depth = prefetch_depth
+        self.num_replicas = num_replicas
+        self.replica_threads = replica_threads
+        self._models = None
+        self._replicas = None
+        self._pool = None
+        self._fetcher = None
+        self._prefetcher = None
+        self._ready = None
+        self._startup_error = None
+        self._startup_times = {}  # {phase: seconds}
+
+    def _record_phase(self, phase: str, seconds: float):
+        self._startup_times[phase] = round(seconds, 3)
+        STARTUP_PHASE_SECONDS.labels(phase).set(seconds)
+
+    @contextmanager
+    def _phase(self, phase: str):
+        start_time = time.time()
+        yield
+        self._record_phase(phase, time.time() - start_time)
 
     def build_model(self):
-        """The `build_model(...)` method returns a model and the returned model is set to `self._model` state."""
+        """The `build_model(...)` method creates the model registry, then downloads, loads and warms up the default
+        model."""
+        with self._phase("import"):
+            from whisperer.models import ModelRegistry
 
-        print("loading model...")
-        self._model = WhisperModel()
-        print("model loaded")
+        models = ModelRegistry(fetcher=self._fetcher)
+        with self._phase("download"):
+            models.prefetch()
 
-    @torch.inference_mode()
-    def predict(self, video_urls: List[Data], entry_time: int):
-        if time.time() - entry_time > INFERENCE_REQUEST_TIMEOUT:
-            raise TimeoutException()
+        if self._replicas is not None:
+            # the replicas load from the local cache in parallel
+            for phase, seconds in self._replicas.start().items():
+                self._record_phase(phase, seconds)
+            return
 
-        torch.cuda.empty_cache()
-        results = self._model(video_urls)
-        return results
+        with self._phase("load"):
+            model = models.get()
+        with self._phase("warmup"):
+            model.warmup()
+        self._models = models
 
-    def run(self):
+    def warm_start(self, start_time: float):
         import subprocess
 
-        import uvicorn
-        from fastapi import FastAPI
-        from fastapi.middleware.cors import CORSMiddleware
+        import torch
 
         if torch.cuda.is_available():
             subprocess.run("nvidia-smi", shell=True)
-
-        if self._model is None:
+        try:
             self.build_model()
+            self._record_phase("ready", time.time() - start_time)
+        except Exception as e:
+            logging.exception(e)
+            self._startup_error = e
+        finally:
+            self._ready.set()
+
+    def wait_ready(self):
+        if not self._ready.wait(INFERENCE_REQUEST_TIMEOUT):
+            raise TimeoutException()
+        if self._startup_error is not None:
+            raise RuntimeError(f"The model failed to load: {self._startup_error}")
+
+    def cancel_token(self, deadline: Optional[float] = None) -> CancelToken:
+        if self._replicas is not None:
+            return self._replicas.cancel_token(deadline)
+        return CancelToken(deadline)
+
+    def load_audio(self, sample: Data, cancel: CancelToken, max_secs: Optional[float] = None):
+        start_time = time.time()
+        try:
+            return self._fetcher.load(sample, cancel, max_secs)
+        except RequestCancelled:
+            WASTED_COMPUTE_SECONDS.labels("audio").inc(time.time() - start_time)
+            raise
+
+    def check_sample(self, sample: Data) -> Optional[dict]:
+        """The error of a local file that is missing or outside ``LOCAL_AUDIO_DIR``, checked before its audio is
+        fetched. Videos were looked up by the load balancer already, uploads fail on their own if they cannot be
+        decoded."""
+        if sample.audio_path is None:
+            return None
+        try:
+            self._fetcher.local_path(sample.audio_path)
+        except ValueError as e:
+            return sample_error(e)
+        return None
+
+    def predict(self, video_urls: List[Data], audios: List[Future], cancel: CancelToken, detect_language=False):
+        audios = self._prefetcher.collect(audios)
+        self.wait_ready()
+        cancel.check()
+
+        # samples whose audio could not be loaded fail on their own, the rest of the batch goes on
+        loaded = [i for i, audio in enumerate(audios) if not isinstance(audio, Exception)]
+        results = [sample_error(audio) if isinstance(audio, Exception) else None for audio in audios]
+        if not loaded:
+            return results
+
+        start_time = time.time()
+        backend = self._replicas or self._models
+        samples, sample_audios = [video_urls[i] for i in loaded], [audios[i] for i in loaded]
+        try:
+            if detect_language:
+                outputs = backend.detect_language(samples, sample_audios, cancel)
+            else:
+                outputs = [{source: shape_transcript(transcript, sample.response)
+                            for source, transcript in result.items()}
+                           for sample, result in zip(samples, backend.transcribe(samples, sample_audios, cancel))]
+        except RequestCancelled:
+            WASTED_COMPUTE_SECONDS.labels("inference").inc(time.time() - start_time)
+            raise
+        for i, output in zip(loaded, outputs):
+            results[i] = output
+        return results
+
+    def predict_stream(self, data: Data, source: AudioSource, events: queue.Queue, cancel: CancelToken):
+        start_time = time.time()
+        try:
+            self.wait_ready()
+            (self._replicas or self._models).stream(data, source, events, cancel)
+        except RequestCancelled:
+            WASTED_COMPUTE_SECONDS.labels("stream").inc(time.time() - start_time)
+        except Exception as e:
+            events.put(ndjson_event("error", {"detail": str(e)}))
+        finally:
+            events.put(None)
+
+    def start_model(self, start_time: float):
+        """Create the audio prefetcher and start loading the model in the background, unless it is loaded already."""
+        self._ready = threading.Event()
+        self._fetcher = AudioFetcher()
+        self._prefetcher = AudioPrefetcher(self.load_audio,
+                                           num_workers=self.prefetch_workers,
+                                           queue_depth=self.prefetch_depth * self.num_replicas)
+        if self._models is None and self._replicas is None:
+            if self.num_replicas > 1:
+                from whisperer.models.replicas import ReplicaPool
+
+                self._replicas = ReplicaPool(self.num_replicas, self.replica_threads or None)
+            # the model loads while uvicorn boots
+            threading.Thread(target=self.warm_start, args=(start_time, ), name="warm-start", daemon=True).start()
+        else:
+            self._ready.set()
+
+    def submit_batch(self, data: DataBatch, detect_language: bool = False) -> list:
+        cancel = self.cancel_token(deadline=time.time() + INFERENCE_REQUEST_TIMEOUT)
+        try:
+            print(f"batch size: {len(data.batch)}")
+            # bad files are answered right away instead of taking a prefetch slot
+            errors = [self.check_sample(sample) for sample in data.batch]
+            batch = [sample for sample, error in zip(data.batch, errors) if error is None]
+            if not batch:
+                return errors
+            # starts downloading right away; blocks while `prefetch_depth` batches are already waiting
+            max_secs = N_SAMPLES / SAMPLE_RATE if detect_language else None
+            audios = self._prefetcher.submit(batch, cancel, max_secs)
+            results = iter(self._pool.submit(
+                self.predict,
+                batch,
+                audios,
+                cancel,
+                detect_language,
+            ).result(timeout=INFERENCE_REQUEST_TIMEOUT))
+            return [error or next(results) for error in errors]
+        except (TimeoutError, TimeoutException, RequestCancelled):
+            # the work stops at its next check instead of holding the pool for the requests behind it
+            cancel.cancel()
+            CANCELLED_REQUESTS.inc()
+            raise TimeoutException()
+
+    def stream(self, data: Data, source: AudioSource) -> Iterator[bytes]:
+        """Start transcribing a single request and yield its NDJSON events as they are decoded."""
+        # replica processes cannot put on a local queue
+        events = self._replicas.queue() if self._replicas is not None else queue.Queue()
+        cancel = self.cancel_token()
+        self._pool.submit(self.predict_stream, data, source, events, cancel)
+        finished = False
+        try:
+            while True:
+                event = events.get(timeout=INFERENCE_REQUEST_TIMEOUT)
+                if event is None:
+                    finished = True
+                    return
+                yield event
+        finally:
+            if not finished:
+                # the client went away or stopped receiving, stop decoding for it
+                cancel.cancel()
+                CANCELLED_REQUESTS.inc()
+
+    def readiness(self) -> dict:
+        """The load balancer only routes to a worker once this returns its capacity and startup phase timings."""
+        from fastapi import HTTPException
+
+        if self._startup_error is not None:
+            raise HTTPException(500, f"The model failed to load: {self._startup_error}")
+        if not self._ready.is_set():
+            raise HTTPException(503, "The model is loading.")
+        return {"replicas": self.num_replicas, "phases": self._startup_times}
+
+    @staticmethod
+    def parse_batch(body: bytes, content_type: str) -> DataBatch:
+        """A batch sent as msgpack by the load balancer, uploads included as raw bytes, or as JSON by other clients."""
+        from fastapi import HTTPException
+        from pydantic import ValidationError
+
+        try:
+            return DataBatch.parse_obj(unpack(body) if MSGPACK in content_type else json.loads(body))
+        except ValidationError as e:
+            raise HTTPException(422, e.errors())
+        except ValueError:
+            raise HTTPException(400, "The request body is not a valid batch.")
+
+    def answer_batch(self, body: bytes, request, detect_language: bool = False):
+        batch = self.parse_batch(body, request.headers.get("content-type", ""))
+        return self.respond(self.submit_batch(batch, detect_language), request)
+
+    @staticmethod
+    def respond(result, request):
+        from fastapi import Response
+
+        if MSGPACK in request.headers.get("accept", ""):
+            return Response(pack(result), media_type=MSGPACK)
+        return result
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+        self._prefetcher.shutdown()
+        if self._replicas is not None:
+            self._replicas.shutdown()
+
+    def build_app(self, start_time: float):
+        from fastapi import FastAPI, HTTPException, Request
+        from fastapi.concurrency import run_in_threadpool
+        from fastapi.middleware.cors import CORSMiddleware
+        from fastapi.responses import StreamingResponse
+        from starlette_exporter import handle_metrics
 
         self._fastapi_app = app = FastAPI()
-        app.POOL: ThreadPoolExecutor = None
 
         @app.on_event("startup")
         def startup_event():
-            app.POOL = ThreadPoolExecutor(max_workers=1)
+            # one batch in flight per replica
+            self._pool = ThreadPoolExecutor(max_workers=self.num_replicas)
+            self._record_phase("server", time.time() - start_time)
 
-        @app.on_event("shutdown")
-        def shutdown_event():
-            app.POOL.shutdown(wait=False)
+        app.on_event("shutdown")(self.shutdown)
 
         app.add_middleware(
             CORSMiddleware,
@@ -68,34 +327,50 @@ class WhisperServe(L.LightningWork):
             allow_headers=["*"],
         )
 
+        app.add_route("/metrics", handle_metrics)
+
         @app.get("/api/health")
         def health():
             return True
 
+        app.get("/api/ready")(self.readiness)
+
         @app.post("/api/predict")
-        def predict_api(data: DataBatch):
+        async def predict_api(request: Request):
             """Dream a muse. Defines the REST API which takes the text prompt, number of images and image size in the
             request body.
 
             This API returns an image generated by the model in base64 format.
             """
+            return await run_in_threadpool(self.answer_batch, await request.body(), request)
+
+        @app.post("/api/detect-language")
+        async def detect_language_api(request: Request):
+            """Detect the spoken language of a batch of videos from their first 30 seconds."""
+            return await run_in_threadpool(self.answer_batch, await request.body(), request, True)
+
+        @app.post("/api/predict/stream")
+        def predict_stream_api(data: Data):
+            """Transcribe a single request and stream its segments as newline-delimited JSON events."""
             try:
-                entry_time = time.time()
-                print(f"batch size: {len(data.batch)}")
-                result = app.POOL.submit(
-                    self.predict,
-                    data.batch,
-                    entry_time=entry_time,
-                ).result(timeout=INFERENCE_REQUEST_TIMEOUT)
-                return result
-            except (TimeoutError, TimeoutException):
-                # hack: once there is a timeout then all requests after that is getting timeout
-                # old_pool = app.POOL
-                # app.POOL = ThreadPoolExecutor(max_workers=1)
-                # old_pool.shutdown(wait=False)
-                # signal.signal(signal.SIGINT, lambda sig, frame: exit_threads(old_pool))
-                raise TimeoutException()
+                source, _ = self._fetcher.resolve(data)
+            except ValueError as e:
+                raise HTTPException(400, e.args[0])
+            return StreamingResponse(self.stream(data, source), media_type="application/x-ndjson")
+
+        return app
+
+    def run(self):
+        start_time = time.time()
+        with self._phase("server_import"):
+            # timed here, `build_app` takes them from the module cache
+            import fastapi.middleware.cors  # noqa: F401
+            import fastapi.responses  # noqa: F401
+            import starlette_exporter  # noqa: F401
+            import uvicorn
 
+        self.start_model(start_time)
+        app = self.build_app(start_time)
         uvicorn.run(app,
                     host=self.host,
                     port=self.port,
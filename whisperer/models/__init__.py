@@ -1,3 +1,18 @@
-from .pipeline import WhisperModel
+import importlib
 
-__all__ = ["WhisperModel"]
+# torch and whisper are imported on first use, so that importing the components stays fast
+_EXPORTS = {
+    "AudioFetcher": ".audio",
+    "AudioPrefetcher": ".prefetch",
+    "ModelRegistry": ".registry",
+    "ReplicaPool": ".replicas",
+    "WhisperModel": ".pipeline",
+}
+
+__all__ = ["AudioFetcher", "WhisperModel", "AudioPrefetcher", "ModelRegistry", "ReplicaPool"]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
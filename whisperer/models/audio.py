@@ -0,0 +1,232 @@
+"""Memory-bounded replacements for ``whisper.load_audio``.
+
+``whisper.load_audio`` collects the whole ffmpeg output in one bytes object and converts it to float32 in two more
+full-size steps. Here the PCM stream is read in fixed-size blocks and converted straight into the float32 output.
+
+Sources are anything ffmpeg can open, or the bytes of an encoded audio file, which are piped into ffmpeg's stdin
+without a temporary file. Containers with their index at the end, like MP4 files without ``faststart``, cannot be
+decoded from a pipe.
+"""
+import base64
+import itertools
+import os
+import subprocess
+import threading
+from typing import Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from whisperer.CONST import LOCAL_AUDIO_DIR, MAX_AUDIO_SECS
+from whisperer.utility.cancellation import CancelToken
+from whisperer.utility.youtube import MetadataResolver, check_duration, default_resolver
+
+SAMPLE_RATE = 16000
+N_SAMPLES = 30 * SAMPLE_RATE  # one 30-second window
+BLOCK_SAMPLES = SAMPLE_RATE  # read one second of PCM at a time
+
+AudioSource = Union[str, bytes]
+
+
+def _feed(stdin, data: bytes):
+    try:
+        with stdin:
+            stdin.write(data)
+    except BrokenPipeError:
+        # ffmpeg stopped reading, it reached `max_secs` or was killed
+        pass
+
+
+def _open_ffmpeg(source: AudioSource, sr: int, max_secs: Optional[float] = None) -> subprocess.Popen:
+    piped = isinstance(source, bytes)
+    cmd = [
+        "ffmpeg", *([] if piped else ["-nostdin"]), "-loglevel", "error", "-threads", "0",
+        *(["-t", str(max_secs)] if max_secs is not None else []),
+        "-i", "pipe:0" if piped else source,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sr),
+        "-",
+    ]
+    process = subprocess.Popen(cmd,
+                               stdin=subprocess.PIPE if piped else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    if piped:
+        # written from a thread, ffmpeg blocks on a full stdout pipe while we have not read it
+        threading.Thread(target=_feed, args=(process.stdin, source), name="ffmpeg-feed", daemon=True).start()
+    return process
+
+
+def _read_block(process: subprocess.Popen, block: np.ndarray) -> int:
+    """Fill ``block`` with int16 samples, returns the number of samples read. Less than a full block means EOF."""
+    view = memoryview(block).cast("B")
+    filled = 0
+    while filled < len(view):
+        n = process.stdout.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return filled // 2
+
+
+def _close_ffmpeg(process: subprocess.Popen, check: bool = True):
+    process.stdout.close()
+    stderr = process.stderr.read()
+    process.stderr.close()
+    if process.wait() != 0 and check:
+        raise RuntimeError(f"Failed to load audio: {stderr.decode(errors='replace')}")
+
+
+def _to_float(block: np.ndarray, out: np.ndarray):
+    np.multiply(block, 1 / 32768.0, out=out, casting="unsafe")
+
+
+def load_audio(source: AudioSource,
+               sr: int = SAMPLE_RATE,
+               duration: Optional[float] = None,
+               cancel: Optional[CancelToken] = None,
+               max_secs: Optional[float] = None) -> np.ndarray:
+    """Decode a whole file, URL or encoded audio file in memory to a mono float32 waveform.
+
+    Args:
+        source: Anything ffmpeg can open, or the bytes of an audio file.
+        sr: Sample rate to resample to.
+        duration: Expected duration in seconds, used to allocate the output once. Without it the output starts at
+            a minute and grows geometrically, and is trimmed to the decoded length at the end.
+        cancel: Checked once per 30 seconds of audio, ffmpeg is stopped when it is cancelled.
+        max_secs: Only decode the beginning of the audio, ffmpeg stops reading the source there.
+    """
+    # a limit is no guess of the length, allocating it upfront would hold the whole budget for every short file
+    guess = duration or 60
+    if max_secs is not None:
+        guess = min(guess, max_secs)
+    capacity = int(guess * sr) + sr
+    audio = np.empty(capacity, dtype=np.float32)
+    block = np.empty(BLOCK_SAMPLES, dtype=np.int16)
+    size = 0
+
+    process = _open_ffmpeg(source, sr, max_secs)
+    finished = False
+    try:
+        for i in itertools.count():
+            if cancel is not None and i % (N_SAMPLES // BLOCK_SAMPLES) == 0:
+                cancel.check()
+            n = _read_block(process, block)
+            if size + n > len(audio):
+                audio = np.resize(audio, max(size + n, len(audio) * 3 // 2))
+            _to_float(block[:n], audio[size:size + n])
+            size += n
+            if n < len(block):
+                break
+        finished = True
+    finally:
+        if not finished:
+            process.kill()
+        _close_ffmpeg(process, check=finished)
+
+    if len(audio) - size > sr:
+        # a view would keep the unused part alive
+        return audio[:size].copy()
+    return audio[:size]
+
+
+def iter_audio_windows(source: AudioSource,
+                       sr: int = SAMPLE_RATE,
+                       window_samples: int = N_SAMPLES,
+                       max_secs: Optional[float] = None) -> Iterator[np.ndarray]:
+    """Decode a file, URL or encoded audio file in memory window by window, holding a fixed amount of memory however
+    long the source is. Decoding stops after ``max_secs`` if it is given.
+
+    The same buffer is reused for every window, consumers must be done with a window before asking for the next one.
+    The last window is shorter unless the audio length is a multiple of ``window_samples``.
+    """
+    window = np.empty(window_samples, dtype=np.float32)
+    block = np.empty(BLOCK_SAMPLES, dtype=np.int16)
+    size = 0
+
+    process = _open_ffmpeg(source, sr, max_secs)
+    eof = False
+    try:
+        while not eof:
+            n = _read_block(process, block[:min(len(block), window_samples - size)])
+            eof = n < min(len(block), window_samples - size)
+            _to_float(block[:n], window[size:size + n])
+            size += n
+            if size == window_samples or (eof and size):
+                yield window[:size]
+                size = 0
+    finally:
+        if not eof:
+            # the consumer stopped early
+            process.kill()
+        _close_ffmpeg(process, check=eof)
+
+
+def probe_duration(source: AudioSource) -> Optional[float]:
+    """The duration ffprobe reads from the header of an audio file, ``None`` when the header does not tell, e.g. for
+    MP4 files decoded from a pipe, or when ffprobe is not installed."""
+    piped = isinstance(source, bytes)
+    cmd = ["ffprobe", "-loglevel", "error", "-show_entries", "format=duration", "-of", "csv=p=0",
+           "pipe:0" if piped else source]
+    try:
+        result = subprocess.run(cmd, input=source if piped else None, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, timeout=10)
+        return float(result.stdout)
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return None
+
+
+class AudioFetcher:
+    """Turns the video, local file or upload of a request into audio, independently of the model that transcribes it.
+
+    Args:
+        resolver: Resolver of the video metadata, the one configured by the environment by default.
+        max_audio_secs: Compute budget of a single request, longer audio is rejected.
+        local_dir: Directory of the files requests may refer to with ``audio_path``, local files are rejected when it
+            is not set.
+    """
+
+    def __init__(self,
+                 resolver: Optional[MetadataResolver] = None,
+                 max_audio_secs: float = MAX_AUDIO_SECS,
+                 local_dir: Optional[str] = LOCAL_AUDIO_DIR):
+        self.resolver = resolver or default_resolver()
+        self.max_audio_secs = max_audio_secs
+        self.local_dir = local_dir
+
+    def local_path(self, path: str) -> str:
+        """The absolute path of a file under ``local_dir``, relative paths are relative to it."""
+        if self.local_dir is None:
+            raise ValueError("Local audio files are not enabled on this server.")
+        root = os.path.realpath(self.local_dir)
+        resolved = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, resolved]) != root:
+            raise ValueError(f"The file {path} is outside of the audio directory.")
+        if not os.path.isfile(resolved):
+            raise ValueError(f"The file {path} does not exist.")
+        return resolved
+
+    def resolve(self, sample, max_secs: Optional[float] = None) -> Tuple[AudioSource, Optional[float]]:
+        """Returns what ffmpeg decodes for a request and its duration when it is known before decoding. That is the
+        audio stream URL of a video, the path of a local file or the bytes of an upload. The compute budget of
+        videos only applies when the whole video is decoded, not just its first ``max_secs``."""
+        if sample.audio_bytes is not None:
+            return sample.audio_bytes, None
+        if sample.audio_data is not None:
+            return base64.b64decode(sample.audio_data), None
+        if sample.audio_path is not None:
+            return self.local_path(sample.audio_path), None
+        metadata = self.resolver.resolve(sample.video_url)
+        if max_secs is None:
+            check_duration(metadata, self.max_audio_secs)
+        return metadata.audio_url, metadata.duration
+
+    def load(self, sample, cancel: Optional[CancelToken] = None, max_secs: Optional[float] = None) -> np.ndarray:
+        if cancel is not None:
+            cancel.check()
+        source, duration = self.resolve(sample, max_secs)
+        if duration is None and max_secs is None:
+            # the length of local files and uploads is only known once they are decoded, stop right after the budget
+            audio = load_audio(source, cancel=cancel, max_secs=self.max_audio_secs + 1)
+            if len(audio) > self.max_audio_secs * SAMPLE_RATE:
+                raise ValueError(f"Please send audio shorter than {self.max_audio_secs / 60:g} minutes.")
+            return audio
+        return load_audio(source, duration=duration, cancel=cancel, max_secs=max_secs)
@@ -1,16 +1,80 @@
+import itertools
 import warnings
+from dataclasses import dataclass, field, replace
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
 import torch
 import whisper
-from pytube import YouTube
+from whisper.audio import HOP_LENGTH, N_FFT, N_FRAMES, N_SAMPLES, SAMPLE_RATE
+from whisper.decoding import DecodingResult
+from whisper.tokenizer import get_tokenizer
+
+from whisperer.CONST import MAX_WINDOWS_PER_STEP, WHISPER_CACHE_DIR, WHISPER_CPU_INT8, WHISPER_SKIP_SILENCE
+from whisperer.models.audio import AudioFetcher
+from whisperer.models.vad import speech_regions, split_on_silence
+from whisperer.utility.cancellation import CancelToken
+
+TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+# the spectrogram pads both ends by reflection, shorter audio has no frame
+_MIN_SAMPLES = N_FFT // 2
+
+
+@dataclass
+class _Transcript:
+    """Decoding state of a single clip while it moves through the batched seek loop."""
+
+    mel: torch.Tensor
+    offset: int = 0  # position of the first mel frame in the whole clip
+    seek: int = 0
+    language: Optional[str] = None
+    tokens: List[int] = field(default_factory=list)
+    segments: List[dict] = field(default_factory=list)
+
+    @property
+    def done(self) -> bool:
+        return self.seek >= self.mel.shape[-1]
 
 
 class WhisperModel:
+    """Batched Whisper transcription.
+
+    Long clips are split at silences into chunks of at most 30 seconds, so that the chunks of a clip are decoded
+    side by side in one batch instead of one window after another. Long silences are left out before the encoder,
+    the timestamps still refer to the original clip.
+
+    The language is detected on the first window of a clip and every later window is decoded in it. Unlike
+    ``whisper.transcribe``, windows are not conditioned on the text of the previous window: the chunks of a clip are
+    decoded side by side, and the decoder takes a single prompt for the whole batch.
+
+    Args:
+        name: Name of the Whisper checkpoint.
+        max_windows_per_step: Number of 30-second windows encoded and decoded together.
+        fetcher: Loads the audio of requests that are passed without it.
+        checkpoint: Local path of the weights, they are downloaded to ``WHISPER_CACHE_DIR`` when omitted.
+        cpu_int8: Use dynamically quantised int8 linear layers when running on CPU.
+        skip_silence: Only encode the regions of a clip that may contain speech.
+    """
 
-    def __init__(self):
+    def __init__(self, name: str = "base", max_windows_per_step: int = MAX_WINDOWS_PER_STEP,
+                 fetcher: Optional[AudioFetcher] = None, checkpoint: Optional[str] = None,
+                 cpu_int8: bool = WHISPER_CPU_INT8, skip_silence: bool = WHISPER_SKIP_SILENCE):
+        self.name = name
+        self.max_windows_per_step = max_windows_per_step
+        self.skip_silence = skip_silence
+        self.fetcher = fetcher or AudioFetcher()
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        model = whisper.load_model('base', device=self.device)
+        self.quantized = cpu_int8 and self.device == "cpu"
+        if self.quantized:
+            from whisperer.models.quantization import load_quantized_model
+
+            model = load_quantized_model(name, checkpoint)
+        else:
+            model = whisper.load_model(checkpoint or name, device=self.device, download_root=WHISPER_CACHE_DIR)
         self.model = model
-        self.decode_options = whisper.DecodingOptions()
         self.dtype = torch.float16
         fp16 = True
         if model.device == torch.device("cpu"):
@@ -21,26 +85,266 @@ class WhisperModel:
                 self.dtype = torch.float32
                 fp16 = False
         self.decode_options = whisper.DecodingOptions(fp16=fp16)
+        self.tokenizer = get_tokenizer(model.is_multilingual)
+        self.input_stride = N_FRAMES // model.dims.n_audio_ctx  # mel frames per output token: 2
+        self.time_precision = self.input_stride * HOP_LENGTH / SAMPLE_RATE  # time per output token: 0.02 (seconds)
+        torch.cuda.empty_cache()
+
+    def warmup(self):
+        """Run one short clip through the encoder and the decoder, so the first request does not pay for the CUDA
+        context, kernel selection and allocator growth."""
+        # one step on the window directly, silence skipping would leave nothing to encode
+        self._step([self._start(np.zeros(SAMPLE_RATE, dtype=np.float32))])
         torch.cuda.empty_cache()
 
-    def __call__(self, batch):
-        batch_size = len(batch)
+    def transcribe(self,
+                   audios: List[np.ndarray],
+                   cancel: Optional[CancelToken] = None,
+                   beam_size: Optional[int] = None) -> List[dict]:
+        """Transcribe a batch of clips together.
+
+        Every clip is split at silences into chunks of at most 30 seconds. Every step takes the current window of up
+        to ``max_windows_per_step`` unfinished chunks, runs the encoder once on the stacked windows and decodes all
+        of them in a single batched call. Chunks advance their own seek position, so short ones drop out of the
+        batch as soon as they are done. The segments of the chunks are stitched back together per clip. The first
+        window of every clip is decoded on its own step first, the language detected on it holds for its other chunks.
+
+        ``cancel`` is checked after every step, so an abandoned batch stops within one window. ``beam_size`` switches
+        the first decoding attempt of every window from greedy decoding to beam search.
+        """
+        chunks = [[self._start(chunk, offset) for offset, chunk in self._split(audio)] for audio in audios]
+        firsts = [clip[0] for clip in chunks if clip]
+        for start in range(0, len(firsts), self.max_windows_per_step):
+            self._step(firsts[start:start + self.max_windows_per_step], beam_size)
+            if cancel is not None:
+                cancel.check()
+        for clip in chunks:
+            for transcript in clip[1:]:
+                transcript.language = clip[0].language
+        for _ in self._steps([transcript for clip in chunks for transcript in clip], beam_size):
+            if cancel is not None:
+                cancel.check()
+        return [self._finish(*clip) for clip in chunks]
+
+    def transcribe_stream(self,
+                          windows: Iterable[np.ndarray],
+                          cancel: Optional[CancelToken] = None,
+                          beam_size: Optional[int] = None) -> Iterator[Tuple[str, dict]]:
+        """Transcribe a single clip delivered as consecutive pieces of audio (see
+        :func:`~whisperer.models.audio.iter_audio_windows`), yielding ``("segment", segment)`` events as soon as a
+        30-second window is decoded.
+
+        At most two windows of audio are held at once. The last event is ``("done", {"text": ..., "language": ...})``.
+        """
+        pending = np.zeros(0, dtype=np.float32)
+        offset = 0
+        tokens, num_segments = [], 0
+        language = None  # detected on the first decoded window, kept for the rest of the clip
+        for window in itertools.chain(windows, [None]):
+            if window is not None:
+                pending = np.concatenate([pending, window])
+            while len(pending) >= N_SAMPLES or (window is None and len(pending) > _MIN_SAMPLES):
+                if cancel is not None:
+                    cancel.check()
+                if self.skip_silence and not speech_regions(pending[:N_SAMPLES]):
+                    pending = pending[N_SAMPLES:]
+                    offset += N_SAMPLES
+                    continue
+                transcript = self._start(pending[:N_SAMPLES], offset)
+                transcript.language = language
+                self._step([transcript], beam_size)
+                language = transcript.language
+                for segment in transcript.segments:
+                    yield "segment", {**segment, "id": num_segments}
+                    num_segments += 1
+                tokens.extend(transcript.tokens)
+
+                # the window may end in the middle of a segment, keep the rest for the next one
+                consumed = transcript.seek * HOP_LENGTH or N_SAMPLES
+                pending = pending[consumed:]
+                offset += consumed
+
+        yield "done", dict(text=self.tokenizer.decode(tokens), language=language)
+
+    @torch.inference_mode()
+    def detect_language(self, audios: List[np.ndarray], cancel: Optional[CancelToken] = None) -> List[dict]:
+        """Detect the spoken language of a batch of clips from their first 30 seconds.
+
+        Only the encoder and a single decoder step run, instead of the whole decoding loop of :meth:`transcribe`.
+        """
+        if not self.model.is_multilingual:
+            return [dict(language="en", probability=1.0) for _ in audios]
+
         results = []
-        with torch.inference_mode():
-            print(f"Video processing started ({batch})")
-            for sample in batch:
-                video_url = sample.video_url
-                yt = YouTube(video_url)
-
-                streams = yt.streams.filter(only_audio=True)
-                stream_url = streams[0].url
-                length = yt.length
-                if length >= 300:
-                    raise ValueError("Please find a YouTube video shorter than 5 minutes."
-                                     " Sorry about this, the server capacity is limited"
-                                     " for the time being.")
-                audio = whisper.load_audio(stream_url)
-                result = self.model.transcribe(audio)
-                results.append({video_url: result})
-                print('pipe', results)
+        for start in range(0, len(audios), self.max_windows_per_step):
+            if cancel is not None:
+                cancel.check()
+            mel = torch.stack([
+                whisper.log_mel_spectrogram(torch.from_numpy(whisper.pad_or_trim(audio)).to(self.device))
+                for audio in audios[start:start + self.max_windows_per_step]
+            ])
+            audio_features = self.model.embed_audio(mel.to(self.dtype))
+            _, probs = whisper.detect_language(self.model, audio_features, self.tokenizer)
+            for language_probs in probs:
+                language = max(language_probs, key=language_probs.get)
+                results.append(dict(language=language, probability=language_probs[language]))
+        return results
+
+    def _split(self, audio: np.ndarray) -> List[Tuple[int, np.ndarray]]:
+        """``(offset, chunk)`` pairs of at most 30 seconds, without the silent stretches between them. Chunks too
+        short for a spectrogram frame are dropped, an empty clip has no chunks and an empty transcript."""
+        if not self.skip_silence:
+            chunks = split_on_silence(audio)
+        else:
+            chunks = [(start + offset, chunk)
+                      for start, end in speech_regions(audio)
+                      for offset, chunk in split_on_silence(audio[start:end])]
+        return [(offset, chunk) for offset, chunk in chunks if len(chunk) > _MIN_SAMPLES]
+
+    def _start(self, audio: np.ndarray, offset: int = 0) -> _Transcript:
+        return _Transcript(mel=whisper.log_mel_spectrogram(torch.from_numpy(audio).to(self.device)),
+                           offset=offset // HOP_LENGTH)
+
+    def _finish(self, *transcripts: _Transcript) -> dict:
+        """Stitch the chunks of a clip into a single transcript."""
+        tokens, segments = [], []
+        for transcript in transcripts:
+            tokens.extend(transcript.tokens)
+            for segment in transcript.segments:
+                segments.append({**segment, "id": len(segments)})
+        languages = [transcript.language for transcript in transcripts if transcript.segments]
+        return dict(
+            text=self.tokenizer.decode(tokens),
+            segments=segments,
+            language=languages[0] if languages else next((t.language for t in transcripts), None),
+        )
+
+    def _steps(self, transcripts: List[_Transcript], beam_size: Optional[int] = None) -> Iterator[None]:
+        """Run the batched seek loop, yielding after every decoding step."""
+        while True:
+            active = [transcript for transcript in transcripts if not transcript.done]
+            if not active:
+                return
+            self._step(active[:self.max_windows_per_step], beam_size)
+            yield
+
+    @torch.inference_mode()
+    def _step(self, active: List[_Transcript], beam_size: Optional[int] = None):
+        """Encode the current window of every transcript at once, decode them together and advance their seek."""
+        mel = torch.stack([whisper.pad_or_trim(t.mel[:, t.seek:], N_FRAMES) for t in active])
+        audio_features = self.model.embed_audio(mel.to(self.dtype))
+        # windows of clips with a known language are decoded in it, the others detect theirs
+        languages = [transcript.language for transcript in active]
+        for language in dict.fromkeys(languages):
+            indices = [i for i, other in enumerate(languages) if other == language]
+            results = self._decode_with_fallback(audio_features[indices], beam_size, language)
+            for index, result in zip(indices, results):
+                self._update(active[index], result)
+
+    def _decode_with_fallback(self,
+                              audio_features: torch.Tensor,
+                              beam_size: Optional[int] = None,
+                              language: Optional[str] = None) -> List[DecodingResult]:
+        """Decode a batch of encoded windows, retrying only the windows that fail at the next temperature."""
+        results: List[Optional[DecodingResult]] = [None] * audio_features.shape[0]
+        pending = list(range(audio_features.shape[0]))
+
+        for temperature in TEMPERATURES:
+            if temperature > 0:
+                # disable beam search when sampling
+                options = replace(self.decode_options, beam_size=None, patience=None, temperature=temperature,
+                                  language=language)
+            else:
+                options = replace(self.decode_options, beam_size=beam_size, best_of=None, temperature=temperature,
+                                  language=language)
+
+            decoded = self.model.decode(audio_features[pending], options)
+            failed = []
+            for index, result in zip(pending, decoded):
+                results[index] = result
+                too_repetitive = result.compression_ratio > COMPRESSION_RATIO_THRESHOLD
+                too_unlikely = result.avg_logprob < LOGPROB_THRESHOLD
+                if too_repetitive or too_unlikely:
+                    failed.append(index)
+
+            pending = failed
+            if not pending:
+                break
+
+        return results
+
+    def _update(self, transcript: _Transcript, result: DecodingResult):
+        """Advance the seek position of a clip and collect its segments, as in `whisper.transcribe`."""
+        tokenizer = self.tokenizer
+        segment_frames = min(N_FRAMES, transcript.mel.shape[-1] - transcript.seek)
+        timestamp_offset = float((transcript.offset + transcript.seek) * HOP_LENGTH / SAMPLE_RATE)
+        transcript.language = transcript.language or result.language
+
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob <= LOGPROB_THRESHOLD:
+            # silent window: fast-forward to the next window boundary
+            transcript.seek += segment_frames
+            return
+
+        tokens = torch.tensor(result.tokens)
+        timestamp_tokens = tokens.ge(tokenizer.timestamp_begin)
+        consecutive = torch.where(timestamp_tokens[:-1] & timestamp_tokens[1:])[0].add_(1)
+
+        if len(consecutive) > 0:
+            last_slice = 0
+            for current_slice in consecutive:
+                sliced_tokens = tokens[last_slice:current_slice]
+                start_position = sliced_tokens[0].item() - tokenizer.timestamp_begin
+                end_position = sliced_tokens[-1].item() - tokenizer.timestamp_begin
+                self._add_segment(transcript,
+                                  start=timestamp_offset + start_position * self.time_precision,
+                                  end=timestamp_offset + end_position * self.time_precision,
+                                  text_tokens=sliced_tokens[1:-1],
+                                  result=result)
+                last_slice = current_slice
+            last_position = tokens[last_slice - 1].item() - tokenizer.timestamp_begin
+            transcript.seek += last_position * self.input_stride
+            transcript.tokens.extend(tokens[:last_slice + 1].tolist())
+        else:
+            duration = segment_frames * HOP_LENGTH / SAMPLE_RATE
+            timestamps = tokens[timestamp_tokens.nonzero().flatten()]
+            if len(timestamps) > 0 and timestamps[-1].item() != tokenizer.timestamp_begin:
+                # single timestamp at the end means no speech after the last timestamp
+                duration = (timestamps[-1].item() - tokenizer.timestamp_begin) * self.time_precision
+            self._add_segment(transcript,
+                              start=timestamp_offset,
+                              end=timestamp_offset + duration,
+                              text_tokens=tokens,
+                              result=result)
+            transcript.seek += segment_frames
+            transcript.tokens.extend(tokens.tolist())
+
+    def _add_segment(self, transcript: _Transcript, *, start: float, end: float, text_tokens: torch.Tensor,
+                     result: DecodingResult):
+        text = self.tokenizer.decode([token for token in text_tokens if token < self.tokenizer.eot])
+        if len(text.strip()) == 0:
+            return
+        transcript.segments.append({
+            "id": len(transcript.segments),
+            "seek": transcript.offset + transcript.seek,
+            "start": start,
+            "end": end,
+            "text": text,
+            "tokens": text_tokens.tolist(),
+            "temperature": result.temperature,
+            "avg_logprob": result.avg_logprob,
+            "compression_ratio": result.compression_ratio,
+            "no_speech_prob": result.no_speech_prob,
+        })
+
+    def __call__(self,
+                 batch,
+                 audios: Optional[List[np.ndarray]] = None,
+                 cancel: Optional[CancelToken] = None,
+                 beam_size: Optional[int] = None):
+        print(f"Video processing started ({batch})")
+        if audios is None:
+            audios = [self.fetcher.load(sample, cancel) for sample in batch]
+        transcripts = self.transcribe(audios, cancel, beam_size)
+        results = [{sample.source: result} for sample, result in zip(batch, transcripts)]
+        print('pipe', results)
         return results
@@ -0,0 +1,42 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Union
+
+import numpy as np
+
+
+class AudioPrefetcher:
+    """Downloads and decodes the audio of incoming batches on a pool of workers while the model is busy with the
+    previous batches.
+
+    Args:
+        load_fn: Callable that turns a request sample into a float32 waveform. Extra arguments of :meth:`submit` are
+            passed along.
+        num_workers: Number of clips fetched and decoded concurrently.
+        queue_depth: Number of batches that may be fetched ahead of the model. Submitting more blocks the caller
+            until the model has collected one of them.
+    """
+
+    def __init__(self, load_fn: Callable[[Any], np.ndarray], num_workers: int = 4, queue_depth: int = 2):
+        self._load_fn = load_fn
+        self._pool = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="audio-prefetch")
+        self._slots = threading.BoundedSemaphore(queue_depth)
+
+    def submit(self, batch: List[Any], *args) -> List[Future]:
+        self._slots.acquire()
+        try:
+            return [self._pool.submit(self._load_fn, sample, *args) for sample in batch]
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def collect(self, futures: List[Future]) -> List[Union[np.ndarray, Exception]]:
+        """The waveforms of a batch, or the exception of every sample that could not be loaded, so that a bad sample
+        only fails itself."""
+        try:
+            return [future.exception() or future.result() for future in futures]
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
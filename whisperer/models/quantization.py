@@ -0,0 +1,77 @@
+"""Dynamic int8 quantisation of Whisper for CPU inference.
+
+The linear layers of the encoder and the decoder are quantised, the convolutions, layer norms and the token
+embedding stay in fp32. Quantising takes a while for the larger checkpoints, so the result is kept on disk.
+"""
+import hashlib
+import os
+from typing import Callable, Optional
+
+import torch
+import whisper
+from torch import nn
+from torch.ao.nn.quantized import dynamic as nnqd
+
+from whisperer.CONST import WHISPER_CACHE_DIR
+
+
+def _replace_linear(module: nn.Module, replacement: Callable[[nn.Linear], nn.Module]):
+    for name, child in module.named_children():
+        if isinstance(child, whisper.model.Linear):
+            setattr(module, name, replacement(child))
+        else:
+            _replace_linear(child, replacement)
+
+
+def _torch_linear(child: nn.Linear) -> nn.Linear:
+    linear = nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+    linear.weight = child.weight
+    linear.bias = child.bias
+    return linear
+
+
+def _empty_int8_linear(child: nn.Linear) -> nnqd.Linear:
+    return nnqd.Linear(child.in_features, child.out_features, bias_=child.bias is not None, dtype=torch.qint8)
+
+
+def quantize(model: whisper.model.Whisper) -> whisper.model.Whisper:
+    # Whisper subclasses `nn.Linear` to cast the weights on the fly, `quantize_dynamic` only replaces the exact
+    # `nn.Linear` type, so swap them back first
+    _replace_linear(model, _torch_linear)
+    return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def _cache_path(name: str, checkpoint: Optional[str], cache_dir: str) -> str:
+    """The cache file of a model, tied to the torch version as the packed int8 weights are not portable across
+    versions. A custom checkpoint is told apart by its path, size and modification time."""
+    if checkpoint is not None:
+        stat = os.stat(checkpoint)
+        fingerprint = f"{os.path.realpath(checkpoint)}:{stat.st_size}:{stat.st_mtime_ns}"
+        name = f"{name}-{hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]}"
+    return os.path.join(cache_dir, f"{name}-int8-torch{torch.__version__}.state.pt")
+
+
+def load_quantized_model(name: str, checkpoint: Optional[str] = None,
+                         cache_dir: str = WHISPER_CACHE_DIR) -> whisper.model.Whisper:
+    """Load the int8 model of a checkpoint from ``cache_dir``, quantising and caching it on the first call.
+
+    The cache holds tensors only, loaded with ``weights_only=True`` into the int8 layers of a freshly built model.
+    """
+    path = _cache_path(name, checkpoint, cache_dir)
+    if os.path.exists(path):
+        saved = torch.load(path, map_location="cpu", weights_only=True)
+        model = whisper.model.Whisper(whisper.model.ModelDimensions(**saved["dims"]))
+        _replace_linear(model, _empty_int8_linear)
+        model.load_state_dict(saved["model_state_dict"])
+        model.register_buffer("alignment_heads", saved["alignment_heads"].to_sparse(), persistent=False)
+        return model
+
+    model = quantize(whisper.load_model(checkpoint or name, device="cpu", download_root=cache_dir).float())
+    os.makedirs(cache_dir, exist_ok=True)
+    # written next to the final file and moved in place, so a crash never leaves a truncated model behind
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save({"dims": model.dims.__dict__,
+                "model_state_dict": model.state_dict(),
+                "alignment_heads": model.alignment_heads.to_dense()}, tmp_path)
+    os.replace(tmp_path, path)
+    return model
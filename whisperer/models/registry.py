@@ -0,0 +1,120 @@
+import threading
+from collections import OrderedDict
+from itertools import groupby
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import whisper
+
+from whisperer.CONST import MAX_LOADED_MODELS, WHISPER_CACHE_DIR, WHISPER_MODEL, WHISPER_MODELS
+from whisperer.models.audio import AudioFetcher, AudioSource, iter_audio_windows
+from whisperer.models.pipeline import WhisperModel
+from whisperer.utility.cancellation import CancelToken
+from whisperer.utility.data_io import ndjson_event
+from whisperer.utility.tiers import SERVICE_TIERS, ServiceTier
+
+
+class ModelRegistry:
+    """Loads Whisper checkpoints on demand and keeps the most recently used ones in memory.
+
+    Args:
+        default: Checkpoint used by requests that do not ask for one.
+        max_loaded: Number of checkpoints resident at once, the least recently used one is released first.
+        fetcher: Audio loader shared by all the checkpoints.
+    """
+
+    def __init__(self, default: str = WHISPER_MODEL, max_loaded: int = MAX_LOADED_MODELS,
+                 fetcher: Optional[AudioFetcher] = None):
+        if default not in WHISPER_MODELS:
+            raise ValueError(f"The default model {default} is not one of {WHISPER_MODELS}.")
+        self.default = default
+        self.max_loaded = max(1, max_loaded)
+        self.fetcher = fetcher or AudioFetcher()
+        self._models = OrderedDict()  # {name: WhisperModel}
+        self._checkpoints: Dict[str, str] = {}  # {name: local path of the weights}
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return list(self._models)
+
+    def _check(self, name: Optional[str]) -> str:
+        name = name or self.default
+        if name not in WHISPER_MODELS:
+            raise ValueError(f"Unknown model {name}, choose one of {WHISPER_MODELS}.")
+        return name
+
+    def prefetch(self, name: Optional[str] = None) -> str:
+        """Download the weights of a checkpoint to ``WHISPER_CACHE_DIR`` unless they are already there, returns
+        their path. Point ``WHISPER_CACHE_DIR`` at a persistent volume to skip the download on the next start."""
+        name = self._check(name)
+        if name not in self._checkpoints:
+            # whisper verifies the checksum of a cached file and only downloads when it is missing or corrupt
+            self._checkpoints[name] = whisper._download(whisper._MODELS[name], WHISPER_CACHE_DIR, False)
+        return self._checkpoints[name]
+
+    def get(self, name: Optional[str] = None) -> WhisperModel:
+        name = self._check(name)
+
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                return self._models[name]
+
+            # make room before loading, two large checkpoints may not fit together
+            while len(self._models) >= self.max_loaded:
+                evicted, _ = self._models.popitem(last=False)
+                print(f"unloading model {evicted}")
+                torch.cuda.empty_cache()
+
+            print(f"loading model {name}...")
+            model = self._models[name] = WhisperModel(name, fetcher=self.fetcher, checkpoint=self.prefetch(name))
+            print(f"model {name} loaded")
+            return model
+
+    @staticmethod
+    def _profile(sample) -> Tuple[str, str]:
+        """The checkpoint and the service tier of a request, the default checkpoint is ``""``."""
+        return sample.model or SERVICE_TIERS[sample.tier].model or "", sample.tier
+
+    def _by_profile(self, batch: List, audios: List[np.ndarray], run) -> List[dict]:
+        # the load balancer batches by model and tier, but a batch may still mix them when sent directly
+        results = [None] * len(batch)
+        indices = sorted(range(len(batch)), key=lambda i: self._profile(batch[i]))
+        for (name, tier), group in groupby(indices, key=lambda i: self._profile(batch[i])):
+            group = list(group)
+            outputs = run(self.get(name), SERVICE_TIERS[tier], [batch[i] for i in group], [audios[i] for i in group])
+            for i, output in zip(group, outputs):
+                results[i] = output
+        return results
+
+    @torch.inference_mode()
+    def transcribe(self, batch: List, audios: List[np.ndarray], cancel: Optional[CancelToken] = None) -> List[dict]:
+        """Transcribe a batch that may mix models and tiers, one after the other."""
+        torch.cuda.empty_cache()
+
+        def run(model: WhisperModel, tier: ServiceTier, samples: List, clips: List[np.ndarray]):
+            return model(samples, clips, cancel, tier.beam_size)
+
+        return self._by_profile(batch, audios, run)
+
+    def detect_language(self,
+                        batch: List,
+                        audios: List[np.ndarray],
+                        cancel: Optional[CancelToken] = None) -> List[dict]:
+        """Detect the language of a batch that may mix models, one model after the other."""
+
+        def run(model: WhisperModel, tier: ServiceTier, samples: List, clips: List[np.ndarray]):
+            return [{sample.source: result} for sample, result in zip(samples, model.detect_language(clips, cancel))]
+
+        return self._by_profile(batch, audios, run)
+
+    def stream(self, sample, source: AudioSource, events, cancel: Optional[CancelToken] = None):
+        """Put the NDJSON events of the transcript of a request on the ``events`` queue while it is decoded."""
+        name, tier = self._profile(sample)
+        # decoded window by window, so memory stays flat however long the video is; local files and uploads are
+        # only cut at the compute budget here, their length is not known up front
+        windows = iter_audio_windows(source, max_secs=self.fetcher.max_audio_secs)
+        for event, item in self.get(name).transcribe_stream(windows, cancel, SERVICE_TIERS[tier].beam_size):
+            events.put(ndjson_event(event, item))
@@ -0,0 +1,128 @@
+"""Model replicas in separate processes, so a CPU node runs several inferences at once.
+
+A single process is limited by the GIL between the torch calls and by how far one inference scales across cores.
+Every replica is a single-worker process pinned to its own slice of the cores, with as many torch threads as
+cores in that slice, so the replicas do not compete for the same cores.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from whisperer.models.audio import AudioSource
+from whisperer.utility.cancellation import CancelToken
+
+# the registry of the replica process, created by _start_replica
+_MODELS = None
+
+
+def _init_replica(cores: List[int], num_threads: int):
+    import torch
+
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(num_threads)
+
+
+def _start_replica() -> Dict[str, float]:
+    global _MODELS
+    from whisperer.models.registry import ModelRegistry
+
+    timings = {}
+    start_time = time.time()
+    _MODELS = ModelRegistry()
+    model = _MODELS.get()
+    timings["load"] = time.time() - start_time
+
+    start_time = time.time()
+    model.warmup()
+    timings["warmup"] = time.time() - start_time
+    return timings
+
+
+def _transcribe(batch: List, audios: List[np.ndarray], cancel: Optional[CancelToken]) -> List[dict]:
+    return _MODELS.transcribe(batch, audios, cancel)
+
+
+def _detect_language(batch: List, audios: List[np.ndarray], cancel: Optional[CancelToken]) -> List[dict]:
+    return _MODELS.detect_language(batch, audios, cancel)
+
+
+def _stream(sample, source: AudioSource, events, cancel: Optional[CancelToken]):
+    _MODELS.stream(sample, source, events, cancel)
+
+
+class ReplicaPool:
+    """Spreads batches over model replicas, each one a process that runs one batch at a time.
+
+    Args:
+        num_replicas: Number of model replicas.
+        threads_per_replica: Torch threads of every replica, all the cores of its slice when omitted.
+    """
+
+    def __init__(self, num_replicas: int, threads_per_replica: Optional[int] = None):
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        cores_per_replica = max(1, len(cores or range(os.cpu_count())) // num_replicas)
+        # spawned, forking a process that already runs torch threads can deadlock
+        context = multiprocessing.get_context("spawn")
+        self.num_replicas = num_replicas
+        self._replicas = [
+            ProcessPoolExecutor(max_workers=1,
+                                mp_context=context,
+                                initializer=_init_replica,
+                                initargs=(cores[i * cores_per_replica:(i + 1) * cores_per_replica],
+                                          threads_per_replica or cores_per_replica)) for i in range(num_replicas)
+        ]
+        self._inflight = [0] * num_replicas
+        self._lock = threading.Lock()
+        self._manager = context.Manager()
+
+    def start(self) -> Dict[str, float]:
+        """Load and warm up the default model in all the replicas at once, returns the slowest time per phase."""
+        timings = [replica.submit(_start_replica) for replica in self._replicas]
+        timings = [future.result() for future in timings]
+        return {phase: max(t[phase] for t in timings) for phase in timings[0]}
+
+    def queue(self):
+        """A queue that replicas can put events on."""
+        return self._manager.Queue()
+
+    def cancel_token(self, deadline: Optional[float] = None) -> CancelToken:
+        """A cancel token that replicas see being cancelled."""
+        return CancelToken(deadline, self._manager.Event())
+
+    def _submit(self, fn, *args) -> Future:
+        with self._lock:
+            index = min(range(self.num_replicas), key=self._inflight.__getitem__)
+            self._inflight[index] += 1
+        future = self._replicas[index].submit(fn, *args)
+        future.add_done_callback(lambda _: self._release(index))
+        return future
+
+    def _release(self, index: int):
+        with self._lock:
+            self._inflight[index] -= 1
+
+    def transcribe(self, batch: List, audios: List[np.ndarray], cancel: Optional[CancelToken] = None) -> List[dict]:
+        """Transcribe a batch on the least busy replica, ``cancel`` must come from :meth:`cancel_token`."""
+        return self._submit(_transcribe, batch, audios, cancel).result()
+
+    def detect_language(self,
+                        batch: List,
+                        audios: List[np.ndarray],
+                        cancel: Optional[CancelToken] = None) -> List[dict]:
+        return self._submit(_detect_language, batch, audios, cancel).result()
+
+    def stream(self, sample, source: AudioSource, events, cancel: Optional[CancelToken] = None):
+        """Stream a transcript on the least busy replica, ``events`` and ``cancel`` must come from :meth:`queue`
+        and :meth:`cancel_token`."""
+        self._submit(_stream, sample, source, events, cancel).result()
+
+    def shutdown(self):
+        for replica in self._replicas:
+            replica.shutdown(wait=False)
+        self._manager.shutdown()
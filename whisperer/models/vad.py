@@ -0,0 +1,88 @@
+"""Energy-based voice activity helpers that work on 16 kHz float32 waveforms."""
+from typing import List, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 320  # 20 ms, a multiple of the mel hop length so cuts land on mel frame boundaries
+SMOOTHING_FRAMES = 10  # 200 ms, prefer real pauses over a single quiet frame
+
+
+def frame_energy(audio: np.ndarray, frame_length: int = FRAME_LENGTH) -> np.ndarray:
+    """Log energy (dB) of consecutive, non-overlapping frames."""
+    num_frames = len(audio) // frame_length
+    frames = audio[:num_frames * frame_length].reshape(num_frames, frame_length)
+    return 10 * np.log10(np.mean(np.square(frames, dtype=np.float32), axis=1) + 1e-10)
+
+
+def split_on_silence(audio: np.ndarray,
+                     max_chunk_secs: float = 30.0,
+                     min_chunk_secs: float = 15.0) -> List[Tuple[int, np.ndarray]]:
+    """Split a waveform into chunks of at most ``max_chunk_secs``, cutting at the quietest moment after
+    ``min_chunk_secs``.
+
+    Returns:
+        ``(offset, chunk)`` pairs, where ``offset`` is the position of the first sample of the chunk in ``audio``.
+    """
+    max_frames = int(max_chunk_secs * SAMPLE_RATE) // FRAME_LENGTH
+    min_frames = int(min_chunk_secs * SAMPLE_RATE) // FRAME_LENGTH
+    if len(audio) <= max_frames * FRAME_LENGTH:
+        return [(0, audio)]
+
+    energy = frame_energy(audio)
+    kernel = np.ones(SMOOTHING_FRAMES, dtype=np.float32) / SMOOTHING_FRAMES
+    energy = np.convolve(energy, kernel, mode="same")
+
+    chunks = []
+    start = 0
+    while len(audio) - start * FRAME_LENGTH > max_frames * FRAME_LENGTH:
+        window = energy[start + min_frames:start + max_frames]
+        cut = start + min_frames + int(np.argmin(window))
+        chunks.append((start * FRAME_LENGTH, audio[start * FRAME_LENGTH:cut * FRAME_LENGTH]))
+        start = cut
+    chunks.append((start * FRAME_LENGTH, audio[start * FRAME_LENGTH:]))
+    return chunks
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """``(start, end)`` frame indices of the runs of True in a boolean mask."""
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    return edges.reshape(-1, 2)
+
+
+def speech_regions(audio: np.ndarray,
+                   threshold_db: float = -70.0,
+                   dynamic_range_db: float = 35.0,
+                   min_silence_secs: float = 2.0,
+                   padding_secs: float = 0.5) -> List[Tuple[int, int]]:
+    """Find the stretches of a waveform that may contain speech.
+
+    A frame counts as loud when it is within ``dynamic_range_db`` of the loud part of the clip, so quiet recordings
+    keep their speech, and above ``threshold_db``, which only rules out digital silence and dither. Loud frames are
+    padded by ``padding_secs`` on both sides, and only silences longer than ``min_silence_secs`` separate two
+    regions, so word onsets and short pauses are kept.
+
+    Returns:
+        ``(start, end)`` sample positions of the regions, in order. Empty when the clip is silent throughout.
+    """
+    energy = frame_energy(audio)
+    if len(energy) == 0:
+        return []
+    threshold = max(threshold_db, np.percentile(energy, 95) - dynamic_range_db)
+    loud = energy > threshold
+
+    padding = int(padding_secs * SAMPLE_RATE) // FRAME_LENGTH
+    # a full convolution sliced around its centre keeps the length, even for clips shorter than the kernel
+    loud = np.convolve(loud, np.ones(2 * padding + 1), mode="full")[padding:padding + len(loud)] > 0
+
+    # close the silences too short to be worth a cut
+    min_silence = int(min_silence_secs * SAMPLE_RATE) // FRAME_LENGTH
+    for start, end in _runs(~loud):
+        if end - start < min_silence and start > 0 and end < len(loud):
+            loud[start:end] = True
+
+    regions = _runs(loud) * FRAME_LENGTH
+    if len(regions) and regions[-1, 1] == len(energy) * FRAME_LENGTH:
+        # the samples after the last full frame belong to the last region
+        regions[-1, 1] = len(audio)
+    return [(int(start), int(end)) for start, end in regions]
@@ -0,0 +1,203 @@
+"""Deadline-based request batching.
+
+Requests wait in one FIFO queue per batch key. A queue is flushed as soon as it holds a full batch, or when its
+oldest request has waited ``timeout_secs``, so every request is sent within ``timeout_secs`` of its arrival whatever
+happened to the queue before. The batcher sleeps until the next deadline or until a request fills a batch, it never
+wakes up on a fixed interval.
+
+Waiting for a batch to fill up only pays off while the workers are busy. When the owner reports idle workers in
+:attr:`Batcher.free_slots`, the queues with the oldest requests are flushed right away, one batch per free slot.
+
+A batch is answered once its longest clip is transcribed, so with ``length_spread`` set, requests of known length
+are only batched with requests of similar length. Lengths are bucketed on a logarithmic scale: the class ``k`` holds
+the lengths from ``length_spread ** k`` up to ``length_spread ** (k + 1)`` seconds, so the lengths of one class are
+within a factor ``length_spread`` of each other, while close lengths on either side of a bucket boundary are not
+batched together. A batch takes the requests of one class only, in the order they came in. A batch is full at
+``max_batch_size`` requests or ``max_batch_audio_secs`` seconds of audio. The oldest request of a queue still sets
+its deadline, and a due batch is always the one of the oldest request, so short clips may overtake long ones but
+never by more than the timeout, nobody starves.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+# (key, items, seconds every item waited)
+Batch = Tuple[Hashable, List[Any], List[float]]
+
+# the length class of the oldest request of a queue
+_OLDEST = object()
+
+
+class _Queue:
+    """The requests of a batch key, one FIFO per length class with its count and seconds of audio kept up to date, so
+    that queueing and taking a request does not walk the whole queue."""
+
+    def __init__(self):
+        # {length_class: deque([(queued_at, audio_secs, item)])}, only the classes with requests
+        self.classes: Dict[Optional[int], Deque[Tuple[float, Optional[float], Any]]] = {}
+        # {length_class: seconds of audio of its requests}
+        self.seconds: Dict[Optional[int], float] = {}
+        self.size = 0
+
+    def oldest(self) -> Tuple[float, Optional[int]]:
+        """When the oldest request was queued, and its length class."""
+        length_class, entries = min(self.classes.items(), key=lambda item: item[1][0][0])
+        return entries[0][0], length_class
+
+
+class Batcher:
+    """Queues of requests per batch key, see :meth:`put` and :meth:`next_batches`.
+
+    Set :attr:`paused` to hold all the queues, e.g. while there is nowhere to send batches, and :attr:`free_slots` to
+    the number of batches the workers could start right now, ``None`` to only flush full and due batches. Call
+    :meth:`wake` after changing either of them.
+
+    Args:
+        length_spread: Ratio between the bounds of a length class, above 1. The lengths of two requests of the same
+            batch are within this factor of each other. ``None`` to batch requests in arrival order whatever their
+            length.
+        clock: Time source, a simulated clock for benchmarks.
+    """
+
+    def __init__(self, length_spread: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        if length_spread is not None and length_spread <= 1:
+            raise ValueError(f"length_spread must be above 1, got {length_spread}")
+        self.paused = False
+        self.free_slots: Optional[int] = None
+        self.length_spread = length_spread
+        self._clock = clock
+        self._queues: Dict[Hashable, _Queue] = {}
+        # {key: (max_batch_size, timeout_secs, max_batch_audio_secs)}
+        self._limits: Dict[Hashable, Tuple[int, float, Optional[float]]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return sum(queue.size for queue in self._queues.values())
+
+    def put(self, key: Hashable, item: Any, max_batch_size: int, timeout_secs: float,
+            audio_secs: Optional[float] = None, max_batch_audio_secs: Optional[float] = None):
+        """Queue ``item`` for the next batch of ``key``, which is sent with at most ``max_batch_size`` items and at the
+        latest ``timeout_secs`` after its oldest item was queued. ``audio_secs`` is the length of the item if known,
+        batches hold at most ``max_batch_audio_secs`` of audio unless a single item is longer."""
+        queue = self._queues.setdefault(key, _Queue())
+        self._limits[key] = (max_batch_size, timeout_secs, max_batch_audio_secs)
+        length_class = self._length_class(audio_secs)
+        entries = queue.classes.setdefault(length_class, deque())
+        entries.append((self._clock(), audio_secs, item))
+        seconds = queue.seconds.get(length_class, 0.0)
+        queue.seconds[length_class] = seconds + (audio_secs or 0.0)
+        queue.size += 1
+        reached_budget = (max_batch_audio_secs is not None
+                          and seconds < max_batch_audio_secs <= queue.seconds[length_class])  # noqa: W503
+        if queue.size == 1 or len(entries) == max_batch_size or reached_budget:
+            # a new deadline, or a class that just filled a batch
+            self.wake()
+
+    def discard(self, key: Hashable, item: Any) -> bool:
+        """Take ``item`` out of the queue of ``key`` when its caller gave up on it, whether it was still queued."""
+        queue = self._queues.get(key)
+        if queue is None:
+            return False
+        for length_class, entries in queue.classes.items():
+            for entry in entries:
+                if entry[2] is item:
+                    entries.remove(entry)
+                    queue.size -= 1
+                    if entries:
+                        queue.seconds[length_class] -= entry[1] or 0.0
+                    else:
+                        del queue.classes[length_class], queue.seconds[length_class]
+                    return True
+        return False
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _length_class(self, audio_secs: Optional[float]) -> Optional[int]:
+        if self.length_spread is None or audio_secs is None:
+            return None
+        return int(math.log(max(audio_secs, 1.0), self.length_spread))
+
+    def _full_class(self, key: Hashable) -> Tuple[bool, Optional[int]]:
+        """Whether the queue holds a full batch of a length class, and the full class with the oldest request."""
+        queue = self._queues[key]
+        max_batch_size, _, max_batch_audio_secs = self._limits[key]
+        full = []
+        for length_class, entries in queue.classes.items():
+            over_budget = max_batch_audio_secs is not None and queue.seconds[length_class] >= max_batch_audio_secs
+            if len(entries) >= max_batch_size or over_budget:
+                full.append((entries[0][0], length_class))
+        if not full:
+            return False, None
+        return True, min(full, key=lambda item: item[0])[1]
+
+    def _take(self, key: Hashable, now: float, length_class=_OLDEST) -> Tuple[List[Any], List[float]]:
+        """Take the next batch of a queue, in the length class of its oldest item unless another one is given."""
+        queue = self._queues[key]
+        max_batch_size, _, max_batch_audio_secs = self._limits[key]
+        if length_class is _OLDEST:
+            _, length_class = queue.oldest()
+        entries = queue.classes[length_class]
+        taken, total_secs = [], 0.0
+        while entries and len(taken) < max_batch_size:
+            audio_secs = entries[0][1] or 0.0
+            if taken and max_batch_audio_secs is not None and total_secs + audio_secs > max_batch_audio_secs:
+                break
+            taken.append(entries.popleft())
+            total_secs += audio_secs
+        queue.size -= len(taken)
+        if entries:
+            queue.seconds[length_class] -= total_secs
+        else:
+            del queue.classes[length_class], queue.seconds[length_class]
+        return [item for _, _, item in taken], [now - queued_at for queued_at, _, _ in taken]
+
+    def _flush(self, now: float) -> Tuple[List[Batch], Optional[float]]:
+        """The batches that are due, and the next deadline of the requests left in the queues."""
+        batches, next_deadline = [], None
+        for key, queue in self._queues.items():
+            _, timeout_secs, _ = self._limits[key]
+            while queue.size:
+                if queue.oldest()[0] + timeout_secs <= now:
+                    batches.append((key, *self._take(key, now)))
+                    continue
+                full, length_class = self._full_class(key)
+                if not full:
+                    break
+                batches.append((key, *self._take(key, now, length_class)))
+        if self.free_slots is not None:
+            self.free_slots -= len(batches)
+            while self.free_slots > 0 and len(self):
+                # idle workers, send what the oldest request has so far
+                key = min((key for key, queue in self._queues.items() if queue.size),
+                          key=lambda k: self._queues[k].oldest()[0])
+                batches.append((key, *self._take(key, now)))
+                self.free_slots -= 1
+        for key, queue in self._queues.items():
+            if queue.size:
+                deadline = queue.oldest()[0] + self._limits[key][1]
+                next_deadline = deadline if next_deadline is None else min(next_deadline, deadline)
+        return batches, next_deadline
+
+    async def next_batches(self) -> List[Batch]:
+        """Wait for the next batches that are full or due."""
+        if self._wakeup is None:
+            # created here to belong to the running loop
+            self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            timeout = None
+            if not self.paused:
+                now = self._clock()
+                batches, next_deadline = self._flush(now)
+                if batches:
+                    return batches
+                if next_deadline is not None:
+                    timeout = next_deadline - now
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
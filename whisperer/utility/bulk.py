@@ -0,0 +1,257 @@
+"""Offline bulk transcription of a JSONL manifest.
+
+Every line of the manifest is a request (see :class:`whisperer.utility.data_io.Data`) with an optional ``id``, the
+source of the request by default. Requests are grouped into batches of the same tier and model and handed to
+backends as they become free: ``WhisperServe`` workers, called directly so the load balancer's rate limits do not
+apply, or model replicas in the local process. Faster backends take more batches, so the manifest is spread over
+them in proportion to their speed.
+
+Results are appended to an output JSONL as ``{"id", "source", "result"}`` lines, or ``{"id", "source", "error"}`` for
+the requests that failed. The output is the checkpoint: a job started again with the same output skips the requests
+it already finished and retries the failed ones. Several runners can split one manifest with ``shard``.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterator, List, Set, Tuple
+
+import requests
+
+from whisperer.CONST import INFERENCE_REQUEST_TIMEOUT, MUSE_SYSTEM_PASSWORD
+from whisperer.utility.data_io import Data, sample_error
+from whisperer.utility.serialization import MSGPACK, shape_transcript, unpack
+from whisperer.utility.tiers import resolve_model
+
+Item = Tuple[str, Data]
+
+
+def read_manifest(path: str, shard: Tuple[int, int] = (0, 1)) -> Iterator[Item]:
+    """Yields the ``(id, request)`` pairs of one shard of a manifest, ``shard`` is ``(index, count)``."""
+    index, count = shard
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            fields = json.loads(line)
+            try:
+                data = Data(**fields)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: {e}")
+            item_id = str(fields.get("id") or data.source)
+            if zlib.crc32(item_id.encode("utf-8")) % count == index:
+                yield item_id, data
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """The IDs of the requests an output file already has results for. A line cut short by a crash is removed."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, "rb+") as f:
+        content = f.read()
+        complete = content.rfind(b"\n") + 1
+        if complete < len(content):
+            f.truncate(complete)
+    for line in content[:complete].splitlines():
+        record = json.loads(line)
+        if "result" in record:
+            done.add(record["id"])
+    return done
+
+
+def make_batches(items: List[Item], batch_size: int) -> List[List[Item]]:
+    """Batches of requests of the same tier and model, in manifest order within each group."""
+    groups = defaultdict(list)
+    for item in items:
+        groups[item[1].tier, resolve_model(item[1])].append(item)
+    return [group[i:i + batch_size] for group in groups.values() for i in range(0, len(group), batch_size)]
+
+
+def _audio_secs(result: dict) -> float:
+    segments = result.get("segments") or []
+    return segments[-1]["end"] if segments else 0.0
+
+
+class WorkerBackend:
+    """A ``WhisperServe`` worker, reached over HTTP. It processes as many batches at once as it has replicas."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.name = self.url
+
+    @property
+    def capacity(self) -> int:
+        while True:
+            try:
+                response = requests.get(f"{self.url}/api/ready", timeout=10)
+                if response.ok:
+                    return response.json().get("replicas", 1)
+            except requests.RequestException:
+                pass
+            print(f"waiting for {self.url} to be ready...")
+            time.sleep(5)
+
+    def transcribe(self, batch: List[Data]) -> List[dict]:
+        response = requests.post(f"{self.url}/api/predict",
+                                 json={"batch": [data.dict() for data in batch]},
+                                 headers={"Accept": MSGPACK},
+                                 timeout=INFERENCE_REQUEST_TIMEOUT + 60)
+        response.raise_for_status()
+        if response.headers.get("content-type", "").startswith(MSGPACK):
+            return unpack(response.content)
+        return response.json()
+
+
+class LocalBackend:
+    """Model replicas in this process, the audio of the next batches is fetched while a batch is transcribed."""
+
+    def __init__(self, num_replicas: int = 1, prefetch_workers: int = 4):
+        from whisperer.models import AudioFetcher, AudioPrefetcher, ModelRegistry
+
+        self.name = "local"
+        self.num_replicas = num_replicas
+        fetcher = AudioFetcher()
+        self._prefetcher = AudioPrefetcher(fetcher.load, num_workers=prefetch_workers, queue_depth=2 * num_replicas)
+        self._running = threading.Semaphore(num_replicas)
+        if num_replicas > 1:
+            from whisperer.models import ReplicaPool
+
+            self._models = ReplicaPool(num_replicas)
+            self._models.start()
+        else:
+            self._models = ModelRegistry(fetcher=fetcher)
+            self._models.get().warmup()
+
+    @property
+    def capacity(self) -> int:
+        # one batch downloading per replica while the other one is transcribed
+        return 2 * self.num_replicas
+
+    def transcribe(self, batch: List[Data]) -> List[dict]:
+        audios = self._prefetcher.submit(batch)
+        audios = self._prefetcher.collect(audios)
+        # requests whose audio could not be loaded fail on their own, like on a worker
+        loaded = [i for i, audio in enumerate(audios) if not isinstance(audio, Exception)]
+        results = [sample_error(audio) if isinstance(audio, Exception) else None for audio in audios]
+        if loaded:
+            with self._running:
+                transcripts = self._models.transcribe([batch[i] for i in loaded], [audios[i] for i in loaded])
+            for i, result in zip(loaded, transcripts):
+                results[i] = {source: shape_transcript(transcript, batch[i].response)
+                              for source, transcript in result.items()}
+        return results
+
+
+def discover_workers(load_balancer_url: str) -> List[str]:
+    """The worker URLs a load balancer knows about, from its password protected ``/system/info``."""
+    response = requests.get(f"{load_balancer_url.rstrip('/')}/system/info",
+                            auth=("lightning", MUSE_SYSTEM_PASSWORD.decode("utf-8")),
+                            timeout=10)
+    response.raise_for_status()
+    return response.json()["servers"]
+
+
+class BulkJob:
+    """Transcribes the requests of a manifest on a set of backends and writes the results to an output JSONL.
+
+    Args:
+        items: The ``(id, request)`` pairs to transcribe, see :func:`read_manifest`.
+        output: Path of the output JSONL, requests that already have a result in it are skipped.
+        backends: :class:`WorkerBackend` or :class:`LocalBackend` instances.
+        batch_size: Number of requests sent to a backend at once.
+        report_secs: Interval of the progress reports.
+    """
+
+    def __init__(self, items: List[Item], output: str, backends: List, batch_size: int = 8, report_secs: float = 30):
+        done = load_checkpoint(output)
+        self.skipped = sum(1 for item_id, _ in items if item_id in done)
+        self.pending = [(item_id, data) for item_id, data in items if item_id not in done]
+        self.output = output
+        self.backends = backends
+        self.batch_size = batch_size
+        self.report_secs = report_secs
+        self.stats: Dict[str, float] = {"done": 0, "failed": 0, "audio_secs": 0.0}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _write(self, records: List[dict], audio_secs: float = 0.0, failed: int = 0):
+        with self._lock:
+            for record in records:
+                self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.stats["done"] += len(records)
+            self.stats["failed"] += failed
+            self.stats["audio_secs"] += audio_secs
+
+    def _run_batch(self, backend, batch: List[Item]):
+        try:
+            results = backend.transcribe([data for _, data in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # one bad request fails its whole batch, find it by sending them one by one
+                for item in batch:
+                    self._run_batch(backend, [item])
+                return
+            item_id, data = batch[0]
+            print(f"{item_id} failed on {backend.name}: {e}")
+            self._write([{"id": item_id, "source": data.source, "error": str(e)}], failed=1)
+            return
+
+        records, audio_secs, failed = [], 0.0, 0
+        for (item_id, data), result in zip(batch, results):
+            if isinstance(result.get("error"), str):
+                # failed on its own, see `sample_error`
+                print(f"{item_id} failed on {backend.name}: {result['error']}")
+                records.append({"id": item_id, "source": data.source, "error": result["error"]})
+                failed += 1
+                continue
+            transcript = next(iter(result.values()))
+            audio_secs += _audio_secs(transcript)
+            records.append({"id": item_id, "source": data.source, "result": transcript})
+        self._write(records, audio_secs, failed)
+
+    def _serve(self, backend, batches: queue.Queue):
+        while True:
+            try:
+                batch = batches.get_nowait()
+            except queue.Empty:
+                return
+            self._run_batch(backend, batch)
+
+    def report(self, start_time: float):
+        elapsed = time.time() - start_time
+        total = len(self.pending)
+        with self._lock:
+            done, failed, audio_secs = self.stats["done"], self.stats["failed"], self.stats["audio_secs"]
+        rate = done / elapsed if elapsed else 0.0
+        eta = (total - done) / rate if rate else float("inf")
+        print(f"{done}/{total} done ({failed} failed, {self.skipped} from a previous run), {rate:.2f} requests/s,"
+              f" {audio_secs / elapsed if elapsed else 0:.1f} audio-s/s, ETA {eta / 60:.1f} min")
+
+    def run(self) -> Dict[str, float]:
+        batches = queue.Queue()
+        for batch in make_batches(self.pending, self.batch_size):
+            batches.put(batch)
+
+        start_time = time.time()
+        with open(self.output, "a") as self._file:
+            threads = [
+                threading.Thread(target=self._serve, args=(backend, batches), name=f"bulk-{backend.name}-{i}")
+                for backend in self.backends for i in range(backend.capacity)
+            ]
+            for thread in threads:
+                thread.start()
+            next_report = start_time + self.report_secs
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=max(0.0, next_report - time.time()))
+                    if time.time() >= next_report:
+                        self.report(start_time)
+                        next_report += self.report_secs
+        self.report(start_time)
+        return dict(self.stats, seconds=time.time() - start_time)
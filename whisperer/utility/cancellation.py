@@ -0,0 +1,35 @@
+import threading
+import time
+from typing import Optional
+
+
+class RequestCancelled(Exception):
+    """Raised inside the work of a request that its caller abandoned."""
+
+
+class CancelToken:
+    """Cooperative cancellation of the work of one request.
+
+    The work calls :meth:`check` between its stages, so an abandoned request stops at the next check instead of
+    holding the worker until it completes.
+
+    Args:
+        deadline: ``time.time()`` after which the token counts as cancelled without an explicit :meth:`cancel`.
+        event: The flag behind :meth:`cancel`, pass a ``multiprocessing.Manager().Event()`` to share the token with
+            other processes.
+    """
+
+    def __init__(self, deadline: Optional[float] = None, event=None):
+        self.deadline = deadline
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return (self.deadline is not None and time.time() > self.deadline) or self._event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise RequestCancelled()
@@ -8,7 +8,11 @@ from typing import Any, List, Optional
 import numpy as np
 from fastapi import HTTPException
 from lightning_app.storage.drive import Drive
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, StrictBytes, root_validator, validator
+
+from whisperer.CONST import WHISPER_MODELS
+from whisperer.utility.serialization import RESPONSE_PROFILES
+from whisperer.utility.tiers import DEFAULT_TIER, SERVICE_TIERS
 
 OPEN_PROMPTS = None
 
@@ -91,8 +95,62 @@ class LimitBacklogException(HTTPException):
         super().__init__(status_code=status_code, detail=detail, *args, **kwargs)
 
 
+def sample_error(error: Exception) -> dict:
+    """The result of a sample that failed on its own, in place of its ``{source: result}``. Bad requests fail with
+    400, anything else with 500."""
+    return {"error": str(error), "status": 400 if isinstance(error, ValueError) else 500}
+
+
+def ndjson_event(event: str, data: Any) -> bytes:
+    """One line of the newline-delimited JSON stream sent by the streaming endpoints."""
+    return (json.dumps({"event": event, "data": data}) + "\n").encode("utf-8")
+
+
 class Data(BaseModel):
-    video_url: str
+    """One request. The audio comes from exactly one of a YouTube ``video_url``, a file ``audio_path`` under the
+    ``LOCAL_AUDIO_DIR`` of the workers or ``audio_data``, an uploaded audio file encoded as base64. ``response`` is
+    one of the profiles of :mod:`whisperer.utility.serialization`.
+
+    ``audio_bytes`` carries the raw bytes of a file uploaded to the load balancer on to the workers in msgpack
+    batches, JSON requests cannot set it."""
+    video_url: Optional[str] = None
+    audio_path: Optional[str] = None
+    audio_data: Optional[str] = Field(None, repr=False)
+    audio_bytes: Optional[StrictBytes] = Field(None, repr=False)
+    model: Optional[str] = None
+    tier: str = DEFAULT_TIER
+    response: str = "full"
+
+    @property
+    def source(self) -> str:
+        """The key of the result of the request."""
+        return self.video_url or self.audio_path or "upload"
+
+    @root_validator(skip_on_failure=True)
+    def check_source(cls, values):
+        sources = [name for name in ("video_url", "audio_path", "audio_data", "audio_bytes")
+                   if values.get(name) is not None]
+        if len(sources) != 1:
+            raise ValueError("send exactly one of video_url, audio_path or audio_data")
+        return values
+
+    @validator("model")
+    def check_model(cls, model):
+        if model is not None and model not in WHISPER_MODELS:
+            raise ValueError(f"choose one of {WHISPER_MODELS}")
+        return model
+
+    @validator("tier")
+    def check_tier(cls, tier):
+        if tier not in SERVICE_TIERS:
+            raise ValueError(f"choose one of {list(SERVICE_TIERS)}")
+        return tier
+
+    @validator("response")
+    def check_response(cls, response):
+        if response not in RESPONSE_PROFILES:
+            raise ValueError(f"choose one of {list(RESPONSE_PROFILES)}")
+        return response
 
 
 class DataBatch(BaseModel):
@@ -101,6 +159,7 @@ class DataBatch(BaseModel):
 
 class SysInfo(BaseModel):
     num_workers: int
+    capacity: int = 0
     servers: List[str]
     num_requests: int
     process_time: int
@@ -6,6 +6,23 @@ from fastapi import HTTPException
 
 from whisperer.utility.data_io import TimeoutException
 
+# answers of the cloud proxy in front of a worker that is down or restarting
+WORKER_DOWN_STATUSES = (502, 503, 504)
+
+
+def is_worker_failure(exception: Exception) -> bool:
+    """Whether a request to a worker failed because of the worker rather than the request, so another worker could
+    answer it."""
+    if isinstance(exception, aiohttp.client_exceptions.ClientResponseError):
+        return exception.status in WORKER_DOWN_STATUSES
+    return isinstance(exception, aiohttp.client_exceptions.ClientConnectionError)
+
+
+def is_unreachable(exception: Exception) -> bool:
+    """Whether a worker could not be connected to at all. A dropped connection is not proof enough, a worker also
+    drops idle keep-alive connections."""
+    return isinstance(exception, aiohttp.client_exceptions.ClientConnectorError)
+
 
 def raise_granular_exception(exception: Exception):
     """handle the exceptions coming from hitting the model servers."""
@@ -18,6 +35,10 @@ def raise_granular_exception(exception: Exception):
     if isinstance(exception, aiohttp.client_exceptions.ServerDisconnectedError):
         raise HTTPException(500, "Worker Server Disconnected")
 
+    if isinstance(exception, aiohttp.client_exceptions.ClientResponseError) and exception.status < 500:
+        # the worker refused the request, nothing failed on its side
+        raise HTTPException(exception.status, "The worker rejected the request.")
+
     if isinstance(exception, aiohttp.client_exceptions.ClientError):
         logging.exception(exception)
         raise HTTPException(500, "Worker Server error")
@@ -0,0 +1,60 @@
+"""Circuit breakers that take failing workers out of the rotation of the LoadBalancer.
+
+A breaker opens when a worker refuses connections, or after ``failure_threshold`` failures in a row of its
+health probes and batches, and the worker stops receiving batches right away. Once ``reset_secs`` have passed, the
+next successful probe closes it again, the LoadBalancer probes the readiness of workers with an open breaker. A
+worker that fails again soon after stays out twice as long each time, up to ``max_reset_secs``, until a batch
+succeeds on it.
+"""
+import time
+from typing import Callable
+
+
+class CircuitBreaker:
+    """The circuit breaker of one worker, see :meth:`record_success` and :meth:`record_failure`.
+
+    Args:
+        failure_threshold: Failures in a row that open the breaker.
+        reset_secs: Time the breaker stays open before a successful probe may close it.
+        max_reset_secs: Longest time the breaker stays open when the worker keeps failing.
+        clock: Time source, a simulated clock for tests.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_secs: float = 5.0, max_reset_secs: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_secs = reset_secs
+        self.max_reset_secs = max_reset_secs
+        self.is_open = False
+        self.failures = 0
+        self._clock = clock
+        self._open_until = 0.0
+        self._next_reset_secs = reset_secs
+
+    def record_success(self, probe: bool = False) -> bool:
+        """Record a successful health probe or batch, returns whether the breaker closed."""
+        if self.is_open:
+            if not probe or self._clock() < self._open_until:
+                # answers to batches sent before the breaker opened prove little
+                return False
+            self.is_open = False
+            self.failures = 0
+            return True
+        self.failures = 0
+        if not probe:
+            self._next_reset_secs = self.reset_secs
+        return False
+
+    def record_failure(self, unreachable: bool = False) -> bool:
+        """Record a failed health probe or batch, returns whether the breaker opened."""
+        self.failures += 1
+        if self.is_open:
+            # still failing, wait for a full reset period from now
+            self._open_until = self._clock() + self._next_reset_secs
+            return False
+        if not unreachable and self.failures < self.failure_threshold:
+            return False
+        self.is_open = True
+        self._open_until = self._clock() + self._next_reset_secs
+        self._next_reset_secs = min(2 * self._next_reset_secs, self.max_reset_secs)
+        return True
@@ -0,0 +1,48 @@
+"""Prometheus metrics exposed next to the request metrics of ``starlette_exporter`` on ``/metrics``."""
+from prometheus_client import Counter, Gauge, Histogram
+
+TRANSCRIPT_CACHE_HITS = Counter("muse_transcript_cache_hits_total", "Transcript cache hits.", ["tier"])
+TRANSCRIPT_CACHE_MISSES = Counter("muse_transcript_cache_misses_total", "Transcript cache misses.")
+TRANSCRIPT_CACHE_EVICTIONS = Counter("muse_transcript_cache_evictions_total", "Transcript cache evictions.", ["tier"])
+TRANSCRIPT_CACHE_WRITE_ERRORS = Counter("muse_transcript_cache_write_errors_total",
+                                        "Transcripts that could not be written to the on-disk cache.")
+
+_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+STREAM_TIME_TO_FIRST_SEGMENT = Histogram("muse_stream_time_to_first_segment_seconds",
+                                         "Time from a streaming request to its first transcribed segment.",
+                                         buckets=_LATENCY_BUCKETS)
+STREAM_LATENCY = Histogram("muse_stream_latency_seconds", "Total latency of streaming requests.",
+                           buckets=_LATENCY_BUCKETS)
+
+STARTUP_PHASE_SECONDS = Gauge("muse_startup_phase_seconds", "Duration of the startup phases of a worker.", ["phase"])
+
+CANCELLED_REQUESTS = Counter("muse_cancelled_requests_total", "Requests abandoned by their caller.")
+WASTED_COMPUTE_SECONDS = Counter("muse_wasted_compute_seconds_total",
+                                 "Time spent on requests abandoned by their caller.", ["stage"])
+
+_BYTES_BUCKETS = (1e3, 4e3, 16e3, 64e3, 256e3, 1e6, 4e6, 16e6)
+_CPU_BUCKETS = (1e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5)
+
+RESPONSE_BYTES = Histogram("muse_response_bytes", "Size of the result bodies, from the workers and to the clients.",
+                           ["hop", "encoding"], buckets=_BYTES_BUCKETS)
+SERIALIZATION_CPU_SECONDS = Histogram("muse_serialization_cpu_seconds",
+                                      "CPU time the load balancer spends decoding and encoding one result body.",
+                                      ["stage"], buckets=_CPU_BUCKETS)
+
+_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+BATCH_QUEUE_WAIT = Histogram("muse_batch_queue_wait_seconds",
+                             "Time requests wait in the load balancer for their batch to be sent.", ["tier"],
+                             buckets=_WAIT_BUCKETS)
+
+BATCH_RETRIES = Counter("muse_batch_retries_total", "Batches sent again to another worker after theirs failed.")
+WORKER_FAILURES = Counter("muse_worker_failures_total", "Failed health probes and batches of the workers.", ["kind"])
+OPEN_CIRCUITS = Gauge("muse_open_circuits", "Workers taken out of the rotation by their circuit breaker.")
+
+COALESCED_REQUESTS = Counter("muse_coalesced_requests_total",
+                             "Requests that waited for an identical request in progress instead of queueing.",
+                             ["tier"])
+
+REQUEST_LATENCY = Histogram("muse_request_latency_seconds", "Latency of transcription requests per service tier.",
+                            ["tier"], buckets=_LATENCY_BUCKETS)
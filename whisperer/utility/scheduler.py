@@ -0,0 +1,118 @@
+"""Least-outstanding-work scheduling of batches over the workers.
+
+Every batch sent to a worker is tracked until it is answered, with the seconds of audio it carries. The work a
+worker has left is the audio of its batches in flight, less what it has probably transcribed since each of them was
+sent, at the speed its previous batches went at. A new batch goes to the worker with a free model replica and the
+least work left, or else to the worker with the least work left per replica, so a worker stuck on a long video
+stops receiving batches while the others are idle. Workers with the same load, e.g. all idle, take turns.
+
+With ``choices`` set, only that many workers picked at random are compared (``choices=2`` is the power of two
+choices), which keeps load balancers that share workers from all sending their next batch to the same idle worker.
+"""
+import itertools
+import random
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# weight of the newest batch in the running estimates
+_SMOOTHING = 0.2
+
+
+class WorkerScheduler:
+    """Picks the worker for every batch, see :meth:`pick`, :meth:`start` and :meth:`finish`.
+
+    Args:
+        choices: Number of workers compared for every batch, ``0`` to compare all of them.
+        default_audio_secs: Length assumed for requests of unknown length until lengths have been seen.
+        clock: Time source, a simulated clock for tests.
+    """
+
+    def __init__(self, choices: int = 0, default_audio_secs: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic, rng: Optional[random.Random] = None):
+        self.choices = choices
+        self.typical_audio_secs = default_audio_secs
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._capacity: Dict[str, int] = {}  # {server: number of batches it processes at once}
+        self._inflight: Dict[str, Dict[int, Tuple[float, float]]] = {}  # {server: {ticket: (sent_at, audio_secs)}}
+        self._speed: Dict[str, float] = {}  # {server: seconds of audio transcribed per second, per batch}
+        self._tickets = itertools.count()
+        self._turn = 0
+
+    def set_servers(self, capacity: Dict[str, int]):
+        """The workers that take batches, with their number of model replicas."""
+        self._capacity = {server: max(1, replicas) for server, replicas in capacity.items()}
+        for server in self._capacity:
+            self._inflight.setdefault(server, {})
+        # answers of removed workers can still come in, their batches are forgotten then
+        for server in [server for server, batches in self._inflight.items()
+                       if server not in self._capacity and not batches]:
+            del self._inflight[server]
+
+    @property
+    def servers(self) -> List[str]:
+        return list(self._capacity)
+
+    def audio_secs(self, durations: List[Optional[float]]) -> float:
+        """The audio of a batch, requests of unknown length count as long as the typical request."""
+        return sum(self.typical_audio_secs if duration is None else duration for duration in durations)
+
+    def outstanding(self, server: str) -> float:
+        """Estimated seconds of audio a worker has left to transcribe."""
+        now = self._clock()
+        speed = self._speed.get(server)
+        remaining = 0.0
+        for sent_at, audio_secs in self._inflight.get(server, {}).values():
+            if speed is None:
+                remaining += audio_secs
+            else:
+                # a batch that takes longer than expected still counts for a bit
+                remaining += max(audio_secs - (now - sent_at) * speed, 0.1 * audio_secs)
+        return remaining
+
+    def load(self, server: str) -> Tuple[float, float, float]:
+        """How long a new batch would wait for a replica, then the work left and the batches in flight per replica.
+
+        A batch starts right away on a worker with a free replica, whatever the other replicas are busy with.
+        Otherwise it waits for the work left, spread over the replicas. Batches in flight settle ties when no
+        lengths are known.
+        """
+        capacity = self._capacity.get(server, 1)
+        inflight = len(self._inflight.get(server, {}))
+        work = self.outstanding(server) / capacity
+        return (0.0 if inflight < capacity else work), work, inflight / capacity
+
+    def pick(self, exclude: Iterable[str] = ()) -> str:
+        """The worker the next batch should go to, other than the ``exclude`` ones, e.g. where it failed before."""
+        exclude = set(exclude)
+        servers = [server for server in self._capacity if server not in exclude]
+        if not servers:
+            raise RuntimeError("There are no healthy workers to send the request to.")
+        if 0 < self.choices < len(servers):
+            servers = self._rng.sample(servers, self.choices)
+        else:
+            # rotate so that ties go to every worker in turn
+            self._turn = (self._turn + 1) % len(servers)
+            servers = servers[self._turn:] + servers[:self._turn]
+        return min(servers, key=self.load)
+
+    def start(self, server: str, durations: List[Optional[float]]) -> int:
+        """Record a batch sent to ``server`` with requests of the given lengths, ``None`` if unknown."""
+        known = [duration for duration in durations if duration is not None]
+        if known:
+            self.typical_audio_secs += _SMOOTHING * (sum(known) / len(known) - self.typical_audio_secs)
+        ticket = next(self._tickets)
+        self._inflight.setdefault(server, {})[ticket] = (self._clock(), self.audio_secs(durations))
+        return ticket
+
+    def finish(self, server: str, ticket: int, succeeded: bool = True):
+        """Record the answer to a batch, successful ones update the speed of the worker."""
+        batches = self._inflight.get(server, {})
+        sent_at, audio_secs = batches.pop(ticket, (None, None))
+        if server not in self._capacity and not batches:
+            self._inflight.pop(server, None)
+        elapsed = None if sent_at is None else self._clock() - sent_at
+        if succeeded and elapsed and audio_secs:
+            speed = audio_secs / elapsed
+            previous = self._speed.get(server)
+            self._speed[server] = speed if previous is None else previous + _SMOOTHING * (speed - previous)
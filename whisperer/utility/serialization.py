@@ -0,0 +1,51 @@
+"""Wire formats of transcription results.
+
+Results travel from WhisperServe to the LoadBalancer as msgpack when the LoadBalancer asks for it, which is smaller
+than JSON and parsed without Python-level work per token. Clients choose how much of a transcript they get back with
+the ``response`` profile of their request:
+
+* ``full``: everything Whisper returns, token IDs and decoding statistics of every segment included.
+* ``segments``: the text, the language and the ``id``, ``start``, ``end`` and ``text`` of every segment.
+* ``text``: the text and the language only.
+
+Responses to clients stay JSON, gzip-compressed when the client accepts it and they are over ``GZIP_MIN_BYTES``.
+"""
+import gzip
+import json
+from typing import Any, Tuple
+
+import msgpack
+
+from whisperer.CONST import GZIP_MIN_BYTES
+
+MSGPACK = "application/msgpack"
+RESPONSE_PROFILES = ("full", "segments", "text")
+_SEGMENT_KEYS = ("id", "start", "end", "text")
+
+
+def shape_transcript(transcript: dict, profile: str) -> dict:
+    """Drop the parts of a full transcript that the ``profile`` does not include."""
+    if profile == "full":
+        return transcript
+    shaped = {"text": transcript["text"], "language": transcript["language"]}
+    if profile == "segments":
+        shaped["segments"] = [{key: segment[key] for key in _SEGMENT_KEYS} for segment in transcript["segments"]]
+    return shaped
+
+
+def pack(content: Any) -> bytes:
+    return msgpack.packb(content, use_bin_type=True)
+
+
+def unpack(body: bytes) -> Any:
+    return msgpack.unpackb(body, raw=False)
+
+
+def encode_json(content: Any, accept_gzip: bool = False, gzip_min_bytes: int = GZIP_MIN_BYTES) -> Tuple[bytes, dict]:
+    """Returns the body and the extra headers of a JSON response. Compression is off when ``gzip_min_bytes`` is 0."""
+    body = json.dumps(content, separators=(",", ":")).encode("utf-8")
+    headers = {"Vary": "Accept-Encoding"}
+    if accept_gzip and 0 < gzip_min_bytes <= len(body):
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
@@ -0,0 +1,30 @@
+"""Service tiers, each one with its own decode profile and batching.
+
+``high`` is for interactive use: greedy decoding in small batches that are sent quickly. ``low`` is for quality:
+beam search on a larger checkpoint, in batches that may wait for more requests. Both tiers run in their own batch
+queues, so interactive requests never wait behind beam-search batches.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from whisperer.CONST import HIGH_TIER_MODEL, LOW_TIER_MODEL, WHISPER_MODEL
+
+
+@dataclass(frozen=True)
+class ServiceTier:
+    model: Optional[str] = None  # checkpoint of the requests that do not ask for one, WHISPER_MODEL when None
+    beam_size: Optional[int] = None  # greedy decoding when None
+    max_batch_size: Optional[int] = None  # the LoadBalancer's max_batch_size when None
+    batch_timeout_secs: Optional[float] = None  # the LoadBalancer's batch_timeout_secs when None
+
+
+SERVICE_TIERS = {
+    "high": ServiceTier(model=HIGH_TIER_MODEL, batch_timeout_secs=1.0),
+    "low": ServiceTier(model=LOW_TIER_MODEL, beam_size=5),
+}
+DEFAULT_TIER = "high"
+
+
+def resolve_model(data) -> str:
+    """The checkpoint a request runs on: its own choice, else the one of its tier."""
+    return data.model or SERVICE_TIERS[data.tier].model or WHISPER_MODEL
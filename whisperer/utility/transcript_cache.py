@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from whisperer.utility.metrics import (
+    TRANSCRIPT_CACHE_EVICTIONS,
+    TRANSCRIPT_CACHE_HITS,
+    TRANSCRIPT_CACHE_MISSES,
+    TRANSCRIPT_CACHE_WRITE_ERRORS,
+)
+
+
+def cache_key(source_id: str, model: str, options: dict) -> str:
+    """Content address of a transcript: the normalised source, the model and the decoding options."""
+    payload = json.dumps({"source": source_id, "model": model, "options": options}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranscriptCache:
+    """Two-tier transcript cache.
+
+    Transcripts are kept in an in-memory LRU of at most ``max_items`` entries and written through to one JSON file
+    per key in ``directory``. Disk entries expire after ``ttl_secs`` and the oldest ones are evicted once there are
+    more than ``max_disk_items`` of them. The methods block on disk I/O, call them from an executor in async code. A
+    transcript that cannot be written to disk stays in memory only.
+
+    Args:
+        max_items: Number of transcripts kept in memory.
+        directory: Folder of the on-disk tier, ``None`` disables it.
+        ttl_secs: Lifetime of the on-disk entries.
+        max_disk_items: Number of transcripts kept on disk.
+    """
+
+    def __init__(self, max_items: int = 1024, directory: Optional[str] = None, ttl_secs: float = 7 * 24 * 3600,
+                 max_disk_items: int = 100_000):
+        self.max_items = max_items
+        self.directory = directory
+        self.ttl_secs = ttl_secs
+        self.max_disk_items = max_disk_items
+        self._memory = OrderedDict()
+        self._disk_index = OrderedDict()  # {key: write time}, oldest first
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load_disk_index()
+
+    def get(self, key: str, *fallback_keys: str) -> Optional[Any]:
+        """The value of ``key``, or else of the first of ``fallback_keys`` in the cache. The lookup counts as a single
+        hit or miss."""
+        keys = (key, *fallback_keys)
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    TRANSCRIPT_CACHE_HITS.labels("memory").inc()
+                    return self._memory[key]
+
+        for key in keys:
+            value = self._read_disk(key)
+            if value is not None:
+                TRANSCRIPT_CACHE_HITS.labels("disk").inc()
+                self._put_memory(key, value)
+                return value
+
+        TRANSCRIPT_CACHE_MISSES.inc()
+        return None
+
+    def put(self, key: str, value: Any):
+        self._put_memory(key, value)
+        self._write_disk(key, value)
+
+    def _put_memory(self, key: str, value: Any):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+                TRANSCRIPT_CACHE_EVICTIONS.labels("memory").inc()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Any]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_secs:
+                with self._lock:
+                    self._disk_index.pop(key, None)
+                self._remove(path)
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, value: Any):
+        if not self.directory:
+            return
+        # write to a temporary file first, so readers never see a partial transcript
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            # a full or read-only disk must not fail the request that produced the transcript
+            logging.warning(f"Could not write the transcript {key} to the cache: {e!r}")
+            TRANSCRIPT_CACHE_WRITE_ERRORS.inc()
+            self._remove_tmp(tmp_path)
+            return
+
+        now = time.time()
+        with self._lock:
+            self._disk_index[key] = now
+            self._disk_index.move_to_end(key)
+            expired = []
+            while self._disk_index:
+                oldest, written_at = next(iter(self._disk_index.items()))
+                if len(self._disk_index) <= self.max_disk_items and now - written_at <= self.ttl_secs:
+                    break
+                del self._disk_index[oldest]
+                expired.append(oldest)
+
+        for oldest in expired:
+            self._remove(self._path(oldest))
+
+    def _load_disk_index(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    entries.append((entry.stat().st_mtime, entry.name[:-len(".json")]))
+        self._disk_index.update((key, mtime) for mtime, key in sorted(entries))
+
+    @staticmethod
+    def _remove_tmp(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+            TRANSCRIPT_CACHE_EVICTIONS.labels("disk").inc()
+        except OSError:
+            pass
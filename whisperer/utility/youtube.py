@@ -0,0 +1,149 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict
+from urllib.parse import parse_qs, urlparse
+
+from whisperer.CONST import YOUTUBE_METADATA_TTL, YOUTUBE_STUB_FILE
+
+_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_PATH_PREFIXES = ("/shorts/", "/embed/", "/live/", "/v/")
+
+
+def extract_video_id(url: str) -> str:
+    """Normalise the different YouTube URL flavours (``watch?v=``, ``youtu.be``, shorts, embeds, ...) to the
+    11-character video ID.
+
+    URLs that do not look like a YouTube video are returned unchanged, so they still make a stable key.
+    """
+    url = url.strip()
+    if _VIDEO_ID.match(url):
+        return url
+
+    parsed = urlparse(url if "//" in url else f"//{url}")
+    host = parsed.netloc.lower().split(":")[0]
+    candidate = None
+    if host.endswith("youtu.be"):
+        candidate = parsed.path.lstrip("/").split("/")[0]
+    elif host.endswith("youtube.com") or host.endswith("youtube-nocookie.com"):
+        candidate = parse_qs(parsed.query).get("v", [None])[0]
+        for prefix in _PATH_PREFIXES:
+            if candidate is None and parsed.path.startswith(prefix):
+                candidate = parsed.path[len(prefix):].split("/")[0]
+
+    if candidate and _VIDEO_ID.match(candidate):
+        return candidate
+    return url
+
+
+@dataclass
+class VideoMetadata:
+    video_id: str
+    duration: float
+    audio_url: str
+
+
+def check_duration(metadata: VideoMetadata, max_audio_secs: float):
+    if metadata.duration > max_audio_secs:
+        raise ValueError(f"Please find a YouTube video shorter than {max_audio_secs / 60:g} minutes."
+                         " Sorry about this, the server capacity is limited"
+                         " for the time being.")
+
+
+def fetch_youtube_metadata(video_id: str) -> VideoMetadata:
+    """Scrape the duration and the URL of the highest bitrate audio-only stream of a video."""
+    from pytube import YouTube
+
+    yt = YouTube(f"https://www.youtube.com/watch?v={video_id}")
+    stream = yt.streams.filter(only_audio=True).order_by("abr").desc().first()
+    if stream is None:
+        raise ValueError(f"The video {video_id} has no audio stream.")
+    return VideoMetadata(video_id=video_id, duration=float(yt.length), audio_url=stream.url)
+
+
+class StubMetadataFetcher:
+    """Offline stand-in for :func:`fetch_youtube_metadata`, reading the metadata from a JSON file of the form
+    ``{"<video_id>": {"duration": 212, "audio_url": "/data/audio.mp3"}}``. ``audio_url`` may be a local path."""
+
+    def __init__(self, path: str):
+        with open(path) as f:
+            self.videos = json.load(f)
+
+    def __call__(self, video_id: str) -> VideoMetadata:
+        if video_id not in self.videos:
+            raise ValueError(f"The video {video_id} is unavailable.")
+        return VideoMetadata(video_id=video_id, **self.videos[video_id])
+
+
+class MetadataResolver:
+    """Resolves video metadata with a TTL cache. Concurrent lookups of the same video share a single fetch.
+
+    Args:
+        fetch: Callable turning a video ID into :class:`VideoMetadata`.
+        ttl_secs: How long resolved metadata is reused. Audio stream URLs expire after a few hours.
+        max_items: Number of videos kept in the cache.
+        max_workers: Number of concurrent fetches.
+    """
+
+    def __init__(self, fetch: Callable[[str], VideoMetadata] = fetch_youtube_metadata, ttl_secs: float = 3600,
+                 max_items: int = 4096, max_workers: int = 8):
+        self.fetch = fetch
+        self.ttl_secs = ttl_secs
+        self.max_items = max_items
+        self._cache = OrderedDict()  # {video_id: (expiry, metadata)}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="youtube-metadata")
+
+    def resolve(self, url: str) -> VideoMetadata:
+        return self._lookup(extract_video_id(url)).result()
+
+    async def resolve_async(self, url: str) -> VideoMetadata:
+        # shielded, a cancelled caller must not cancel the fetch shared with other callers
+        return await asyncio.shield(asyncio.wrap_future(self._lookup(extract_video_id(url))))
+
+    def _lookup(self, video_id: str) -> Future:
+        with self._lock:
+            if video_id in self._cache:
+                expiry, metadata = self._cache[video_id]
+                if time.monotonic() < expiry:
+                    self._cache.move_to_end(video_id)
+                    future = Future()
+                    future.set_result(metadata)
+                    return future
+                del self._cache[video_id]
+
+            if video_id in self._inflight:
+                return self._inflight[video_id]
+            future = self._inflight[video_id] = Future()
+
+        self._pool.submit(self._fetch, video_id, future)
+        return future
+
+    def _fetch(self, video_id: str, future: Future):
+        try:
+            metadata = self.fetch(video_id)
+        except Exception as e:
+            # failures are not cached, the next lookup tries again
+            with self._lock:
+                del self._inflight[video_id]
+            future.set_exception(e)
+            return
+
+        with self._lock:
+            del self._inflight[video_id]
+            self._cache[video_id] = (time.monotonic() + self.ttl_secs, metadata)
+            while len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+        future.set_result(metadata)
+
+
+def default_resolver() -> MetadataResolver:
+    """The resolver configured by the environment, backed by the offline stub when ``YOUTUBE_STUB_FILE`` is set."""
+    fetch = StubMetadataFetcher(YOUTUBE_STUB_FILE) if YOUTUBE_STUB_FILE else fetch_youtube_metadata
+    return MetadataResolver(fetch, ttl_secs=YOUTUBE_METADATA_TTL)